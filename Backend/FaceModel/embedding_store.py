@@ -0,0 +1,294 @@
+"""
+Persistent face-embedding store for a face_db folder.
+
+DeepFace.find() and DeepFace.represent(db_path=...) work over the whole
+folder each time. EmbeddingStore keeps one embedding per image in
+<db_path>/.embeddings/<model>.npy (opened as a memmap) with a JSON index of
+path, mtime, size and SHA-1 per image. sync() embeds only images that are
+new or whose contents changed (a touched but identical file is recognised
+by its hash), and drops deleted ones. Matching is a single matrix-vector
+product over L2-normalised rows.
+
+    python embedding_store.py --benchmark 10000
+"""
+
+import hashlib
+import json
+import os
+import time
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+# DeepFace's cosine-distance thresholds for a match, per model
+COSINE_THRESHOLDS = {
+    'VGG-Face': 0.68,
+    'Facenet': 0.40,
+    'Facenet512': 0.30,
+    'ArcFace': 0.68,
+    'Dlib': 0.07,
+    'SFace': 0.593,
+    'OpenFace': 0.10,
+    'DeepFace': 0.23,
+    'DeepID': 0.015,
+}
+DEFAULT_THRESHOLD = 0.40
+
+
+def normalize(vectors):
+    """L2-normalise a vector or the rows of a matrix (as float32)"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def cosine_distance(a, b):
+    """1 - cosine similarity of two embeddings"""
+    a, b = normalize(a), normalize(b)
+    return float(1.0 - np.dot(a, b))
+
+
+def represent(img, model_name="VGG-Face", detector_backend="opencv", enforce_detection=False):
+    """
+    Embedding of the first face in img (a path or a BGR frame).
+
+    Returns:
+        np.ndarray: L2-normalised float32 embedding
+    """
+    from deepface import DeepFace
+
+    result = DeepFace.represent(img_path=img, model_name=model_name,
+                                detector_backend=detector_backend, enforce_detection=enforce_detection)
+    if isinstance(result, list):
+        if not result:
+            raise ValueError("No face found")
+        result = result[0]
+    return normalize(result['embedding'])
+
+
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class EmbeddingStore:
+    def __init__(self, db_path="face_db", model_name="VGG-Face", detector_backend="opencv"):
+        """
+        Args:
+            db_path (str): Folder of face images (the DeepFace db_path)
+            model_name (str): DeepFace model used for embeddings
+            detector_backend (str): DeepFace face detector
+        """
+        self.db_path = db_path
+        self.model_name = model_name
+        self.detector_backend = detector_backend
+        self.store_dir = os.path.join(db_path, ".embeddings")
+        self.matrix_path = os.path.join(self.store_dir, f"{model_name}.npy")
+        self.index_path = os.path.join(self.store_dir, f"{model_name}.json")
+
+        # entries: {'path', 'mtime', 'size', 'sha1', 'row'}; row is None for images without an embedding
+        self.entries = []
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self._paths = []
+
+    def load(self):
+        """Read the stored index and embeddings; returns the number of embeddings"""
+        if not (os.path.exists(self.index_path) and os.path.exists(self.matrix_path)):
+            return 0
+        with open(self.index_path) as f:
+            index = json.load(f)
+        if index.get('model') != self.model_name or index.get('detector_backend') != self.detector_backend:
+            return 0
+        entries = index.get('entries', [])
+        matrix = np.load(self.matrix_path, mmap_mode='r')
+        rows = [entry['row'] for entry in entries if entry['row'] is not None]
+        if len(set(rows)) != len(rows) or any(row >= len(matrix) for row in rows):
+            print(f"⚠️ Face embedding index doesn't match {self.matrix_path}, re-embedding")
+            return 0
+        self.entries = entries
+        self.matrix = matrix
+        self._index_rows()
+        return len(self)
+
+    def sync(self, embed=None):
+        """
+        Bring the store up to date with the image folder.
+
+        Args:
+            embed (callable): path -> embedding (defaults to represent() with this store's model)
+
+        Returns:
+            dict: {'embedded', 'unchanged', 'removed', 'failed'}
+        """
+        embed = embed or (lambda path: represent(path, self.model_name, self.detector_backend))
+        if not self.entries:
+            self.load()
+        known = {entry['path']: entry for entry in self.entries}
+        stats = {'embedded': 0, 'unchanged': 0, 'removed': 0, 'failed': 0}
+
+        entries = []
+        fresh = {}
+        for filename in sorted(os.listdir(self.db_path)):
+            if not filename.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            full_path = os.path.join(self.db_path, filename)
+            stat = os.stat(full_path)
+            entry = known.pop(filename, None)
+
+            if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+                stats['unchanged'] += 1
+                entries.append(entry)
+                continue
+            digest = file_hash(full_path)
+            if entry and entry['sha1'] == digest:
+                # Touched or copied over with the same contents
+                stats['unchanged'] += 1
+                entries.append(dict(entry, mtime=stat.st_mtime))
+                continue
+
+            entry = {'path': filename, 'mtime': stat.st_mtime, 'size': stat.st_size, 'sha1': digest, 'row': None}
+            try:
+                fresh[filename] = normalize(embed(full_path))
+                stats['embedded'] += 1
+            except Exception as e:
+                print(f"⚠️ Could not embed {filename}: {e}")
+                stats['failed'] += 1
+            entries.append(entry)
+        stats['removed'] = len(known)
+        # Rows of changed images that failed to re-embed
+        kept_rows = {entry['row'] for entry in entries if entry['row'] is not None}
+        dropped_rows = any(entry['row'] is not None and entry['row'] not in kept_rows for entry in self.entries)
+
+        if fresh or known or dropped_rows:
+            # Rewrite the matrix in folder order, reusing stored rows
+            vectors = []
+            for entry in entries:
+                if entry['path'] in fresh:
+                    vectors.append(fresh[entry['path']])
+                elif entry['row'] is not None:
+                    vectors.append(np.asarray(self.matrix[entry['row']], dtype=np.float32))
+                else:
+                    continue
+                entry['row'] = len(vectors) - 1
+            matrix = np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+            self._save(entries, matrix)
+        elif entries != self.entries:
+            # Only mtimes or failed images changed; the matrix stays as it is
+            self.entries = entries
+            self._write_index()
+        self._index_rows()
+        print(f"🗂️ Face embeddings: {stats['embedded']} embedded, {stats['unchanged']} unchanged, "
+              f"{stats['removed']} removed, {stats['failed']} failed")
+        return stats
+
+    def _save(self, entries, matrix):
+        os.makedirs(self.store_dir, exist_ok=True)
+        # Release the memmap before replacing the file underneath it
+        self.matrix = None
+        temp_path = self.matrix_path + ".tmp.npy"
+        np.save(temp_path, matrix)
+        os.replace(temp_path, self.matrix_path)
+        self.entries = entries
+        self._write_index()
+        self.matrix = np.load(self.matrix_path, mmap_mode='r')
+
+    def _write_index(self):
+        os.makedirs(self.store_dir, exist_ok=True)
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({'model': self.model_name, 'detector_backend': self.detector_backend,
+                       'entries': self.entries}, f)
+        os.replace(temp_path, self.index_path)
+
+    def _index_rows(self):
+        # _paths[row] is the image for matrix row `row` (None for a row no entry points at)
+        self._paths = [None] * len(self.matrix)
+        for entry in self.entries:
+            if entry['row'] is not None:
+                self._paths[entry['row']] = entry['path']
+
+    def __len__(self):
+        return sum(path is not None for path in self._paths)
+
+    def search(self, embedding, k=1, threshold=None):
+        """
+        Closest stored faces to an embedding.
+
+        Args:
+            embedding: Query embedding (any scale)
+            k (int): Number of matches to return
+            threshold (float): Max cosine distance for a match (defaults to the model's)
+
+        Returns:
+            list: [{'identity': image path, 'distance'}], closest first
+        """
+        if not len(self):
+            return []
+        if threshold is None:
+            threshold = COSINE_THRESHOLDS.get(self.model_name, DEFAULT_THRESHOLD)
+        distances = 1.0 - self.matrix @ normalize(embedding)
+        k = min(k, len(distances))
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        return [
+            {'identity': os.path.join(self.db_path, self._paths[row]), 'distance': float(distances[row])}
+            for row in top if distances[row] <= threshold and self._paths[row] is not None
+        ]
+
+    def find(self, img, k=1, threshold=None):
+        """Embed img (path or frame) and search() for it"""
+        return self.search(represent(img, self.model_name, self.detector_backend), k=k, threshold=threshold)
+
+
+def benchmark(identities=10000, dim=4096, queries=200, seed=0):
+    """
+    Median search time over `identities` stored embeddings of `dim` floats
+    (4096 is VGG-Face), against scoring each stored embedding in a loop.
+
+    Returns:
+        dict: {'identities', 'dim', 'vectorized_ms', 'loop_ms'}
+    """
+    rng = np.random.default_rng(seed)
+    store = EmbeddingStore(db_path="benchmark")
+    store.matrix = normalize(rng.standard_normal((identities, dim)))
+    store._paths = [f"person_{i}.jpg" for i in range(identities)]
+    probes = store.matrix[rng.integers(0, identities, queries)] + 0.1 * normalize(rng.standard_normal((queries, dim)))
+
+    timings = []
+    for probe in probes:
+        started = time.perf_counter()
+        store.search(probe, k=5)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    loop_timings = []
+    for probe in probes[:5]:
+        started = time.perf_counter()
+        query = normalize(probe)
+        min((cosine_distance(row, query), row_index) for row_index, row in enumerate(store.matrix))
+        loop_timings.append((time.perf_counter() - started) * 1000)
+
+    return {
+        'identities': identities,
+        'dim': dim,
+        'vectorized_ms': round(float(np.median(timings)), 3),
+        'loop_ms': round(float(np.median(loop_timings)), 1),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sync a face_db folder's embeddings or benchmark search")
+    parser.add_argument('db_path', nargs='?', default="face_db")
+    parser.add_argument('--model', default="VGG-Face")
+    parser.add_argument('--benchmark', type=int, metavar='IDENTITIES', help="Benchmark search instead")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        result = benchmark(args.benchmark)
+        print(f"🔎 {result['identities']} identities x {result['dim']}: vectorized search "
+              f"{result['vectorized_ms']} ms, per-row loop {result['loop_ms']} ms (median)")
+    else:
+        EmbeddingStore(args.db_path, model_name=args.model).sync()
@@ -3,6 +3,7 @@ from deepface import DeepFace
 import matplotlib.pyplot as plt
 import cv2
 import numpy as np
+from embedding_store import EmbeddingStore
 
 def display_image(img):
     """Display image using matplotlib"""
@@ -101,10 +102,13 @@ def find_faces(img_path):
         print(f"Error in face detection: {e}")
         return None
 
-def face_recognition_demo(img_path, db_path):
+def face_recognition_demo(img_path, db_path, k=5):
     """Identify faces in an image by matching against a database"""
     try:
-        result = DeepFace.find(img_path=img_path, db_path=db_path)
+        # Only images added or changed since the last run are embedded
+        store = EmbeddingStore(db_path)
+        store.sync()
+        result = store.find(img_path, k=k)
         print(f"\nFace Recognition Results:")
         
         # Show query image
@@ -117,22 +121,20 @@ def face_recognition_demo(img_path, db_path):
         plt.show()
         
         # If identities were found
-        if len(result) > 0 and not result[0].empty:
+        if result:
             print(f"Found {len(result)} matching faces")
-            for i, df in enumerate(result):
-                if not df.empty:
-                    for _, row in df.iterrows():
-                        identity_path = row['identity']
-                        distance = row['distance']
-                        
-                        matched_img = cv2.imread(identity_path)
-                        matched_img = cv2.cvtColor(matched_img, cv2.COLOR_BGR2RGB)
-                        
-                        plt.figure(figsize=(8, 8))
-                        plt.imshow(matched_img)
-                        plt.title(f"Match: {os.path.basename(identity_path)}\nDistance: {distance:.2f}")
-                        plt.axis('off')
-                        plt.show()
+            for match in result:
+                identity_path = match['identity']
+                distance = match['distance']
+                
+                matched_img = cv2.imread(identity_path)
+                matched_img = cv2.cvtColor(matched_img, cv2.COLOR_BGR2RGB)
+                
+                plt.figure(figsize=(8, 8))
+                plt.imshow(matched_img)
+                plt.title(f"Match: {os.path.basename(identity_path)}\nDistance: {distance:.2f}")
+                plt.axis('off')
+                plt.show()
         else:
             print("No matching identities found")
         
@@ -159,9 +161,8 @@ def create_database(images_dir, db_name="face_db"):
                     import shutil
                     shutil.copy2(src, dst)
         
-        # Build the representation for face matching
-        DeepFace.build_model("VGG-Face")  # Pre-load the model
-        representations = DeepFace.represent(db_path=db_name, model_name="VGG-Face", enforce_detection=False)
+        # Embed new or changed images; the rest come from the stored embeddings
+        EmbeddingStore(db_name, model_name="VGG-Face").sync()
         print(f"Created database with {len(os.listdir(db_name))} images")
         
         return db_name
@@ -1,5 +1,6 @@
 import cv2
 import os
+import re
 import time
 from deepface import DeepFace
 import numpy as np
@@ -40,11 +41,51 @@ def map_distance_to_volume(distance, base_cm=50):
     volume = 50 + adjustment
     return int(max(0, min(100, volume)))
 
-def real_time_facial_recognition():
+def save_reference(references_dir, name, embedding, model_name):
+    """
+    Save a reference embedding as <references_dir>/<name>.npz, together with
+    the model that produced it.
+
+    Returns:
+        str: Path of the saved file
+    """
+    safe_name = re.sub(r'[^A-Za-z0-9_-]+', '_', name or '').strip('_') or 'reference'
+    os.makedirs(references_dir, exist_ok=True)
+    path = os.path.join(references_dir, f"{safe_name}.npz")
+    np.savez(path, embedding=embedding, model_name=model_name)
+    return path
+
+def load_reference(path, model_name):
+    """
+    Load a reference saved by save_reference().
+
+    Raises:
+        ValueError: The reference was embedded with another model
+    """
+    with np.load(path) as saved:
+        saved_model = str(saved['model_name']) if 'model_name' in saved else None
+        if saved_model != model_name:
+            raise ValueError(f"{path} was embedded with {saved_model or 'an unknown model'}, not {model_name}")
+        return saved['embedding']
+
+def real_time_facial_recognition(reference_path=None, model_name="VGG-Face"):
     """
     Real-time facial recognition using webcam
     Press 'q' to quit, 'c' to capture reference face, 's' to save current face to database
+
+    The reference face is embedded once when it is captured (and saved under
+    face_db/.references/<name>.npz with its model); each tick only embeds the
+    detected face and compares the two embeddings. Both are embedded from the
+    detected face crop the same way. reference_path loads a saved reference
+    instead.
     """
+    from embedding_store import COSINE_THRESHOLDS, DEFAULT_THRESHOLD, cosine_distance, represent
+
+    def embed_face(frame, facial_area):
+        x, y, w, h = facial_area['x'], facial_area['y'], facial_area['w'], facial_area['h']
+        return represent(frame[max(y, 0):y+h, max(x, 0):x+w], model_name, detector_backend='skip')
+
+    threshold = COSINE_THRESHOLDS.get(model_name, DEFAULT_THRESHOLD)
     cap = cv2.VideoCapture(0)
     if not cap.isOpened():
         print("Cannot open camera")
@@ -55,9 +96,14 @@ def real_time_facial_recognition():
     if not os.path.exists(db_path):
         os.makedirs(db_path)
     
-    reference_face = None
+    reference_embedding = None
     reference_name = None
     face_count = 0
+    references_dir = os.path.join(db_path, ".references")
+    if reference_path:
+        reference_embedding = load_reference(reference_path, model_name)
+        reference_name = os.path.splitext(os.path.basename(reference_path))[0]
+        print(f"Reference face loaded: {reference_name}")
     
     print("Controls:")
     print("- Press 'q' to quit")
@@ -101,13 +147,14 @@ def real_time_facial_recognition():
                     cv2.putText(display_frame, dist_text, (x, y+h+20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
                     cv2.putText(display_frame, vol_text, (x, y+h+45), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
                     
-                    # If we have a reference face, try to match
-                    if reference_face is not None:
+                    # If we have a reference face, embed the detected face only and compare
+                    if reference_embedding is not None:
                         try:
-                            result = DeepFace.verify(frame, reference_face)
-                            text = f"{reference_name if reference_name else 'Match'}: {'Yes' if result['verified'] else 'No'}"
+                            live_embedding = embed_face(frame, face['facial_area'])
+                            verified = cosine_distance(live_embedding, reference_embedding) <= threshold
+                            text = f"{reference_name if reference_name else 'Match'}: {'Yes' if verified else 'No'}"
                             cv2.putText(display_frame, text, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
-                        except:
+                        except Exception:
                             pass
                     
                     # If in analyze mode, show facial attributes
@@ -136,10 +183,17 @@ def real_time_facial_recognition():
         if key == ord('q'):
             break
         elif key == ord('c'):
-            # Capture current frame as reference face
-            reference_face = frame.copy()
+            # Capture current frame as reference face, embedded once here
+            try:
+                faces = DeepFace.extract_faces(frame, detector_backend='opencv', enforce_detection=True)
+                embedding = embed_face(frame, faces[0]['facial_area'])
+            except Exception as e:
+                print(f"No face to use as reference: {e}")
+                continue
+            reference_embedding = embedding
             reference_name = input("Enter name for reference face: ")
-            print(f"Reference face captured: {reference_name}")
+            saved_path = save_reference(references_dir, reference_name, reference_embedding, model_name)
+            print(f"Reference face captured: {reference_name} (embedding saved to {saved_path})")
         elif key == ord('s'):
             # Save current frame to database
             if not os.path.exists(db_path):
@@ -218,7 +272,8 @@ if __name__ == "__main__":
     choice = input("Enter your choice (1/2): ")
     
     if choice == '1':
-        real_time_facial_recognition()
+        reference_path = input("Path to a saved reference embedding (.npz, leave empty to capture one): ")
+        real_time_facial_recognition(reference_path or None)
     elif choice == '2':
         input_dir = input("Enter the path to the directory with images: ")
         output_dir = input("Enter the path for processed images (leave empty for default): ")
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Test script for EmbeddingStore.sync() (embedding_store.py), with a fake
+embedding function in place of DeepFace
+"""
+
+import hashlib
+import os
+import tempfile
+import time
+import numpy as np
+from embedding_store import EmbeddingStore
+
+
+class FakeEmbedder:
+    """Embeds a file from its contents; files starting with b'bad' fail"""
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, path):
+        self.calls.append(os.path.basename(path))
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data.startswith(b'bad'):
+            raise ValueError("Face could not be detected")
+        return vector_for(data)
+
+
+def vector_for(data):
+    seed = int(hashlib.sha1(data).hexdigest(), 16) % (2 ** 32)
+    return np.random.default_rng(seed).standard_normal(32)
+
+
+def write(db_path, name, data):
+    with open(os.path.join(db_path, name), 'wb') as f:
+        f.write(data)
+
+
+def best_match(store, data):
+    matches = store.search(vector_for(data), k=1, threshold=0.01)
+    return os.path.basename(matches[0]['identity']) if matches else None
+
+
+def test_sync_embeds_only_changes():
+    """New and changed images are embedded; touched, unchanged and deleted ones are not"""
+    with tempfile.TemporaryDirectory() as db_path:
+        for name in ('alice.jpg', 'bob.jpg', 'carol.png'):
+            write(db_path, name, name.encode())
+        write(db_path, 'notes.txt', b'not an image')
+        embed = FakeEmbedder()
+        store = EmbeddingStore(db_path)
+
+        stats = store.sync(embed=embed)
+        assert stats == {'embedded': 3, 'unchanged': 0, 'removed': 0, 'failed': 0}
+        assert len(store) == 3 and best_match(store, b'bob.jpg') == 'bob.jpg'
+
+        # Touched with the same contents: recognised by its hash
+        os.utime(os.path.join(db_path, 'alice.jpg'), (time.time() + 10, time.time() + 10))
+        embed.calls.clear()
+        stats = store.sync(embed=embed)
+        print(f"✅ After touching alice.jpg: {stats}, embedded {embed.calls}")
+        assert stats['embedded'] == 0 and stats['unchanged'] == 3 and embed.calls == []
+
+        # Changed contents are re-embedded, a deleted image is dropped
+        write(db_path, 'bob.jpg', b'bob, new photo')
+        os.remove(os.path.join(db_path, 'carol.png'))
+        embed.calls.clear()
+        stats = store.sync(embed=embed)
+        print(f"✅ After editing bob.jpg and deleting carol.png: {stats}, embedded {embed.calls}")
+        assert stats == {'embedded': 1, 'unchanged': 1, 'removed': 1, 'failed': 0}
+        assert embed.calls == ['bob.jpg']
+        assert len(store) == 2
+        assert best_match(store, b'bob, new photo') == 'bob.jpg'
+        assert best_match(store, b'bob.jpg') is None
+        assert best_match(store, b'carol.png') is None
+
+
+def test_failed_reembed_drops_old_row():
+    """An image that changes and then fails to embed no longer matches its old face"""
+    with tempfile.TemporaryDirectory() as db_path:
+        write(db_path, 'alice.jpg', b'alice.jpg')
+        write(db_path, 'bob.jpg', b'bob.jpg')
+        embed = FakeEmbedder()
+        store = EmbeddingStore(db_path)
+        store.sync(embed=embed)
+
+        write(db_path, 'alice.jpg', b'bad photo')
+        stats = store.sync(embed=embed)
+        print(f"✅ After alice.jpg failed to re-embed: {stats}, {len(store)} stored")
+        assert stats['failed'] == 1 and len(store) == 1
+        assert best_match(store, b'alice.jpg') is None
+        assert best_match(store, b'bob.jpg') == 'bob.jpg'
+
+
+def test_reload_from_disk():
+    """A new store loads the saved embeddings and doesn't embed anything again"""
+    with tempfile.TemporaryDirectory() as db_path:
+        for name in ('alice.jpg', 'bob.jpg'):
+            write(db_path, name, name.encode())
+        EmbeddingStore(db_path).sync(embed=FakeEmbedder())
+
+        embed = FakeEmbedder()
+        store = EmbeddingStore(db_path)
+        stats = store.sync(embed=embed)
+        print(f"✅ Reloaded store: {stats}")
+        assert embed.calls == [] and stats['unchanged'] == 2
+        assert best_match(store, b'alice.jpg') == 'alice.jpg'
+
+
+if __name__ == "__main__":
+    test_sync_embeds_only_changes()
+    test_failed_reembed_drops_old_row()
+    test_reload_from_disk()
+    print("\n🧪 Embedding store tests passed!")
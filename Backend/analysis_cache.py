@@ -0,0 +1,131 @@
+import hashlib
+import re
+import time
+import unicodedata
+from datetime import datetime, timedelta, timezone
+from cache import TTLCache
+from metrics import metrics
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+
+def normalize_text(text):
+    """
+    Normalize situation text so trivially different submissions share a cache
+    entry: Unicode NFKC, lower case, punctuation dropped, whitespace collapsed.
+    """
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    text = re.sub(r"[^\w\s']", ' ', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class AnalysisCache:
+    def __init__(self, max_entries=2048, ttl=DEFAULT_TTL_SECONDS, collection=None):
+        """
+        Cache of parsed {sentiment, keyword} results keyed on normalized text.
+
+        Lookups go to an in-memory LRU first, then to the optional MongoDB
+        collection, so results survive restarts and are shared between
+        workers. Concurrent misses for the same text share one analysis call.
+
+        Args:
+            max_entries (int): In-memory LRU size
+            ttl (float): Seconds a result stays valid
+            collection: Optional pymongo Collection for the persistent layer
+        """
+        self.ttl = ttl
+        self.memory = TTLCache('analysis_cache', max_entries=max_entries, ttl=ttl)
+        self.collection = None
+        if collection is not None:
+            self.attach_collection(collection)
+
+    def attach_collection(self, collection):
+        """Use a MongoDB collection as the persistent layer (TTL-indexed on expires_at)"""
+        collection.create_index('expires_at', expireAfterSeconds=0)
+        self.collection = collection
+
+    @staticmethod
+    def key_for(text):
+        return hashlib.sha1(normalize_text(text).encode('utf-8')).hexdigest()
+
+    def peek(self, text):
+        """Cached result for text from memory only, or None; never calls Gemini"""
+        return self.memory.get(self.key_for(text))
+
+    def lookup(self, text):
+        """Cached result for text from memory or MongoDB, or None; never calls Gemini"""
+        key = self.key_for(text)
+        result = self.memory.get(key)
+        if result is None:
+            result = self._load(key)
+            if result is not None:
+                metrics.increment('analysis_cache.persistent_hit')
+                self.memory.set(key, result)
+        return dict(result) if result is not None else None
+
+    def store(self, text, result):
+        """Cache an analysis produced outside get_or_analyze (e.g. by a batch call)"""
+        key = self.key_for(text)
+        result = {'sentiment': result['sentiment'], 'keyword': result['keyword']}
+        self.memory.set(key, result)
+        self._store(key, text, result)
+
+    def get_or_analyze(self, text, analyze):
+        """
+        Return the cached analysis for text, or call analyze() to produce it.
+
+        Args:
+            text (str): Situation text as submitted
+            analyze (callable): Returns the parsed {'sentiment', 'keyword'} dict
+
+        Returns:
+            dict: {'sentiment': ..., 'keyword': ...}
+        """
+        key = self.key_for(text)
+        started = time.perf_counter()
+
+        def load():
+            stored = self._load(key)
+            if stored is not None:
+                metrics.increment('analysis_cache.persistent_hit')
+                return stored
+            call_started = time.perf_counter()
+            result = analyze()
+            metrics.observe('analysis.gemini', (time.perf_counter() - call_started) * 1000)
+            result = {'sentiment': result['sentiment'], 'keyword': result['keyword']}
+            self._store(key, text, result)
+            return result
+
+        try:
+            return dict(self.memory.get_or_compute(key, load))
+        finally:
+            metrics.observe('analysis.total', (time.perf_counter() - started) * 1000)
+
+    def _load(self, key):
+        if self.collection is None:
+            return None
+        try:
+            doc = self.collection.find_one({'_id': key, 'expires_at': {'$gt': datetime.now(timezone.utc)}})
+        except Exception as e:
+            print(f"⚠️ Analysis cache lookup failed: {e}")
+            return None
+        if not doc:
+            return None
+        return {'sentiment': doc['sentiment'], 'keyword': doc['keyword']}
+
+    def _store(self, key, text, result):
+        if self.collection is None:
+            return
+        try:
+            self.collection.update_one(
+                {'_id': key},
+                {'$set': {
+                    'text': normalize_text(text),
+                    'sentiment': result['sentiment'],
+                    'keyword': result['keyword'],
+                    'expires_at': datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+                }},
+                upsert=True
+            )
+        except Exception as e:
+            print(f"⚠️ Analysis cache write failed: {e}")
@@ -1,14 +1,27 @@
 from flask import Flask, request, jsonify, redirect, url_for, session, Response
 from flask_cors import CORS
-from situation import analyze_text_sentiment_and_keyword, extract_json_from_response, play_multiple_songs_for_feeling_and_keyword
-from main import auth, initDB, getCurr, check_skip, addDB, get_current_emotion, start_webcam, stop_webcam, get_webcam_status as get_webcam_status_main, main as main_function, get_latest_distance_and_volume
+from response_parser import ResponseParseError
+from batch_analysis import analyze_situations, MAX_BATCH_SIZE
+from deadline import Deadline, DeadlineExceeded
+from situation import analyze_situation_cached, analysis_cache, play_multiple_songs_for_feeling_and_keyword
+from main import auth, initDB, getCurr, check_skip, addDB, get_current_emotion, start_webcam, stop_webcam, get_webcam_status as get_webcam_status_main, main as main_function, get_latest_distance_and_volume, get_current_session
 from mongoDB import MongoDBManager
+from broker import EventBroker, format_sse
+from change_feed import TrackChangeWatcher, track_summary
+from services import get_spotify
+from metrics import metrics
+from candidate_pools import CandidatePools
+from ranking import mongo_score_lookup, set_score_lookup
+from emotion_index import EmotionIndex
+from leaderboards import Leaderboards
+from sessions import Sessionizer
 import os
 from dotenv import load_dotenv
 from spotipy.oauth2 import SpotifyOAuth
 import spotipy
 import json
 import threading
+from datetime import datetime
 import time
 from monitoring_flag import set_main_monitoring_should_stop, get_main_monitoring_should_stop
 
@@ -18,12 +31,24 @@ app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-here')  # Required for sessions
 
-# Initialize Spotify client
-sp = auth()
+# Fan-out broker for Server-Sent Events to the dashboard
+event_broker = EventBroker()
+sse_keepalive_seconds = 30
 
-# Global variable to track database updates
-db_update_event = threading.Event()
-last_db_update = time.time()
+# Deltas larger than this are answered with a full snapshot instead
+max_delta_songs = 200
+
+# Watches the tracks collection so writes from any process reach the dashboard
+change_watcher = None
+
+# Warm search results for the most requested sentiment/keyword pairs
+candidate_pools = CandidatePools()
+
+# Emotion profiles of all tracks for "more like this" queries, kept current by the watcher
+emotion_index = EmotionIndex()
+
+# Top tracks per emotion ("top happy", "most skipped"), kept current by the watcher
+leaderboards = Leaderboards()
 
 # Global variable to track the main monitoring thread
 main_monitoring_thread = None
@@ -90,16 +115,42 @@ def analyze_situation():
         if not situation_text:
             return jsonify({"error": "No situation text provided"}), 400
         
-        # Analyze the situation using Gemini
-        result = analyze_text_sentiment_and_keyword(situation_text)
-        parsed = extract_json_from_response(result)
+        # Local classifier first, then Gemini (cached on normalized text) within the request budget
+        parsed = analyze_situation_cached(situation_text, deadline=Deadline())
         
         return jsonify({
             "sentiment": parsed['sentiment'],
             "keyword": parsed['keyword'],
+            "source": parsed.get('source', 'llm'),
             "situation": situation_text
         })
         
+    except ResponseParseError as e:
+        return jsonify({"error": str(e)}), 502
+    except DeadlineExceeded as e:
+        return jsonify({"error": str(e)}), 504
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/analyze-situations', methods=['POST'])
+def analyze_situations_batch():
+    try:
+        data = request.get_json(silent=True) or {}
+        situations = data.get('situations')
+        
+        if not isinstance(situations, list) or not situations:
+            return jsonify({"error": "Provide a non-empty 'situations' list"}), 400
+        if len(situations) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"At most {MAX_BATCH_SIZE} situations per request"}), 413
+        
+        results = analyze_situations(situations)
+        
+        return jsonify({
+            "results": [dict(result, index=i) for i, result in enumerate(results)],
+            "count": len(results),
+            "errors": sum(1 for result in results if 'error' in result)
+        })
+        
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -114,8 +165,11 @@ def play_music():
         if not sentiment or not keyword:
             return jsonify({"error": "Sentiment and keyword are required"}), 400
         
-        # Play multiple songs based on sentiment and keyword
-        tracks = play_multiple_songs_for_feeling_and_keyword(sp, sentiment, keyword, num_songs)
+        # Serve from the warm pool when there is one, otherwise search live
+        candidate_pools.record(sentiment, keyword)
+        tracks = play_multiple_songs_for_feeling_and_keyword(get_spotify(), sentiment, keyword, num_songs,
+                                                             deadline=Deadline(),
+                                                             tracks=candidate_pools.get(sentiment, keyword, num_songs))
         
         if tracks:
             track_list = []
@@ -133,6 +187,8 @@ def play_music():
         else:
             return jsonify({"error": "No tracks found"}), 404
             
+    except DeadlineExceeded as e:
+        return jsonify({"error": str(e)}), 504
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -436,23 +492,92 @@ def api_get_monitoring_status():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def enrich_songs(sp, songs):
+    """Combine database documents with track details from Spotify"""
+    # Get detailed track information from Spotify (in batches of 50)
+    track_ids = [song['track_id'] for song in songs]
+    track_details = []
+    for i in range(0, len(track_ids), 50):
+        batch_ids = track_ids[i:i+50]
+        track_details.extend(sp.tracks(batch_ids)['tracks'])
+    
+    # Combine database data with Spotify data
+    enjoyed_songs = []
+    for i, song in enumerate(songs):
+        spotify_track = track_details[i] if i < len(track_details) else None
+        if spotify_track:
+            # Convert duration from ms to mm:ss format
+            duration_ms = spotify_track.get('duration_ms', 0)
+            duration_min = duration_ms // 60000
+            duration_sec = (duration_ms % 60000) // 1000
+            duration_str = f"{duration_min}:{duration_sec:02d}"
+            
+            # Get album art (smallest for better performance)
+            album_art = None
+            if spotify_track.get('album', {}).get('images'):
+                album_art = spotify_track['album']['images'][-1]['url']
+            
+            # Get artist name safely
+            artist_name = 'Unknown'
+            if spotify_track.get('artists') and len(spotify_track['artists']) > 0:
+                artist_name = spotify_track['artists'][0].get('name', 'Unknown')
+            
+            # Score, emotion breakdown and dominant emotion (highest count)
+            summary = track_summary(song)
+            
+            enjoyed_songs.append({
+                "track_id": song['track_id'],
+                "title": spotify_track.get('name', 'Unknown'),
+                "artist": artist_name,
+                "album_art": album_art,
+                "duration": duration_str,
+                "emotion": summary['emotion'],
+                "score": summary['score'],
+                "emotion_breakdown": summary['emotion_breakdown']
+            })
+    return enjoyed_songs
+
 @app.route('/api/enjoyed-songs', methods=['GET'])
 def get_enjoyed_songs():
-    """Get all songs from database"""
+    """
+    Get songs from database.
+
+    Pass ?since=<revision> to get only tracks inserted or updated after that
+    revision. The response's "mode" is "delta" in that case, or "snapshot"
+    (every song) when the client is too far behind or tracks were deleted since.
+    Either way "revision" is the value to send as `since` next time.
+    """
     try:
+        since = request.args.get('since', type=int)
+
         # Initialize MongoDB connection
         mongo_manager = MongoDBManager()
         if not mongo_manager.connect():
             return jsonify({"error": "Database connection failed"}), 500
         
-        # Get ALL songs (no filter, no limit)
+        # Resume point for the client: below any revision whose write may not
+        # have landed yet, so a slow writer's document is picked up next time
+        # (documents past it are simply sent again)
+        revision = mongo_manager.get_revision()
+        mode = "snapshot"
+        filter_query = {}
+        if since is not None and since >= revision['reset_rev']:
+            filter_query = {'rev': {'$gt': since}}
+            changed = mongo_manager.collection.count_documents(filter_query, limit=max_delta_songs + 1)
+            if changed <= max_delta_songs:
+                mode = "delta"
+            else:
+                filter_query = {}
+        
+        # Get the songs (no limit)
         songs = mongo_manager.find_many(
-            filter_query={},
+            filter_query=filter_query,
             limit=0  # 0 means no limit
         )
         
         if not songs:
-            return jsonify({"songs": []})
+            mongo_manager.disconnect()
+            return jsonify({"songs": [], "mode": mode, "revision": revision['safe_rev']})
         
         # Get Spotify client for additional track info
         sp_oauth = create_spotify_oauth()
@@ -462,59 +587,10 @@ def get_enjoyed_songs():
             return jsonify({"error": "Not authenticated with Spotify"}), 401
         
         sp = spotipy.Spotify(auth=token_info['access_token'])
-        
-        # Get detailed track information from Spotify (in batches of 50)
-        track_ids = [song['track_id'] for song in songs]
-        track_details = []
-        for i in range(0, len(track_ids), 50):
-            batch_ids = track_ids[i:i+50]
-            track_details.extend(sp.tracks(batch_ids)['tracks'])
-        
-        # Combine database data with Spotify data
-        enjoyed_songs = []
-        for i, song in enumerate(songs):
-            spotify_track = track_details[i] if i < len(track_details) else None
-            if spotify_track:
-                # Convert duration from ms to mm:ss format
-                duration_ms = spotify_track.get('duration_ms', 0)
-                duration_min = duration_ms // 60000
-                duration_sec = (duration_ms % 60000) // 1000
-                duration_str = f"{duration_min}:{duration_sec:02d}"
-                
-                # Get album art (smallest for better performance)
-                album_art = None
-                if spotify_track.get('album', {}).get('images'):
-                    album_art = spotify_track['album']['images'][-1]['url']
-                
-                # Get artist name safely
-                artist_name = 'Unknown'
-                if spotify_track.get('artists') and len(spotify_track['artists']) > 0:
-                    artist_name = spotify_track['artists'][0].get('name', 'Unknown')
-                
-                # Find the dominant emotion (highest count)
-                emotion_counts = {}
-                for emotion in ['happy', 'sad', 'angry', 'surprise', 'fear', 'disgust', 'neutral', 'skipped']:
-                    emotion_field = f'emotion_{emotion}'
-                    emotion_counts[emotion] = song.get(emotion_field, 0)
-                
-                # Get the emotion with the highest count
-                dominant_emotion = max(emotion_counts, key=lambda k: emotion_counts[k])
-                
-                enjoyed_songs.append({
-                    "track_id": song['track_id'],
-                    "title": spotify_track.get('name', 'Unknown'),
-                    "artist": artist_name,
-                    "album_art": album_art,
-                    "duration": duration_str,
-                    "emotion": dominant_emotion,
-                    "score": song.get('total_score', 0),
-                    "emotion_breakdown": emotion_counts
-                })
-        
-        # Sort by score descending
+        enjoyed_songs = enrich_songs(sp, songs)
         
         mongo_manager.disconnect()
-        return jsonify({"songs": enjoyed_songs})
+        return jsonify({"songs": enjoyed_songs, "mode": mode, "revision": revision['safe_rev']})
         
     except Exception as e:
         print(f"Error getting enjoyed songs: {str(e)}")
@@ -598,28 +674,185 @@ def set_spotify_volume_api():
 
 def notify_db_update():
     """Notify frontend that database has been updated"""
-    global db_update_event, last_db_update
-    last_db_update = time.time()
-    db_update_event.set()
-    # Reset the event after a short delay
-    threading.Timer(0.1, db_update_event.clear).start()
+    # Bursts of writes are coalesced into a single dashboard refresh
+    event_broker.publish('db_update', {'timestamp': time.time()}, coalesce_key='db_update')
+
+def publish_track_change(change):
+    """Forward a change from the tracks watcher to SSE subscribers"""
+    if change['op'] == 'upsert':
+        track = change['track']
+        emotion_index.upsert(track['track_id'], track['emotion_breakdown'])
+        leaderboards.update(track['track_id'], track['emotion_breakdown'])
+        # Only the latest state of each track matters to the dashboard
+        event_broker.publish('track_update', {'track': track}, coalesce_key=f"track:{track['track_id']}")
+    else:
+        # Deletes and drops carry no track_id; rebuild the index and make the dashboard refetch
+        emotion_index.reload()
+        leaderboards.reload()
+        notify_db_update()
+
+background_services_started = False
+background_services_lock = threading.Lock()
+
+def start_background_services():
+    """Start the candidate pool refresher and the tracks watcher, and attach persistent caches (once)"""
+    global change_watcher, background_services_started
+    with background_services_lock:
+        if background_services_started:
+            return change_watcher
+        background_services_started = True
+    candidate_pools.start()
+    try:
+        mongo_manager = MongoDBManager()
+    except ValueError as e:
+        print(f"⚠️ {e} Dashboard updates and persistent caches disabled")
+        return None
+    if not mongo_manager.connect():
+        print("⚠️ Database connection failed, dashboard updates and persistent caches disabled")
+        return None
+    mongo_manager.ensure_track_indexes()
+    mongo_manager.backfill_decay_rank()
+    set_score_lookup(mongo_score_lookup(mongo_manager.collection))
+    emotion_index.load_from_collection(mongo_manager.collection)
+    leaderboards.load_from_collection(mongo_manager.collection)
+    analysis_cache.attach_collection(mongo_manager.db['analysis_cache'])
+    change_watcher = TrackChangeWatcher(mongo_manager.collection, publish_track_change)
+    change_watcher.start()
+    return change_watcher
+
+@app.before_request
+def ensure_background_services():
+    """Start background services in whichever process serves requests (flask run, gunicorn, ...)"""
+    if not background_services_started:
+        start_background_services()
+
+@app.route('/api/similar-tracks/<track_id>', methods=['GET'])
+def similar_tracks(track_id):
+    """Tracks whose recorded reactions are most like this track's"""
+    try:
+        k = max(1, min(int(request.args.get('k', 10)), 100))
+    except ValueError:
+        return jsonify({"error": "k must be an integer"}), 400
+    profile = emotion_index.profile(track_id)
+    if profile is None:
+        return jsonify({"error": "Track has no recorded reactions"}), 404
+    return jsonify({
+        "track_id": track_id,
+        "profile": profile,
+        "similar": [{"track_id": other, "similarity": round(similarity, 4)}
+                    for other, similarity in emotion_index.similar_to(track_id, k=k)]
+    })
+
+@app.route('/api/top-tracks', methods=['GET'])
+def top_tracks():
+    """Tracks ranked by time-decayed score, so recent favourites come first"""
+    try:
+        limit = max(1, min(int(request.args.get('limit', 10)), 100))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    mongo_manager = MongoDBManager()
+    if not mongo_manager.connect():
+        return jsonify({"error": "Database connection failed"}), 500
+    try:
+        docs = mongo_manager.top_tracks_by_decayed_score(limit=limit)
+        return jsonify({"tracks": [
+            {"track_id": doc['track_id'], "score": round(doc['score_now'], 4), "total_score": doc.get('total_score', 0)}
+            for doc in docs
+        ]})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        mongo_manager.disconnect()
+
+def _session_json(doc):
+    return {key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in doc.items() if key != 'current_track'}
+
+@app.route('/api/sessions', methods=['GET'])
+def listening_sessions():
+    """Recent listening sessions with their aggregates, newest first"""
+    try:
+        limit = max(1, min(int(request.args.get('limit', 10)), 100))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    mongo_manager = MongoDBManager()
+    if not mongo_manager.connect():
+        return jsonify({"error": "Database connection failed"}), 500
+    try:
+        docs = Sessionizer(mongo_manager.db).recent(limit=limit, user_id=request.args.get('user_id'))
+        return jsonify({"sessions": [_session_json(doc) for doc in docs]})
+    finally:
+        mongo_manager.disconnect()
+
+@app.route('/api/sessions/current', methods=['GET'])
+def current_listening_session():
+    """The session the monitor is tracking right now"""
+    current = get_current_session()
+    return jsonify({"session": _session_json(current) if current else None})
+
+@app.route('/api/sessions/<session_id>', methods=['GET'])
+def listening_session(session_id):
+    """One session's aggregates: tracks, listening time, moods, score and skips"""
+    mongo_manager = MongoDBManager()
+    if not mongo_manager.connect():
+        return jsonify({"error": "Database connection failed"}), 500
+    try:
+        doc = Sessionizer(mongo_manager.db).get(session_id)
+    finally:
+        mongo_manager.disconnect()
+    if doc is None:
+        return jsonify({"error": "Session not found"}), 404
+    return jsonify({"session": _session_json(doc)})
+
+@app.route('/api/leaderboards/<emotion>', methods=['GET'])
+def leaderboard(emotion):
+    """Tracks with the most reactions of one emotion (e.g. happy, skipped)"""
+    try:
+        limit = max(1, int(request.args.get('limit', 10)))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if emotion not in leaderboards.dimensions:
+        return jsonify({"error": f"Unknown emotion '{emotion}'"}), 404
+    return jsonify({
+        "emotion": emotion,
+        "tracks": [{"track_id": track_id, "count": count} for track_id, count in leaderboards.top(emotion, limit)]
+    })
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_api():
+    """Cache hit/miss counters and latency histograms"""
+    return jsonify(metrics.snapshot())
 
 @app.route('/api/db-updates', methods=['GET'])
 def db_updates_sse():
     """Server-Sent Events endpoint for database updates"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    subscription = event_broker.subscribe(last_event_id)
+
     def generate():
-        global last_db_update
-        while True:
-            # Wait for database update event
-            db_update_event.wait(timeout=30)  # 30 second timeout
-            
-            # Send update notification
-            yield f"data: {json.dumps({'timestamp': last_db_update, 'type': 'db_update'})}\n\n"
-            
-            # Small delay to prevent rapid firing
-            time.sleep(0.5)
-    
-    return Response(generate(), mimetype='text/plain')
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                event = subscription.get(timeout=sse_keepalive_seconds)
+                if subscription.closed:
+                    break
+                if event is None:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(event)
+        finally:
+            event_broker.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 def main_monitoring_loop():
     """Run the original main function from main.py in a thread"""
@@ -667,10 +900,15 @@ if __name__ == '__main__':
     # print("🔄 Initializing main monitoring system...")
     # start_main_monitoring()
     
+    debug = os.environ.get('FLASK_DEBUG', '1') != '0'
+    # The debug reloader's parent process only restarts the child; everything else serves requests
+    if not (debug and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'):
+        start_background_services()
+
     print(f"🌐 Flask app running on port {port}")
     # print("📊 Main monitoring system is active and tracking emotions/skips")
     print("🎵 Ready to analyze your music listening experience!")
     
-    app.run(debug=True, host='0.0.0.0', port=port)
+    app.run(debug=debug, host='0.0.0.0', port=port)
 
 # Remove: exported_main_monitoring_should_stop = lambda: main_monitoring_should_stop 
\ No newline at end of file
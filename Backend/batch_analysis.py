@@ -0,0 +1,231 @@
+"""
+Sentiment/keyword analysis for many situations at once.
+
+Texts answered by the local classifier or the analysis cache never reach
+Gemini. The rest are de-duplicated, packed into as few prompts as the
+per-call budget allows, and the prompts run concurrently behind a shared
+rate limiter. Situations a batch answer leaves out or gets wrong are asked
+again together in one follow-up prompt. The whole batch runs under one
+Deadline; whatever is unanswered when it runs out comes back as per-item
+errors. Results come back in input order.
+"""
+
+import os
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from analysis_cache import normalize_text
+from deadline import Deadline, DeadlineExceeded, run_stage
+from local_classifier import classify_situation
+from metrics import metrics
+from ratelimit import RateLimiter
+from response_parser import SENTIMENTS, ResponseParseError, load_json_value, validate_analysis
+from services import get_gemini
+from situation import analysis_cache
+
+MAX_BATCH_SIZE = 500
+# Each answer costs ~20 output tokens, so this keeps replies well inside the output limit
+MAX_ITEMS_PER_CALL = 100
+# Rough prompt budget (~4 characters per token)
+MAX_PROMPT_CHARS = 32000
+MAX_CONCURRENT_CALLS = 4
+# Seconds for a whole batch request, and for each Gemini call within it
+BATCH_BUDGET = float(os.getenv("BATCH_BUDGET_SECONDS", "30"))
+BATCH_CALL_BUDGET = float(os.getenv("BATCH_CALL_BUDGET_SECONDS", "20"))
+# Follow-up prompts for situations a batch answer missed
+MAX_REASKS = 1
+
+# Shared by every batch so concurrent requests respect the same Gemini quota
+gemini_rate_limiter = RateLimiter(float(os.getenv("GEMINI_RPM", "60")), per=60.0,
+                                  burst=MAX_CONCURRENT_CALLS)
+
+
+def batch_ids(count):
+    """
+    Opaque, unique ids for one prompt's situations. They are not positions,
+    so a model that renumbers or reorders its answers can't silently shift
+    results onto the wrong situation.
+    """
+    ids = []
+    seen = set()
+    while len(ids) < count:
+        candidate = secrets.token_hex(3)
+        if candidate not in seen:
+            seen.add(candidate)
+            ids.append(candidate)
+    return ids
+
+
+def build_batch_prompt(texts, ids):
+    """One prompt asking for a JSON array answer per situation, keyed by id"""
+    lines = "\n".join(f"[{item_id}] {' '.join(text.split())}" for item_id, text in zip(ids, texts))
+    return (
+        "For each situation below, extract: "
+        f"1. The overall sentiment, one of: {', '.join(SENTIMENTS)} "
+        "2. The main keyword/topic (e.g., love, jobs, family, etc.). "
+        "Return only a JSON array with one object per situation, each with "
+        "'id' (the situation's bracketed id, copied exactly), 'sentiment' and 'keyword'.\n"
+        f"Situations:\n{lines}"
+    )
+
+
+def pack_chunks(texts, max_items=MAX_ITEMS_PER_CALL, max_chars=MAX_PROMPT_CHARS):
+    """
+    Split texts into consecutive chunks that each fit in one prompt.
+
+    Returns:
+        list: Lists of indexes into texts
+    """
+    chunks = []
+    current = []
+    size = 0
+    for i, text in enumerate(texts):
+        cost = len(text) + 12
+        if current and (len(current) >= max_items or size + cost > max_chars):
+            chunks.append(current)
+            current = []
+            size = 0
+        current.append(i)
+        size += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def parse_batch_response(response_text, ids):
+    """
+    Map a batch answer onto the ids that were sent. Answers with ids that
+    weren't sent are ignored.
+
+    Returns:
+        list: Per id, in order, a {'sentiment', 'keyword'} dict or a ResponseParseError
+            (no answer, more than one answer, or an invalid one)
+
+    Raises:
+        ResponseParseError: The answer is not a JSON array
+    """
+    items = load_json_value(response_text, '[')
+    if not isinstance(items, list):
+        raise ResponseParseError("Expected a JSON array for a batch answer")
+    answers = {}
+    for item in items:
+        item_id = str(item.get('id', '')).strip().strip('[]') if isinstance(item, dict) else ''
+        answers.setdefault(item_id, []).append(item)
+
+    results = []
+    for item_id in ids:
+        given = answers.get(item_id, [])
+        if len(given) != 1:
+            results.append(ResponseParseError(
+                "No answer for this situation" if not given else "More than one answer for this situation"
+            ))
+            continue
+        try:
+            results.append(validate_analysis(given[0]))
+        except ResponseParseError as e:
+            results.append(e)
+    return results
+
+
+def _ask_batch(texts, gemini, rate_limiter, deadline):
+    """
+    One Gemini call for texts, within the deadline.
+
+    Returns:
+        list: Per text, a {'sentiment', 'keyword'} dict or an exception
+    """
+    if not rate_limiter.acquire(timeout=deadline.remaining()):
+        raise TimeoutError("Gemini rate limit: no slot available")
+    ids = batch_ids(len(texts))
+    prompt = build_batch_prompt(texts, ids)
+    started = time.perf_counter()
+    response_text = run_stage(deadline, 'analyze_batch', lambda timeout: gemini.generate(prompt, timeout=timeout))
+    metrics.observe('batch_analysis.gemini', (time.perf_counter() - started) * 1000)
+    metrics.increment('batch_analysis.llm_calls')
+    try:
+        return parse_batch_response(response_text, ids)
+    except ResponseParseError as e:
+        return [e] * len(texts)
+
+
+def _analyze_chunk(texts, gemini, rate_limiter, deadline):
+    """
+    Analyze a chunk in one call, then re-ask only the situations the answer
+    missed or got wrong, together, while the deadline allows.
+    """
+    results = _ask_batch(texts, gemini, rate_limiter, deadline)
+    for _ in range(MAX_REASKS):
+        retry = [i for i, result in enumerate(results) if isinstance(result, ResponseParseError)]
+        if not retry or deadline.expired:
+            break
+        print(f"⚠️ Batch answer missed {len(retry)} of {len(texts)} situations; asking again for those")
+        metrics.increment('batch_analysis.reask')
+        try:
+            answers = _ask_batch([texts[i] for i in retry], gemini, rate_limiter, deadline)
+        except (DeadlineExceeded, TimeoutError):
+            break
+        for i, answer in zip(retry, answers):
+            results[i] = answer
+    return results
+
+
+def analyze_situations(texts, gemini=None, rate_limiter=None, max_workers=MAX_CONCURRENT_CALLS, deadline=None):
+    """
+    Analyze many situations with as few Gemini calls as possible.
+
+    Args:
+        texts (list): Situation strings
+        gemini: Service with generate(prompt, timeout) (defaults to the shared one)
+        rate_limiter (RateLimiter): Gate for Gemini calls (defaults to gemini_rate_limiter)
+        max_workers (int): Prompts in flight at once
+        deadline (Deadline): Bounds the whole batch (defaults to BATCH_BUDGET seconds)
+
+    Returns:
+        list: Per input, in order, {'sentiment', 'keyword', 'source'} or {'error'}
+    """
+    gemini = gemini or get_gemini()
+    rate_limiter = rate_limiter or gemini_rate_limiter
+    deadline = deadline or Deadline(BATCH_BUDGET, {'analyze_batch': BATCH_CALL_BUDGET})
+    results = [None] * len(texts)
+    pending = {}  # normalized text -> input indexes waiting on Gemini
+
+    for i, text in enumerate(texts):
+        if not isinstance(text, str) or not normalize_text(text):
+            results[i] = {'error': 'Empty situation text'}
+            continue
+        local = classify_situation(text)
+        if local is not None:
+            metrics.increment('local_classifier.offloaded')
+            results[i] = {'sentiment': local['sentiment'], 'keyword': local['keyword'], 'source': 'local'}
+            continue
+        cached = analysis_cache.lookup(text)
+        if cached is not None:
+            results[i] = dict(cached, source='cache')
+            continue
+        pending.setdefault(normalize_text(text), []).append(i)
+
+    unique_texts = [texts[indexes[0]] for indexes in pending.values()]
+    waiting = list(pending.values())
+    chunks = pack_chunks(unique_texts)
+    if chunks:
+        metrics.increment('local_classifier.escalated', len(unique_texts))
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+            futures = [
+                executor.submit(_analyze_chunk, [unique_texts[j] for j in chunk], gemini, rate_limiter, deadline)
+                for chunk in chunks
+            ]
+            for chunk, future in zip(chunks, futures):
+                try:
+                    answers = future.result()
+                except Exception as e:
+                    print(f"❌ Batch analysis call failed: {e}")
+                    answers = [e] * len(chunk)
+                for j, answer in zip(chunk, answers):
+                    if isinstance(answer, Exception):
+                        item = {'error': str(answer)}
+                    else:
+                        analysis_cache.store(unique_texts[j], answer)
+                        item = dict(answer, source='llm')
+                    for i in waiting[j]:
+                        results[i] = dict(item)
+    return results
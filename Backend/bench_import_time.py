@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Import-time benchmark for the API process.
+
+Runs `python -X importtime -c "import app"` in a fresh interpreter and fails
+(exit code 1) when importing app.py exceeds the budget, or when a heavy
+dependency that should be loaded lazily shows up at import time.
+
+    python bench_import_time.py [--budget 1.0] [--module app] [--top 15]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+# Modules that must only be imported on first use (see services.py)
+LAZY_MODULES = ['cv2', 'deepface', 'tensorflow', 'google.generativeai', 'google.genai']
+
+DEFAULT_BUDGET_SECONDS = 1.0
+
+
+def parse_importtime(stderr):
+    """
+    Parse -X importtime output.
+
+    Returns:
+        list: (module, self_us, cumulative_us, depth) tuples in import order
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3:
+            continue
+        self_us, cumulative_us, name = fields
+        # Nested imports are indented by two spaces per level after one leading space
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def measure(module):
+    """Import `module` in a fresh interpreter and return the parsed timings"""
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=backend_dir, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        raise RuntimeError(f"Importing {module} failed")
+    return parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check how long importing the API module takes")
+    parser.add_argument('--module', default='app', help="Module to import (default: app)")
+    parser.add_argument('--budget', type=float,
+                        default=float(os.getenv('IMPORT_TIME_BUDGET', DEFAULT_BUDGET_SECONDS)),
+                        help="Maximum cumulative import time in seconds")
+    parser.add_argument('--top', type=int, default=15, help="How many of the slowest imports to list")
+    args = parser.parse_args()
+
+    rows = measure(args.module)
+    top_level = [row for row in rows if row[0] == args.module]
+    if not top_level:
+        print(f"❌ No import time recorded for {args.module}")
+        return 1
+    total_seconds = top_level[-1][2] / 1_000_000
+
+    print(f"⏱️ import {args.module}: {total_seconds:.3f}s (budget {args.budget:.3f}s)")
+    print(f"\nSlowest {args.top} imports (cumulative):")
+    for name, self_us, cumulative_us, depth in sorted(rows, key=lambda row: row[2], reverse=True)[:args.top]:
+        print(f"  {cumulative_us / 1000:9.1f} ms  {name}")
+
+    imported = {row[0] for row in rows}
+    eager = [name for name in LAZY_MODULES if name in imported]
+
+    failed = False
+    if eager:
+        print(f"\n❌ Heavy modules imported eagerly: {', '.join(eager)}")
+        failed = True
+    if total_seconds > args.budget:
+        print(f"\n❌ Import time regression: {total_seconds:.3f}s > {args.budget:.3f}s")
+        failed = True
+    if not failed:
+        print("\n✅ Import time within budget")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
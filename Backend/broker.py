@@ -0,0 +1,150 @@
+import json
+import threading
+import time
+from collections import deque
+
+
+class Subscription:
+    def __init__(self, broker, queue_size):
+        """
+        One subscriber's bounded queue of (event_id, event_type, data) tuples.
+
+        When the subscriber falls more than `queue_size` events behind, its
+        queue is dropped and the next get() returns a single 'resync' event
+        telling the client to refetch everything.
+        """
+        self.broker = broker
+        self.queue_size = queue_size
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._overflowed = False
+        self.closed = False
+
+    def put(self, event):
+        with self._condition:
+            if len(self._queue) >= self.queue_size:
+                self._queue.clear()
+                self._overflowed = True
+            else:
+                self._queue.append(event)
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        """Wait up to `timeout` seconds for the next event; None on timeout"""
+        with self._condition:
+            if not self._queue and not self._overflowed and not self.closed:
+                self._condition.wait(timeout)
+            if self._overflowed:
+                self._overflowed = False
+                return (self.broker.last_event_id, 'resync', {'reason': 'overflow'})
+            if self._queue:
+                return self._queue.popleft()
+            return None
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+
+class EventBroker:
+    def __init__(self, history_size=256, queue_size=64, coalesce_window=0.25):
+        """
+        In-process fan-out pub/sub for Server-Sent Events.
+
+        Args:
+            history_size (int): Recent events kept for Last-Event-ID replay
+            queue_size (int): Per-subscriber queue bound
+            coalesce_window (float): Seconds to merge bursts published with a coalesce_key
+        """
+        self.queue_size = queue_size
+        self.coalesce_window = coalesce_window
+        self.last_event_id = 0
+        self._history = deque(maxlen=history_size)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+        self._pending = {}
+        self._pending_since = None
+        self._pending_condition = threading.Condition()
+        self._dispatcher = threading.Thread(target=self._coalesce_loop, daemon=True)
+        self._dispatcher.start()
+
+    def publish(self, event_type, data=None, coalesce_key=None):
+        """
+        Publish an event to every subscriber.
+
+        With a coalesce_key, events sharing that key within coalesce_window
+        seconds are merged and only the latest one is delivered.
+        """
+        if coalesce_key is None:
+            return self._dispatch(event_type, data)
+
+        with self._pending_condition:
+            if not self._pending:
+                self._pending_since = time.monotonic()
+            self._pending[coalesce_key] = (event_type, data)
+            self._pending_condition.notify()
+        return None
+
+    def subscribe(self, last_event_id=None):
+        """
+        Register a subscriber. Events newer than last_event_id still held in
+        history are replayed; if the client is further behind than that, a
+        'resync' event is queued instead.
+        """
+        subscription = Subscription(self, self.queue_size)
+        with self._lock:
+            if last_event_id is not None and last_event_id > self.last_event_id:
+                # IDs from before a server restart mean nothing any more
+                subscription.put((self.last_event_id, 'resync', {'reason': 'restarted'}))
+            elif last_event_id is not None and last_event_id < self.last_event_id:
+                oldest = self._history[0][0] if self._history else self.last_event_id + 1
+                if last_event_id + 1 < oldest:
+                    subscription.put((self.last_event_id, 'resync', {'reason': 'too_far_behind'}))
+                else:
+                    for event in self._history:
+                        if event[0] > last_event_id:
+                            subscription.put(event)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+        subscription.close()
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def _dispatch(self, event_type, data):
+        with self._lock:
+            self.last_event_id += 1
+            event = (self.last_event_id, event_type, data)
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.put(event)
+        return event[0]
+
+    def _coalesce_loop(self):
+        while True:
+            with self._pending_condition:
+                while not self._pending:
+                    self._pending_condition.wait()
+                remaining = self._pending_since + self.coalesce_window - time.monotonic()
+                if remaining > 0:
+                    self._pending_condition.wait(remaining)
+                    continue
+                pending, self._pending = self._pending, {}
+            for event_type, data in pending.values():
+                self._dispatch(event_type, data)
+
+
+def format_sse(event):
+    """Serialize an (event_id, event_type, data) tuple as an SSE message"""
+    event_id, event_type, data = event
+    payload = dict(data or {})
+    payload['type'] = event_type
+    return f"id: {event_id}\ndata: {json.dumps(payload, default=str)}\n\n"
@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import OrderedDict
+from metrics import metrics
+
+_MISSING = object()
+
+
+class _Flight:
+    """A computation in progress that concurrent callers wait on"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    def __init__(self, name, max_entries=1024, ttl=3600, stale_ttl=0):
+        """
+        In-memory LRU cache with per-entry expiry and request coalescing.
+
+        Hits, misses and coalesced calls are counted in the metrics registry
+        as <name>.hit, <name>.miss and <name>.coalesced. With stale_ttl set,
+        get_or_compute() serves expired entries for that much longer while a
+        background refresh runs (stale-while-revalidate), counted as
+        <name>.stale.
+
+        Args:
+            name (str): Metrics prefix
+            max_entries (int): Least recently used entries are evicted past this size
+            ttl (float): Seconds an entry stays fresh
+            stale_ttl (float): Further seconds an expired entry may be served while refreshing
+        """
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return a fresh cached value, or default"""
+        value, fresh = self._lookup(key)
+        return value if fresh else default
+
+    def _lookup(self, key):
+        """(value, fresh) for key; value is _MISSING when absent or past its stale window"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING, False
+            value, expires_at = entry
+            now = time.monotonic()
+            if expires_at + self.stale_ttl <= now:
+                del self._entries[key]
+                return _MISSING, False
+            self._entries.move_to_end(key)
+            return value, expires_at > now
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the cached value for key, or call compute() to fill it.
+        Concurrent callers with the same key share a single compute() call.
+        A stale value is returned immediately and refreshed in the background.
+        """
+        value, fresh = self._lookup(key)
+        if value is not _MISSING:
+            if fresh:
+                metrics.increment(f"{self.name}.hit")
+            else:
+                metrics.increment(f"{self.name}.stale")
+                self._refresh(key, compute)
+            return value
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            metrics.increment(f"{self.name}.coalesced")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        metrics.increment(f"{self.name}.miss")
+        try:
+            flight.value = compute()
+            self.set(key, flight.value)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def _refresh(self, key, compute):
+        """Recompute key on a background thread unless a refresh is already running"""
+        with self._lock:
+            if key in self._flights:
+                return
+            flight = self._flights[key] = _Flight()
+
+        def run():
+            try:
+                flight.value = compute()
+                self.set(key, flight.value)
+            except Exception as e:
+                flight.error = e
+                print(f"⚠️ Background refresh of {self.name} entry failed: {e}")
+            finally:
+                with self._lock:
+                    self._flights.pop(key, None)
+                flight.done.set()
+
+        threading.Thread(target=run, daemon=True).start()
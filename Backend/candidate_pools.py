@@ -0,0 +1,128 @@
+"""
+Prewarmed track pools for the most requested sentiment × keyword pairs.
+
+/api/play-music records every pair it is asked for. A background thread
+keeps a pool of search results for the most frequent pairs, so those
+requests start playback without a Spotify search; pairs outside the pool
+fall back to a live (cached) search.
+"""
+
+import threading
+import time
+from collections import Counter
+from analysis_cache import normalize_text
+from metrics import metrics
+from services import get_spotify
+
+
+def combo_key(sentiment, keyword):
+    return (normalize_text(sentiment), normalize_text(keyword))
+
+
+class CandidatePools:
+    def __init__(self, top_n=20, pool_size=20, refresh_interval=600, decay=0.5, spotify=None):
+        """
+        Args:
+            top_n (int): Number of sentiment × keyword pairs kept warm
+            pool_size (int): Tracks fetched per pair
+            refresh_interval (float): Seconds between pool refreshes
+            decay (float): Factor applied to request counts after each refresh,
+                so the pools follow recent traffic
+            spotify (callable): Returns the Spotify client (defaults to get_spotify)
+        """
+        self.top_n = top_n
+        self.pool_size = pool_size
+        self.refresh_interval = refresh_interval
+        self.decay = decay
+        self.spotify = spotify or get_spotify
+        self.counts = Counter()
+        self.pools = {}  # combo -> {'tracks': [...], 'refreshed_at': float}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def record(self, sentiment, keyword):
+        """Count a request for the pair"""
+        with self._lock:
+            self.counts[combo_key(sentiment, keyword)] += 1
+
+    def get(self, sentiment, keyword, count):
+        """
+        Tracks from the warm pool for the pair, for the caller to rank and trim.
+
+        Returns:
+            list: The whole pool, or None when the pair has no pool, fewer than count
+                  tracks, or count is more than a pool holds (the caller searches live)
+        """
+        with self._lock:
+            pool = self.pools.get(combo_key(sentiment, keyword))
+        if not pool or count > self.pool_size or len(pool['tracks']) < count:
+            metrics.increment('candidate_pools.miss')
+            return None
+        metrics.increment('candidate_pools.hit')
+        return list(pool['tracks'])
+
+    def top_combos(self):
+        with self._lock:
+            return [combo for combo, _ in self.counts.most_common(self.top_n)]
+
+    def refresh_once(self):
+        """
+        Refill pools for the current top pairs and drop the rest.
+
+        Returns:
+            int: Number of pools refreshed
+        """
+        combos = self.top_combos()
+        if not combos:
+            return 0
+        sp = self.spotify()
+        fresh = {}
+        for sentiment, keyword in combos:
+            try:
+                results = sp.search(q=f"{sentiment} {keyword}", type='track', limit=self.pool_size)
+            except Exception as e:
+                print(f"⚠️ Candidate pool refresh failed for '{sentiment} {keyword}': {e}")
+                # Keep serving the previous pool until the next refresh
+                with self._lock:
+                    if (sentiment, keyword) in self.pools:
+                        fresh[(sentiment, keyword)] = self.pools[(sentiment, keyword)]
+                continue
+            tracks = results.get('tracks', {}).get('items', [])
+            if tracks:
+                fresh[(sentiment, keyword)] = {'tracks': tracks, 'refreshed_at': time.time()}
+
+        with self._lock:
+            self.pools = fresh
+            for combo in list(self.counts):
+                self.counts[combo] *= self.decay
+                if self.counts[combo] < 0.05:
+                    del self.counts[combo]
+        metrics.increment('candidate_pools.refreshed', len(fresh))
+        return len(fresh)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        print("🔥 Candidate pool refresher started")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        print("🛑 Candidate pool refresher stopped")
+
+    def _run(self):
+        # First refresh soon after traffic arrives, then on the regular interval
+        wait = min(30, self.refresh_interval)
+        while not self._stop_event.wait(wait):
+            try:
+                refreshed = self.refresh_once()
+                if refreshed:
+                    print(f"🔥 Refreshed {refreshed} candidate pools")
+            except Exception as e:
+                print(f"❌ Candidate pool refresh failed: {e}")
+            wait = self.refresh_interval if self.pools else min(30, self.refresh_interval)
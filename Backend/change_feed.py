@@ -0,0 +1,154 @@
+import threading
+from datetime import datetime, timezone
+from pymongo.errors import OperationFailure, PyMongoError
+
+all_emotions = ['happy', 'sad', 'angry', 'surprise', 'fear', 'disgust', 'neutral', 'skipped']
+
+# Error code returned by a standalone mongod for $changeStream
+CHANGE_STREAM_UNSUPPORTED = 40573
+
+
+def track_summary(doc):
+    """
+    Reduce a `tracks` document to the fields the dashboard shows
+    (score, emotion breakdown and dominant emotion).
+    """
+    emotion_counts = {emotion: doc.get(f'emotion_{emotion}', 0) for emotion in all_emotions}
+    return {
+        "track_id": doc.get('track_id'),
+        "score": doc.get('total_score', 0),
+        "emotion": max(emotion_counts, key=lambda k: emotion_counts[k]),
+        "emotion_breakdown": emotion_counts
+    }
+
+
+class TrackChangeWatcher:
+    def __init__(self, collection, on_change, poll_interval=2.0):
+        """
+        Watches the `tracks` collection and reports every change, whichever
+        process wrote it.
+
+        Uses a change stream when the server supports it (replica set or
+        sharded cluster) and falls back to polling `updated_at` on a
+        standalone mongod.
+
+        Args:
+            collection: pymongo Collection to watch
+            on_change (callable): Called with a change dict:
+                {'op': 'upsert', 'track': track_summary(...)},
+                {'op': 'delete', 'id': <_id>} or {'op': 'reset'}
+            poll_interval (float): Seconds between polls in fallback mode
+        """
+        self.collection = collection
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.mode = None
+        self._resume_token = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join(timeout=5.0)
+
+    def _emit(self, change):
+        try:
+            self.on_change(change)
+        except Exception as e:
+            print(f"⚠️ Track change callback failed: {e}")
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                if self.mode == 'poll':
+                    self._poll()
+                else:
+                    self._watch()
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAM_UNSUPPORTED or 'replica set' in str(e):
+                    print("ℹ️ Change streams unavailable (standalone mongod), polling tracks instead")
+                    self.mode = 'poll'
+                else:
+                    print(f"❌ Track change watcher error: {e}")
+                    self._stopped.wait(self.poll_interval)
+            except PyMongoError as e:
+                print(f"❌ Track change watcher error: {e}")
+                self._stopped.wait(self.poll_interval)
+
+    # --- Change stream mode ---
+
+    def _watch(self):
+        with self.collection.watch(full_document='updateLookup',
+                                   resume_after=self._resume_token) as stream:
+            self.mode = 'change_stream'
+            print("👀 Watching tracks with a change stream")
+            while not self._stopped.is_set():
+                change = stream.try_next()
+                if change is None:
+                    # try_next() already waited up to maxAwaitTimeMS
+                    continue
+                self._resume_token = stream.resume_token
+                if not self._handle_change(change):
+                    return
+
+    def _handle_change(self, change):
+        operation = change['operationType']
+        if operation in ('insert', 'update', 'replace'):
+            doc = change.get('fullDocument')
+            if doc:
+                self._emit({'op': 'upsert', 'track': track_summary(doc)})
+        elif operation == 'delete':
+            self._emit({'op': 'delete', 'id': change['documentKey']['_id']})
+        elif operation in ('drop', 'dropDatabase', 'rename', 'invalidate'):
+            # The stream is closed after an invalidate; start a fresh one
+            self._resume_token = None
+            self._emit({'op': 'reset'})
+            return False
+        return True
+
+    # --- Polling fallback ---
+
+    def _poll(self):
+        self.collection.create_index('updated_at')
+        last_seen = self._latest_update() or datetime.now(timezone.utc)
+        seen_at_last = set()
+        last_count = self.collection.estimated_document_count()
+        print("👀 Polling tracks for changes")
+        while not self._stopped.wait(self.poll_interval):
+            count = self.collection.estimated_document_count()
+            if count < last_count:
+                # Deletes leave nothing to poll for; make clients resync
+                self._emit({'op': 'reset'})
+            last_count = count
+
+            cursor = self.collection.find({'updated_at': {'$gte': last_seen}}).sort('updated_at', 1)
+            for doc in cursor:
+                updated_at = doc['updated_at']
+                if updated_at.tzinfo is None:
+                    updated_at = updated_at.replace(tzinfo=timezone.utc)
+                key = (doc['_id'], updated_at)
+                if key in seen_at_last:
+                    continue
+                if updated_at > last_seen:
+                    last_seen = updated_at
+                    seen_at_last = set()
+                seen_at_last.add(key)
+                self._emit({'op': 'upsert', 'track': track_summary(doc)})
+
+    def _latest_update(self):
+        doc = self.collection.find_one({'updated_at': {'$exists': True}},
+                                       sort=[('updated_at', -1)], projection={'updated_at': 1})
+        if not doc:
+            return None
+        updated_at = doc['updated_at']
+        if updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=timezone.utc)
+        return updated_at
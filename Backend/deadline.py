@@ -0,0 +1,98 @@
+"""
+End-to-end deadlines for request pipelines.
+
+A Deadline is created when a request arrives and handed down through each
+stage (Gemini analysis, Spotify search, playback). Every stage runs with the
+smaller of its own budget and the time left on the request, so one slow
+call can't hold a Flask worker past the overall budget.
+
+Python threads can't be killed, so a stage that overruns is abandoned: the
+worker returns at once, a call that hasn't started yet is cancelled, and the
+timeout is also passed to the client (Gemini request timeout, spotipy's
+requests_timeout) so the abandoned call finishes soon after.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from metrics import metrics
+
+# Seconds for a whole request and for each stage within it
+REQUEST_BUDGET = float(os.getenv("REQUEST_BUDGET_SECONDS", "10"))
+STAGE_BUDGETS = {
+    'analyze': float(os.getenv("ANALYZE_BUDGET_SECONDS", "6")),
+    'search': float(os.getenv("SEARCH_BUDGET_SECONDS", "3")),
+    'playback': float(os.getenv("PLAYBACK_BUDGET_SECONDS", "3")),
+}
+
+# Runs stage calls so the request thread can stop waiting on them
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='deadline')
+
+
+class DeadlineExceeded(TimeoutError):
+    def __init__(self, stage, budget):
+        super().__init__(f"{stage} did not finish within {budget:.1f}s")
+        self.stage = stage
+        self.budget = budget
+
+
+class Deadline:
+    def __init__(self, budget=None, stage_budgets=None):
+        """
+        Args:
+            budget (float): Seconds for the whole request (defaults to REQUEST_BUDGET)
+            stage_budgets (dict): Per-stage caps in seconds (defaults to STAGE_BUDGETS)
+        """
+        self.budget = REQUEST_BUDGET if budget is None else budget
+        self.stage_budgets = dict(STAGE_BUDGETS, **(stage_budgets or {}))
+        self.started = time.monotonic()
+
+    def remaining(self):
+        return max(0.0, self.budget - (time.monotonic() - self.started))
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout_for(self, stage):
+        """Seconds the stage may take: its own cap or what is left, whichever is smaller"""
+        return min(self.stage_budgets.get(stage, self.budget), self.remaining())
+
+    def run(self, stage, fn):
+        """
+        Run fn(timeout) within the stage's budget.
+
+        Latency is recorded in the stage.<name> histogram and overruns in the
+        deadline.<name>.timeout counter.
+
+        Args:
+            stage (str): Stage name ('analyze', 'search', 'playback', ...)
+            fn (callable): Called with the timeout in seconds, for passing on to clients
+
+        Returns:
+            fn's return value
+
+        Raises:
+            DeadlineExceeded: The stage ran out of time (or none was left)
+        """
+        timeout = self.timeout_for(stage)
+        if timeout <= 0:
+            metrics.increment(f"deadline.{stage}.timeout")
+            raise DeadlineExceeded(stage, 0.0)
+        started = time.perf_counter()
+        future = _executor.submit(fn, timeout)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            future.cancel()
+            metrics.increment(f"deadline.{stage}.timeout")
+            raise DeadlineExceeded(stage, timeout) from None
+        finally:
+            metrics.observe(f"stage.{stage}", (time.perf_counter() - started) * 1000)
+
+
+def run_stage(deadline, stage, fn):
+    """deadline.run(stage, fn), or fn(None) directly when there is no deadline"""
+    if deadline is None:
+        return fn(None)
+    return deadline.run(stage, fn)
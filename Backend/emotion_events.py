@@ -0,0 +1,153 @@
+import threading
+import time
+from datetime import datetime, timezone
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+# Retention for raw emotion events. The per-track emotion_* counters in
+# `tracks` are the long-lived rollup; raw events only need to live long
+# enough to re-score recent history.
+DEFAULT_RETENTION_SECONDS = 180 * 24 * 3600
+
+
+class EmotionEventLog:
+    def __init__(self, db, collection_name="emotion_events", batch_size=50,
+                 flush_interval=5.0, retention_seconds=DEFAULT_RETENTION_SECONDS):
+        """
+        Append-only log of emotion observations, stored in a MongoDB
+        time-series collection and written in batches.
+
+        Args:
+            db: pymongo Database the collection lives in
+            collection_name (str): Name of the event collection
+            batch_size (int): Flush as soon as this many events are buffered
+            flush_interval (float): Flush buffered events at least this often (seconds)
+            retention_seconds (int): TTL for raw events
+        """
+        self.db = db
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_seconds = retention_seconds
+        self.collection = None
+
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._flusher = None
+
+    def ensure_collection(self):
+        """Create the time-series collection (or a TTL-indexed fallback) if missing"""
+        if self.collection_name not in self.db.list_collection_names():
+            try:
+                self.db.create_collection(
+                    self.collection_name,
+                    timeseries={
+                        'timeField': 'timestamp',
+                        'metaField': 'meta',
+                        'granularity': 'seconds'
+                    },
+                    expireAfterSeconds=self.retention_seconds
+                )
+                print(f"✅ Created time-series collection '{self.collection_name}'")
+            except CollectionInvalid:
+                # Another process created it first
+                pass
+            except OperationFailure as e:
+                # Time-series collections need MongoDB 5.0+; fall back to a
+                # plain collection with a TTL index for retention.
+                print(f"⚠️ Time-series collections unavailable ({e}), using a TTL-indexed collection")
+                self.db[self.collection_name].create_index(
+                    'timestamp', expireAfterSeconds=self.retention_seconds
+                )
+
+        self.collection = self.db[self.collection_name]
+        self.collection.create_index([('meta.track_id', 1), ('timestamp', 1)])
+        self.collection.create_index([('meta.user_id', 1), ('timestamp', 1)])
+        try:
+            # The rollup materializer reads events in ingest order
+            self.collection.create_index('ingested_at')
+        except OperationFailure as e:
+            print(f"⚠️ Could not index ingested_at ({e}); rollups will scan by time")
+        return self.collection
+
+    def start(self):
+        """Ensure the collection exists and start the background flusher"""
+        if self.collection is None:
+            self.ensure_collection()
+        if self._flusher and self._flusher.is_alive():
+            return
+        self._stopped.clear()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    def stop(self):
+        """Stop the background flusher and write out anything still buffered"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._flusher:
+            self._flusher.join(timeout=5.0)
+        self.flush()
+
+    def record(self, track_id, emotion, score, probabilities=None,
+               progress_ms=None, user_id=None, timestamp=None):
+        """
+        Buffer one emotion observation.
+
+        Args:
+            track_id (str): Spotify track ID that was playing
+            emotion (str): Dominant emotion (happy, sad, ..., skipped)
+            score (int|float): Score change attributed to the observation
+            probabilities (dict): Emotion -> probability (0-1) from the detector
+            progress_ms (int): Playback position when the emotion was observed
+            user_id (str): Spotify user ID
+            timestamp (datetime): Observation time (defaults to now, UTC)
+        """
+        event = {
+            'timestamp': timestamp or datetime.now(timezone.utc),
+            'meta': {'user_id': user_id, 'track_id': track_id},
+            'emotion': emotion,
+            'score': score,
+            'probabilities': probabilities or {},
+            'progress_ms': progress_ms
+        }
+        with self._lock:
+            self._buffer.append(event)
+            should_flush = len(self._buffer) >= self.batch_size
+        if should_flush:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write all buffered events in a single insert_many"""
+        with self._lock:
+            if not self._buffer:
+                return 0
+            batch, self._buffer = self._buffer, []
+
+        if self.collection is None:
+            self.ensure_collection()
+        # Stamped per attempt, so a retried batch is still ahead of the
+        # materializer's checkpoint even though its timestamps are old
+        ingested_at = datetime.now(timezone.utc)
+        for event in batch:
+            event['ingested_at'] = ingested_at
+        try:
+            self.collection.insert_many(batch, ordered=False)
+            return len(batch)
+        except Exception as e:
+            print(f"❌ Error writing {len(batch)} emotion events: {e}")
+            # Put the batch back so the next flush retries it
+            with self._lock:
+                self._buffer = batch + self._buffer
+            return 0
+
+    def pending(self):
+        """Number of buffered events not yet written"""
+        with self._lock:
+            return len(self._buffer)
+
+    def _flush_loop(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(timeout=self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
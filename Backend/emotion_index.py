@@ -0,0 +1,200 @@
+"""
+In-memory nearest-neighbour index over track emotion profiles.
+
+Each tracks document is an 8-dimensional vector of reaction counts
+(emotion_happy ... emotion_skipped). Rows of a NumPy matrix hold the
+L2-normalized profiles, so "tracks that made me feel like this one did" is
+one matrix-vector product plus a partial sort. The index is built in bulk
+from MongoDB and kept current from the tracks change feed.
+
+    python emotion_index.py   # query latency at 100k tracks
+"""
+
+import threading
+import time
+import numpy as np
+from rollup import all_emotions
+
+INITIAL_CAPACITY = 1024
+
+
+def profile_vector(counts, dimensions=all_emotions):
+    """Emotion counts (dict keyed by emotion or emotion_<name>) as a float vector"""
+    return np.array(
+        [counts.get(emotion, counts.get(f'emotion_{emotion}', 0)) or 0 for emotion in dimensions],
+        dtype=np.float32
+    )
+
+
+class EmotionIndex:
+    def __init__(self, dimensions=None):
+        """
+        Args:
+            dimensions (list): Emotions making up a profile (defaults to rollup.all_emotions)
+        """
+        self.dimensions = list(dimensions or all_emotions)
+        self.collection = None
+        self._lock = threading.RLock()
+        self._reset(INITIAL_CAPACITY)
+
+    def _reset(self, capacity):
+        self._matrix = np.zeros((capacity, len(self.dimensions)), dtype=np.float32)
+        self._active = np.zeros(capacity, dtype=bool)
+        self._ids = []
+        self._rows = {}
+
+    def __len__(self):
+        return len(self._rows)
+
+    @staticmethod
+    def _normalize(vectors):
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+    def build(self, docs):
+        """
+        Replace the index with profiles from tracks documents.
+
+        Args:
+            docs (iterable): Documents with track_id and emotion_* counts
+
+        Returns:
+            int: Number of tracks indexed
+        """
+        ids = []
+        vectors = []
+        for doc in docs:
+            track_id = doc.get('track_id')
+            if track_id is None:
+                continue
+            ids.append(track_id)
+            vectors.append(profile_vector(doc, self.dimensions))
+        matrix = self._normalize(np.array(vectors, dtype=np.float32).reshape(-1, len(self.dimensions)))
+        with self._lock:
+            self._reset(max(INITIAL_CAPACITY, len(ids) * 2))
+            self._matrix[:len(ids)] = matrix
+            self._active[:len(ids)] = matrix.any(axis=1)
+            self._ids = ids
+            self._rows = {track_id: row for row, track_id in enumerate(ids)}
+        return len(ids)
+
+    def load_from_collection(self, collection):
+        """Build from a MongoDB tracks collection and remember it for reload()"""
+        self.collection = collection
+        projection = {'_id': 0, 'track_id': 1, **{f'emotion_{emotion}': 1 for emotion in self.dimensions}}
+        started = time.perf_counter()
+        count = self.build(collection.find({}, projection))
+        print(f"🧭 Emotion index built with {count} tracks in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return count
+
+    def reload(self):
+        """Rebuild from the collection passed to load_from_collection()"""
+        if self.collection is not None:
+            return self.load_from_collection(self.collection)
+        return 0
+
+    def upsert(self, track_id, counts):
+        """Add or update one track's profile from its emotion counts"""
+        vector = self._normalize(profile_vector(counts, self.dimensions))
+        with self._lock:
+            row = self._rows.get(track_id)
+            if row is None:
+                row = len(self._ids)
+                if row == len(self._matrix):
+                    self._grow()
+                self._ids.append(track_id)
+                self._rows[track_id] = row
+            self._matrix[row] = vector
+            self._active[row] = vector.any()
+
+    def remove(self, track_id):
+        with self._lock:
+            row = self._rows.pop(track_id, None)
+            if row is not None:
+                # Tombstone; the row is reclaimed by the next build()
+                self._active[row] = False
+                self._ids[row] = None
+
+    def _grow(self):
+        capacity = len(self._matrix) * 2
+        matrix = np.zeros((capacity, len(self.dimensions)), dtype=np.float32)
+        active = np.zeros(capacity, dtype=bool)
+        matrix[:len(self._matrix)] = self._matrix
+        active[:len(self._active)] = self._active
+        self._matrix, self._active = matrix, active
+
+    def profile(self, track_id):
+        """Normalized profile of an indexed track as {emotion: weight}, or None"""
+        with self._lock:
+            row = self._rows.get(track_id)
+            if row is None:
+                return None
+            return dict(zip(self.dimensions, self._matrix[row].tolist()))
+
+    def query(self, counts, k=10, exclude=()):
+        """
+        Tracks whose profiles are closest (cosine) to the given emotion counts.
+
+        Args:
+            counts (dict or array): Emotion counts or weights
+            k (int): Number of neighbours
+            exclude (iterable): track_ids to leave out
+
+        Returns:
+            list: (track_id, similarity) pairs, most similar first
+        """
+        if isinstance(counts, dict):
+            counts = profile_vector(counts, self.dimensions)
+        vector = self._normalize(np.asarray(counts, dtype=np.float32))
+        if not vector.any():
+            return []
+        with self._lock:
+            n = len(self._ids)
+            scores = self._matrix[:n] @ vector
+            scores[~self._active[:n]] = -np.inf
+            for track_id in exclude:
+                row = self._rows.get(track_id)
+                if row is not None:
+                    scores[row] = -np.inf
+            ids = self._ids
+        k = min(k, n)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k] if k < n else np.arange(n)
+        top = top[np.argsort(-scores[top])]
+        return [(ids[row], float(scores[row])) for row in top if np.isfinite(scores[row])]
+
+    def similar_to(self, track_id, k=10):
+        """Tracks that drew the most similar reactions to track_id"""
+        with self._lock:
+            row = self._rows.get(track_id)
+            if row is None:
+                return []
+            vector = self._matrix[row].copy()
+        return self.query(vector, k=k, exclude=[track_id])
+
+
+def benchmark(tracks=100_000, queries=200, k=10):
+    """Build time (ms) plus median and p95 query latency (ms) on random profiles"""
+    rng = np.random.default_rng(0)
+    counts = rng.poisson(2.0, size=(tracks, len(all_emotions)))
+    docs = [
+        {'track_id': f"track{i}", **{f'emotion_{e}': int(c) for e, c in zip(all_emotions, row)}}
+        for i, row in enumerate(counts)
+    ]
+    index = EmotionIndex()
+    started = time.perf_counter()
+    index.build(docs)
+    build_ms = (time.perf_counter() - started) * 1000
+    timings = []
+    for i in rng.integers(0, tracks, size=queries):
+        started = time.perf_counter()
+        index.similar_to(f"track{i}", k=k)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return build_ms, timings[len(timings) // 2], timings[int(len(timings) * 0.95)]
+
+
+if __name__ == "__main__":
+    build_ms, median_ms, p95_ms = benchmark()
+    print(f"📊 100,000 tracks: build {build_ms:.0f} ms, query median {median_ms:.2f} ms, p95 {p95_ms:.2f} ms")
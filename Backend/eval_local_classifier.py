@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Evaluate the local sentiment/keyword classifier against situation_eval.jsonl.
+
+The lexicon in local_classifier.py is built from situation_dev.jsonl only;
+situation_eval.jsonl is held out, and eval texts that also appear in the dev
+set are left out of the numbers. Reports the offload rate (share of texts
+answered without Gemini) and, for offloaded texts, agreement with the
+reference labels. With --live the same texts are sent to Gemini and agreement
+is measured against its answers; --write-labels stores those answers in the
+eval set (label_source "gemini") so later runs compare against Gemini without
+calling it.
+
+    python eval_local_classifier.py [--threshold 0.75] [--live [--write-labels]] [--dev]
+"""
+
+import argparse
+import json
+import os
+import time
+from analysis_cache import normalize_text
+from local_classifier import classify_situation, DEFAULT_CONFIDENCE_THRESHOLD
+from response_parser import normalize_sentiment
+
+EVAL_SET = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'situation_eval.jsonl')
+# Situations the lexicon was written from; never used for reported numbers
+DEV_SET = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'situation_dev.jsonl')
+
+
+def load_eval_set(path=EVAL_SET):
+    """Examples with reference sentiments mapped onto the shared vocabulary"""
+    with open(path) as f:
+        examples = [json.loads(line) for line in f if line.strip()]
+    for example in examples:
+        example['sentiment'] = normalize_sentiment(example['sentiment'])
+    return examples
+
+
+def write_eval_set(examples, path=EVAL_SET):
+    with open(path, 'w') as f:
+        for example in examples:
+            f.write(json.dumps(example) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offload rate and agreement of the local classifier")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_CONFIDENCE_THRESHOLD)
+    parser.add_argument('--live', action='store_true', help="Compare against live Gemini answers")
+    parser.add_argument('--write-labels', action='store_true', help="With --live, save Gemini's answers as the labels")
+    parser.add_argument('--dev', action='store_true', help="Score the development set instead (not a held-out result)")
+    args = parser.parse_args()
+
+    examples = load_eval_set(DEV_SET if args.dev else EVAL_SET)
+    if not args.dev:
+        seen = {normalize_text(example['text']) for example in load_eval_set(DEV_SET)}
+        overlap = [example for example in examples if normalize_text(example['text']) in seen]
+        if overlap:
+            print(f"⚠️ Leaving out {len(overlap)} eval situations that are also in the dev set")
+            examples = [example for example in examples if normalize_text(example['text']) not in seen]
+    if args.live:
+        from situation import analyze_text_sentiment_and_keyword, extract_json_from_response
+        for example in examples:
+            parsed = extract_json_from_response(analyze_text_sentiment_and_keyword(example['text']))
+            example['sentiment'] = parsed['sentiment']
+            example['keyword'] = parsed['keyword']
+            example['label_source'] = 'gemini'
+        if args.write_labels and not args.dev:
+            write_eval_set(examples)
+            print(f"💾 Saved Gemini labels for {len(examples)} situations to {EVAL_SET}")
+
+    offloaded = sentiment_agree = keyword_agree = 0
+    started = time.perf_counter()
+    for example in examples:
+        result = classify_situation(example['text'], args.threshold)
+        if result is None:
+            continue
+        offloaded += 1
+        sentiment_agree += result['sentiment'] == example['sentiment']
+        keyword_agree += result['keyword'] == example['keyword']
+        if result['sentiment'] != example['sentiment'] or result['keyword'] != example['keyword']:
+            print(f"  ≠ {example['text']!r}: local {result['sentiment']}/{result['keyword']}, "
+                  f"reference {example['sentiment']}/{example['keyword']}")
+    elapsed_us = (time.perf_counter() - started) * 1_000_000 / len(examples)
+
+    sources = sorted({example.get('label_source', 'hand') for example in examples})
+    source = "Gemini (live)" if args.live else f"reference labels ({', '.join(sources)})"
+    name = "development" if args.dev else "held-out"
+    print(f"\n📊 {len(examples)} {name} situations, threshold {args.threshold}")
+    print(f"   Offload rate: {offloaded / len(examples):.0%} ({offloaded} answered locally)")
+    if offloaded:
+        print(f"   Agreement with {source} on offloaded texts: "
+              f"sentiment {sentiment_agree / offloaded:.0%}, keyword {keyword_agree / offloaded:.0%}")
+    print(f"   Local classification: {elapsed_us:.1f} µs per text")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Maintained top-K tracks per emotion ("top happy tracks", "most skipped").
+
+Each emotion has a min-heap of its K highest counts. Updates from the tracks
+change feed adjust the heaps in O(log K), so reading a leaderboard never
+touches the collection. After a restart (or a delete) the heaps are rebuilt
+in one streaming pass over the collection.
+
+Incremental updates only ever raise emotion counts, which is what lets a
+bounded heap stay exact: a track that falls off a board can only come back
+with a higher count, and that update brings it back. A rollup rebuild
+(`rollup.py --rebuild`) rewrites counts and can lower them; when an update
+lowers the count of a track on a board, the boards are marked stale and
+reseeded from the collection on the next read.
+"""
+
+import heapq
+import threading
+import time
+from rollup import all_emotions
+
+DEFAULT_K = 100
+
+
+class TopK:
+    def __init__(self, k):
+        """
+        Top k (count, track_id) entries. The heap may hold outdated entries for
+        members whose count has since grown; they are skipped and compacted.
+        """
+        self.k = k
+        self.heap = []
+        self.members = {}  # track_id -> current count
+        self._sorted = None
+
+    def _prune(self):
+        # Drop outdated entries sitting at the top of the heap
+        while self.heap and self.members.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+
+    def update(self, track_id, count):
+        """Record track_id's current count"""
+        if count <= 0:
+            return
+        if track_id in self.members:
+            if self.members[track_id] == count:
+                return
+            self.members[track_id] = count
+            heapq.heappush(self.heap, (count, track_id))
+            if len(self.heap) > 2 * self.k:
+                self.heap = [(c, t) for t, c in self.members.items()]
+                heapq.heapify(self.heap)
+        elif len(self.members) < self.k:
+            self.members[track_id] = count
+            heapq.heappush(self.heap, (count, track_id))
+        else:
+            self._prune()
+            if (count, track_id) <= self.heap[0]:
+                return
+            _, evicted = heapq.heapreplace(self.heap, (count, track_id))
+            del self.members[evicted]
+            self.members[track_id] = count
+        self._sorted = None
+
+    def top(self, n=None):
+        """Members as [(track_id, count)], highest first"""
+        if self._sorted is None:
+            self._sorted = sorted(self.members.items(), key=lambda item: (item[1], item[0]), reverse=True)
+        return self._sorted[:n] if n is not None else list(self._sorted)
+
+
+class Leaderboards:
+    def __init__(self, k=DEFAULT_K, dimensions=None):
+        """
+        Args:
+            k (int): Tracks kept per leaderboard
+            dimensions (list): Emotions with a leaderboard (defaults to rollup.all_emotions)
+        """
+        self.k = k
+        self.dimensions = list(dimensions or all_emotions)
+        self.boards = {emotion: TopK(k) for emotion in self.dimensions}
+        self.collection = None
+        self._stale = False
+        self._lock = threading.Lock()
+
+    def update(self, track_id, counts):
+        """
+        Apply a track's latest emotion counts.
+
+        Args:
+            track_id (str): Spotify track ID
+            counts (dict): Counts keyed by emotion or emotion_<name>
+        """
+        with self._lock:
+            for emotion, board in self.boards.items():
+                count = counts.get(emotion, counts.get(f'emotion_{emotion}')) or 0
+                current = board.members.get(track_id)
+                if current is not None and count < current:
+                    # Only a rebuild lowers a count; the heap no longer knows
+                    # which track should take this one's place
+                    self._stale = True
+                if count:
+                    board.update(track_id, count)
+
+    def top(self, emotion, n=10):
+        """
+        Highest-count tracks for an emotion.
+
+        Returns:
+            list: [(track_id, count)], at most min(n, k) entries
+
+        Raises:
+            KeyError: Unknown emotion
+        """
+        if self._stale and self.collection is not None:
+            self.reload()
+        with self._lock:
+            return self.boards[emotion].top(min(n, self.k))
+
+    def rebuild(self, docs):
+        """
+        Recompute every leaderboard in one pass over tracks documents.
+
+        Returns:
+            int: Number of documents scanned
+        """
+        # Updates that lower a count during the scan mark the boards stale again
+        self._stale = False
+        heaps = {emotion: [] for emotion in self.dimensions}
+        scanned = 0
+        for doc in docs:
+            scanned += 1
+            track_id = doc.get('track_id')
+            if track_id is None:
+                continue
+            for emotion, heap in heaps.items():
+                count = doc.get(f'emotion_{emotion}') or 0
+                if count <= 0:
+                    continue
+                if len(heap) < self.k:
+                    heapq.heappush(heap, (count, track_id))
+                elif (count, track_id) > heap[0]:
+                    heapq.heapreplace(heap, (count, track_id))
+
+        boards = {}
+        for emotion, heap in heaps.items():
+            board = TopK(self.k)
+            board.heap = heap
+            board.members = {track_id: count for count, track_id in heap}
+            boards[emotion] = board
+        with self._lock:
+            self.boards = boards
+        return scanned
+
+    def load_from_collection(self, collection):
+        """Rebuild from a MongoDB tracks collection and remember it for reload()"""
+        self.collection = collection
+        projection = {'_id': 0, 'track_id': 1, **{f'emotion_{emotion}': 1 for emotion in self.dimensions}}
+        started = time.perf_counter()
+        scanned = self.rebuild(collection.find({}, projection, batch_size=1000))
+        print(f"🏆 Leaderboards rebuilt from {scanned} tracks in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return scanned
+
+    def reload(self):
+        """Rebuild from the collection passed to load_from_collection()"""
+        if self.collection is not None:
+            return self.load_from_collection(self.collection)
+        return 0
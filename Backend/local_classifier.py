@@ -0,0 +1,181 @@
+"""
+Lexicon-based sentiment/keyword classifier for short, obvious situations.
+
+Text such as "I just got broken up with" does not need an LLM round trip:
+classify_situation() answers it offline in microseconds and returns None for
+anything ambiguous, which is then escalated to Gemini.
+
+The lexicons are written from the situations in situation_dev.jsonl; keep
+situation_eval.jsonl out of them so eval_local_classifier.py measures text
+the lexicon has not seen.
+"""
+
+from analysis_cache import normalize_text
+from metrics import metrics
+
+# Cue words/phrases per sentiment, with weights
+SENTIMENT_LEXICON = {
+    'happy': {
+        'happy': 2, 'glad': 2, 'great': 1, 'amazing': 2, 'awesome': 2, 'wonderful': 2,
+        'promotion': 2, 'promoted': 2, 'won': 2, 'passed': 2, 'engaged': 2, 'married': 1,
+        'celebrate': 2, 'celebrating': 2, 'birthday': 1, 'vacation': 1, 'holiday': 1,
+        'love it': 2, 'got the job': 3, 'good news': 2, 'best day': 3, 'finally': 1,
+        'proud': 2, 'grateful': 2, 'thankful': 2, 'fun': 1, 'party': 1,
+    },
+    'sad': {
+        'sad': 2, 'broke up': 3, 'broken up': 3, 'breakup': 3, 'dumped': 3, 'divorce': 3,
+        'lonely': 2, 'alone': 1, 'miss': 1, 'missing': 1, 'lost': 1, 'died': 3, 'passed away': 3,
+        'funeral': 3, 'cry': 2, 'crying': 2, 'depressed': 3, 'heartbroken': 3, 'failed': 2,
+        'rejected': 2, 'fired': 2, 'laid off': 3, 'grief': 3, 'hurt': 1, 'down': 1,
+    },
+    'angry': {
+        'angry': 3, 'mad': 2, 'furious': 3, 'hate': 2, 'annoyed': 2, 'annoying': 2,
+        'pissed': 3, 'rage': 3, 'unfair': 2, 'cheated': 2, 'betrayed': 2, 'lied': 2,
+        'yelled': 2, 'frustrated': 2, 'fed up': 3,
+    },
+    'anxious': {
+        'anxious': 3, 'nervous': 3, 'worried': 3, 'stressed': 3, 'stress': 2, 'scared': 2,
+        'afraid': 2, 'panic': 3, 'exam tomorrow': 3, 'deadline': 2, 'overwhelmed': 3,
+        'interview tomorrow': 3, 'cant sleep': 2, "can't sleep": 2,
+    },
+    'calm': {
+        'calm': 3, 'relaxed': 3, 'relaxing': 3, 'chill': 3, 'peaceful': 3, 'lazy': 2,
+        'sunday': 1, 'rainy day': 2, 'reading': 1, 'tea': 1, 'meditate': 3, 'unwind': 3,
+    },
+    'energetic': {
+        'workout': 3, 'gym': 3, 'running': 2, 'run': 1, 'pumped': 3, 'hype': 3, 'hyped': 3,
+        'energetic': 3, 'dance': 2, 'dancing': 2, 'road trip': 2, 'game day': 2,
+    },
+}
+
+# Cue words/phrases per topic keyword
+KEYWORD_LEXICON = {
+    'love': ['broke up', 'broken up', 'breakup', 'dumped', 'boyfriend', 'girlfriend', 'crush', 'heartbroken',
+             'date', 'dating', 'relationship', 'divorce', 'engaged', 'married', 'wedding',
+             'partner', 'ex', 'husband', 'wife', 'kissed'],
+    'work': ['job', 'boss', 'promotion', 'promoted', 'fired', 'laid off', 'work', 'office',
+             'interview', 'coworker', 'colleague', 'deadline', 'meeting', 'salary', 'career',
+             'got the job', 'interview tomorrow'],
+    'school': ['exam', 'test', 'class', 'homework', 'grade', 'grades', 'school', 'college',
+               'university', 'teacher', 'finals', 'graduation', 'graduated', 'passed', 'exam tomorrow'],
+    'family': ['mom', 'dad', 'mother', 'father', 'sister', 'brother', 'family', 'parents',
+               'grandma', 'grandpa', 'grandmother', 'grandfather', 'son', 'daughter', 'baby'],
+    'friends': ['friend', 'friends', 'bestie', 'roommate', 'party', 'hang out', 'hanging out'],
+    'health': ['sick', 'hospital', 'doctor', 'ill', 'injury', 'injured', 'surgery', 'covid'],
+    'loss': ['died', 'passed away', 'funeral', 'grief', 'lost my'],
+    'fitness': ['workout', 'gym', 'running', 'run', 'training', 'marathon', 'game day'],
+    'travel': ['vacation', 'holiday', 'trip', 'road trip', 'flight', 'travel', 'traveling'],
+    'relaxation': ['sunday', 'rainy day', 'reading', 'tea', 'meditate', 'unwind', 'chill'],
+}
+
+NEGATIONS = {'not', 'no', 'never', "don't", "didn't", "isn't", "wasn't", "can't", "won't", 'without'}
+CONTRASTS = {'but', 'although', 'though', 'however', 'yet'}
+
+DEFAULT_CONFIDENCE_THRESHOLD = 0.75
+MAX_TOKENS = 25
+
+
+def _build_phrase_table():
+    """Map each cue phrase (as a token tuple) to its sentiment weights and keywords"""
+    table = {}
+    for sentiment, cues in SENTIMENT_LEXICON.items():
+        for phrase, weight in cues.items():
+            entry = table.setdefault(tuple(phrase.split()), ({}, set()))
+            entry[0][sentiment] = weight
+    for keyword, cues in KEYWORD_LEXICON.items():
+        for phrase in cues:
+            entry = table.setdefault(tuple(phrase.split()), ({}, set()))
+            entry[1].add(keyword)
+    return table
+
+
+_PHRASES = _build_phrase_table()
+_MAX_PHRASE_LENGTH = max(len(phrase) for phrase in _PHRASES)
+
+
+def score_situation(text):
+    """
+    Score normalized text against the lexicons in one left-to-right scan,
+    preferring the longest cue at each position ("passed away" over "passed").
+
+    Returns:
+        tuple: ({sentiment: score}, {keyword: hits}, negated (bool), tokens (list))
+    """
+    tokens = normalize_text(text).split()
+    sentiment_scores = {}
+    keyword_hits = {}
+    negated = False
+    i = 0
+    while i < len(tokens):
+        for length in range(min(_MAX_PHRASE_LENGTH, len(tokens) - i), 0, -1):
+            entry = _PHRASES.get(tuple(tokens[i:i + length]))
+            if entry is None:
+                continue
+            weights, keywords = entry
+            for keyword in keywords:
+                keyword_hits[keyword] = keyword_hits.get(keyword, 0) + 1
+            if weights:
+                # A negation in the three preceding words flips the meaning
+                if NEGATIONS.intersection(tokens[max(0, i - 3):i]):
+                    negated = True
+                else:
+                    for sentiment, weight in weights.items():
+                        sentiment_scores[sentiment] = sentiment_scores.get(sentiment, 0) + weight
+            i += length
+            break
+        else:
+            i += 1
+    return sentiment_scores, keyword_hits, negated, tokens
+
+
+def classify_situation(text, threshold=DEFAULT_CONFIDENCE_THRESHOLD):
+    """
+    Classify text locally when the answer is clear.
+
+    Args:
+        text (str): Situation text
+        threshold (float): Minimum confidence (0-1) to answer without Gemini
+
+    Returns:
+        dict: {'sentiment', 'keyword', 'confidence'} or None to escalate
+    """
+    sentiment_scores, keyword_hits, negated, tokens = score_situation(text)
+    if not sentiment_scores or not keyword_hits or not tokens:
+        return None
+    # Long, negated or contrasting text is left to the LLM
+    if negated or len(tokens) > MAX_TOKENS or CONTRASTS.intersection(tokens):
+        return None
+
+    ranked = sorted(sentiment_scores.items(), key=lambda item: item[1], reverse=True)
+    sentiment, top = ranked[0]
+    runner_up = ranked[1][1] if len(ranked) > 1 else 0
+    # Share of the evidence held by the winner, discounted when evidence is thin
+    confidence = (top / (top + runner_up)) * min(1.0, top / 3)
+
+    keywords = sorted(keyword_hits.items(), key=lambda item: item[1], reverse=True)
+    if len(keywords) > 1 and keywords[0][1] == keywords[1][1]:
+        # Tied topics make the keyword a guess
+        confidence *= 0.8
+    keyword = keywords[0][0]
+
+    if confidence < threshold:
+        return None
+    return {'sentiment': sentiment, 'keyword': keyword, 'confidence': round(confidence, 3)}
+
+
+def classify_or_escalate(text, escalate, threshold=DEFAULT_CONFIDENCE_THRESHOLD):
+    """
+    Answer locally when confident, otherwise call escalate() (the Gemini path).
+    Offload and escalation counts are reported as local_classifier.* metrics.
+
+    Returns:
+        dict: {'sentiment', 'keyword'} plus 'source' ('local', or 'llm' unless escalate() set one)
+    """
+    result = classify_situation(text, threshold)
+    if result is not None:
+        metrics.increment('local_classifier.offloaded')
+        return {'sentiment': result['sentiment'], 'keyword': result['keyword'], 'source': 'local'}
+    metrics.increment('local_classifier.escalated')
+    result = dict(escalate())
+    result.setdefault('source', 'llm')
+    return result
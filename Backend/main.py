@@ -4,11 +4,13 @@ from dotenv import load_dotenv
 import os
 import time
 import threading
-import cv2
-import numpy as np
-from deepface import DeepFace
 from datetime import datetime, timedelta
 from mongoDB import MongoDBManager
+from emotion_events import EmotionEventLog
+from rollup import RollupMaterializer
+from sessions import Sessionizer
+from scoring import score_from_emotions
+from services import VisionService, get_spotify
 import requests
 from monitoring_flag import get_main_monitoring_should_stop
 
@@ -17,11 +19,22 @@ previous_track_id = None
 previous_timestamp = None
 skip_threshold_seconds = 10  # Consider it a skip if track changes within 10 seconds (reduced from 30)
 mongo_manager = None
+event_log = None
+rollup_materializer = None
+sessionizer = None
+current_user_id = None
+latest_progress_ms = None
+latest_playback = None
+
+# OpenCV/DeepFace are only loaded once the webcam is started
+vision = VisionService()
 
 # Globals for webcam and emotion detection
 webcam_active = False
 webcam_thread = None
 current_emotion = None
+current_emotion_scores = None
+current_face_confidence = None
 emotion_lock = threading.Lock()
 
 # Add globals for distance and volume
@@ -54,20 +67,26 @@ def auth():
 
     
 def getCurr(sp):
+    global latest_progress_ms, latest_playback
     current = sp.current_playback()
+    latest_playback = current
     
     if current is None or current.get('item') is None:
         print("No track currently playing")
+        latest_progress_ms = None
         return None
         
     track_id = current['item']['id']
+    latest_progress_ms = current.get('progress_ms')
     print(f"Currently playing track ID: {track_id}")
     return track_id
 
-def check_skip(sp):
+def check_skip(sp, now=None):
     """
     Check if the current track was skipped by comparing with previous track
     Returns True if a skip is detected, False otherwise
+
+    now (datetime) overrides the clock, e.g. when replaying recorded snapshots
     """
     global previous_track_id, previous_timestamp
     
@@ -78,7 +97,7 @@ def check_skip(sp):
         return False
     
     current_track_id = current['item']['id']
-    current_timestamp = datetime.now()
+    current_timestamp = now or datetime.now()
     
     print(f"🔍 Skip check: Current track ID: {current_track_id}")
     print(f"🔍 Skip check: Previous track ID: {previous_track_id}")
@@ -130,8 +149,48 @@ def skipped():
         print(f"Error checking for skips: {e}")
         return False
 
+def process_tick(sp, emotion=None, probabilities=None, now=None, face_confidence=None):
+    """
+    One monitoring tick: score the emotion seen for the playing track and
+    record a skip if the track just changed. replay_harness.py drives this
+    with recorded snapshots.
+
+    Args:
+        sp: Spotify client (anything with current_playback())
+        emotion (str): Latest detected emotion, or None
+        probabilities (dict): Emotion probabilities from the detector
+        now (datetime): Tick time (defaults to the clock)
+        face_confidence (float): Face detection confidence (0-1), None if unknown
+
+    Returns:
+        str: The playing track ID, or None
+    """
+    # A skip is charged to the track that was playing at the last tick,
+    # at the last position seen on it
+    skipped_track, skipped_progress_ms = previous_track_id, latest_progress_ms
+    curr = getCurr(sp)
+    if sessionizer:
+        sessionizer.observe_playback(latest_playback, now)
+    if curr is None:
+        return None
+    if emotion:
+        print(f"Current emotion is '{emotion}' for track {curr}")
+        # One confident reaction is worth a full point, an unsure one a fraction
+        score = score_from_emotions(probabilities, face_confidence, emotion)
+        if sessionizer:
+            sessionizer.observe_emotion(emotion, score, now)
+        if score != 0:
+            addDB(curr, score, emotion, probabilities=probabilities, progress_ms=latest_progress_ms, timestamp=now)
+    # Check for skips
+    if check_skip(sp, now=now):
+        # Use a specific emotion for skips
+        if sessionizer:
+            sessionizer.observe_emotion("skipped", -1, now)
+        addDB(skipped_track, -1, "skipped", progress_ms=skipped_progress_ms, timestamp=now)
+    return curr
+
 def initDB():
-    global mongo_manager
+    global mongo_manager, event_log, rollup_materializer, sessionizer
     connection_string = os.getenv('MONGODB_URI')
     if not connection_string:
         print("❌ MONGODB_URI environment variable not set. Please set it in a .env file.")
@@ -139,21 +198,38 @@ def initDB():
     mongo_manager = MongoDBManager(connection_string, "spotilike", "tracks")
     if not mongo_manager.connect():
         return None
+    mongo_manager.ensure_track_indexes()
+    mongo_manager.backfill_decay_rank()
+    event_log = EmotionEventLog(mongo_manager.db, flush_interval=2.0)
+    event_log.start()
+    rollup_materializer = RollupMaterializer(mongo_manager.db)
+    rollup_materializer.start()
+    sessionizer = Sessionizer(mongo_manager.db)
+    sessionizer.ensure_indexes()
     return mongo_manager
 
-def addDB(track_id, score, emotion="neutral"):
+def addDB(track_id, score, emotion="neutral", probabilities=None, progress_ms=None, timestamp=None):
+    """
+    Record an emotion reaction to a track.
+
+    timestamp (datetime, UTC) is when the reaction happened (defaults to now),
+    e.g. the tick time when replaying recorded snapshots
+    """
     if mongo_manager:
-        # Always update the database with the new emotion tracking structure
-        mongo_manager.update_track_score(track_id, score, emotion)
+        if event_log and rollup_materializer:
+            # Append the raw observation to the event log; the materializer
+            # folds it into the emotion_* counters
+            event_log.record(track_id, emotion, score,
+                             probabilities=probabilities,
+                             progress_ms=progress_ms,
+                             user_id=current_user_id,
+                             timestamp=timestamp)
+            print(f"Track {track_id} logged with emotion '{emotion}' and score {score}")
+            return
+
+        # Without the event log, update the counters directly
+        mongo_manager.update_track_score(track_id, score, emotion, timestamp=timestamp)
         print(f"Track {track_id} updated with emotion '{emotion}' and score {score}")
-        
-        # Notify frontend about database update
-        try:
-            from app import notify_db_update
-            notify_db_update()
-        except ImportError:
-            # If app.py is not available, just pass
-            pass
 
 def notify_frontend_update():
     """Notify the frontend that the database has been updated"""
@@ -193,10 +269,11 @@ def stop_webcam():
 
 def webcam_emotion_detection():
     """Function to run in a thread for continuous emotion detection"""
-    global webcam_active, current_emotion, latest_face_distance, latest_face_volume
+    global webcam_active, current_emotion, current_emotion_scores, current_face_confidence
+    global latest_face_distance, latest_face_volume
     
     try:
-        cap = cv2.VideoCapture(0)
+        cap = vision.open_camera(0)
         if not cap.isOpened():
             print("Error: Could not open webcam")
             webcam_active = False
@@ -218,23 +295,33 @@ def webcam_emotion_detection():
             if current_time - last_process_time > process_interval:
                 try:
                     # Analyze emotions
-                    result = DeepFace.analyze(frame, actions=['emotion'], enforce_detection=False)
+                    result = vision.analyze_emotion(frame)
                     
                     # Extract the dominant emotion
                     if isinstance(result, list) and len(result) > 0:
-                        detected_emotion = result[0].get('dominant_emotion', 'neutral')
-                    elif isinstance(result, dict):
+                        result = result[0]
+                    if isinstance(result, dict):
                         detected_emotion = result.get('dominant_emotion', 'neutral')
+                        # DeepFace reports percentages; store probabilities (0-1)
+                        detected_scores = {
+                            emo: round(float(value) / 100.0, 4)
+                            for emo, value in (result.get('emotion') or {}).items()
+                        }
+                        face_confidence = result.get('face_confidence')
                     else:
                         detected_emotion = 'neutral'
+                        detected_scores = None
+                        face_confidence = None
                     
                     # Update current emotion with thread safety
                     with emotion_lock:
                         current_emotion = detected_emotion
+                        current_emotion_scores = detected_scores
+                        current_face_confidence = face_confidence
                     
                     # --- Distance and Volume Calculation ---
                     # Use DeepFace.extract_faces to get face width
-                    faces = DeepFace.extract_faces(frame, detector_backend='opencv')
+                    faces = vision.extract_faces(frame, detector_backend='opencv')
                     if faces and len(faces) > 0:
                         w = faces[0]['facial_area']['w']
                         from FaceModel.realtime_recognition import calculate_distance, map_distance_to_volume
@@ -265,6 +352,16 @@ def get_current_emotion():
     with emotion_lock:
         return current_emotion
 
+def get_current_emotion_scores():
+    """Get the probabilities behind the current detected emotion safely"""
+    with emotion_lock:
+        return dict(current_emotion_scores) if current_emotion_scores else None
+
+def get_current_face_confidence():
+    """Get how confident the detector was that it saw a face, safely"""
+    with emotion_lock:
+        return current_face_confidence
+
 def get_webcam_status():
     """Get current webcam and emotion detection status"""
     global webcam_active, current_emotion
@@ -274,6 +371,10 @@ def get_webcam_status():
             "current_emotion": current_emotion
         }
 
+def get_current_session():
+    """Aggregates for the listening session in progress, or None"""
+    return sessionizer.current() if sessionizer else None
+
 def get_latest_distance_and_volume():
     global latest_face_distance, latest_face_volume
     return {
@@ -302,11 +403,18 @@ def runModel():
         return "neutral"
 
 def main():
-    global current_emotion
+    global current_emotion, current_user_id
     if not initDB():
         print("Failed to initialize database connection. Exiting.")
         return
     start_webcam()
+    try:
+        current_user_id = get_spotify().current_user()['id']
+        sessionizer.user_id = current_user_id
+    except Exception as e:
+        print(f"Could not resolve Spotify user for the event log: {e}")
+    # Once the user is known, so this user's leftover sessions are closed too
+    sessionizer.close_stale()
     try:
         while True:
             # Check if the stop flag is set
@@ -314,30 +422,25 @@ def main():
                 print("🛑 Stop flag detected, exiting main loop.")
                 break
             try:
-                sp = auth()
-                curr = getCurr(sp)
-                if curr is not None:
-                    # Get the latest emotion from the webcam thread
-                    emotion = get_current_emotion()
-                    if emotion:
-                        print(f"Current emotion is '{emotion}' for track {curr}")
-                        score = 0
-                        if emotion in positive_emotions:
-                            score = 1
-                        elif emotion in negative_emotions:
-                            score = -1
-                        if score != 0:
-                            addDB(curr, score, emotion)
-                    # Check for skips
-                    sp_for_skip = auth()
-                    if check_skip(sp_for_skip):
-                        # Use a specific emotion for skips
-                        addDB(curr, -1, "skipped")
+                # One shared client for the whole loop instead of a new one per tick
+                sp = get_spotify()
+                # Get the latest emotion from the webcam thread
+                process_tick(sp, get_current_emotion(), get_current_emotion_scores(),
+                             face_confidence=get_current_face_confidence())
             except Exception as e:
                 print(f"Error in main loop: {e}")
             time.sleep(5)
     finally:
         stop_webcam()
+        if sessionizer:
+            sessionizer.close()
+        if event_log:
+            event_log.stop()
+        if rollup_materializer:
+            # Fold what was just flushed before shutting down; the log is
+            # flushed, so nothing is left in flight to settle
+            rollup_materializer.stop()
+            rollup_materializer.run_once(settle_seconds=0)
         print("Program terminated.")
 
 if __name__ == "__main__":
@@ -0,0 +1,87 @@
+import bisect
+import threading
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open
+DEFAULT_BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+class LatencyHistogram:
+    def __init__(self, buckets_ms=None):
+        """Fixed-bucket latency histogram (milliseconds)"""
+        self.buckets_ms = list(buckets_ms or DEFAULT_BUCKETS_MS)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value_ms):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets_ms, value_ms)] += 1
+            self.count += 1
+            self.total_ms += value_ms
+            self.max_ms = max(self.max_ms, value_ms)
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given percentile (0-1)"""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = fraction * self.count
+            seen = 0
+            for i, bucket_count in enumerate(self.counts):
+                seen += bucket_count
+                if seen >= rank:
+                    return self.buckets_ms[i] if i < len(self.buckets_ms) else self.max_ms
+            return self.max_ms
+
+    def snapshot(self):
+        with self._lock:
+            buckets = {f"le_{bound}": count for bound, count in zip(self.buckets_ms, self.counts)}
+            buckets['le_inf'] = self.counts[-1]
+            count, total_ms, max_ms = self.count, self.total_ms, self.max_ms
+        return {
+            "count": count,
+            "avg_ms": round(total_ms / count, 2) if count else None,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "max_ms": round(max_ms, 2),
+            "buckets": buckets
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """Process-wide counters and latency histograms, reported by /api/metrics"""
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def histogram(self, name):
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = LatencyHistogram()
+            return self._histograms[name]
+
+    def observe(self, name, value_ms):
+        self.histogram(name).observe(value_ms)
+
+    def counter(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = dict(self._histograms)
+        return {
+            "counters": counters,
+            "latency": {name: histogram.snapshot() for name, histogram in histograms.items()}
+        }
+
+
+metrics = MetricsRegistry()
@@ -1,13 +1,102 @@
 import os
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError, DuplicateKeyError
 from dotenv import load_dotenv
 import json
-from datetime import datetime
+import math
+import uuid
+from datetime import datetime, timedelta, timezone
+from scoring import decay_update_stages, rank_key, top_by_decayed_score
 
 # Load environment variables
 load_dotenv()
 
+all_emotions = ['happy', 'sad', 'angry', 'surprise', 'fear', 'disgust', 'neutral', 'skipped']
+
+# A revision allocated this long ago and never released is treated as abandoned
+PENDING_REVISION_SECONDS = 60
+
+def next_revision(db, collection_name):
+    """
+    Atomically allocate the next revision number for a collection.
+    Documents written with this revision are returned by "changes since" queries.
+
+    The revision is leased until release_revision() is called after the write
+    that uses it; get_revision()'s safe_rev stays below it until then. The
+    lease is pushed in the same update that bumps the counter, carrying a
+    floor read beforehand, so a reader never sees the new revision without
+    the lease that holds safe_rev back.
+
+    Args:
+        db: pymongo Database
+        collection_name (str): Collection the revision counter belongs to
+
+    Returns:
+        int: The new revision
+    """
+    revisions = db['revisions']
+    floor = (revisions.find_one({'_id': collection_name}, {'rev': 1}) or {}).get('rev', 0)
+    token = uuid.uuid4().hex
+    doc = revisions.find_one_and_update(
+        {'_id': collection_name},
+        {
+            '$inc': {'rev': 1},
+            '$push': {'pending': {'token': token, 'floor': floor, 'at': datetime.now(timezone.utc)}},
+            '$setOnInsert': {'reset_rev': 0}
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    revisions.update_one({'_id': collection_name, 'pending.token': token}, {'$set': {'pending.$.rev': doc['rev']}})
+    return doc['rev']
+
+def release_revision(db, collection_name, rev):
+    """Mark the write stamped with `rev` as landed (or failed), dropping abandoned leases too"""
+    revisions = db['revisions']
+    revisions.update_one({'_id': collection_name}, {'$pull': {'pending': {'rev': rev}}})
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=PENDING_REVISION_SECONDS)
+    revisions.update_one(
+        {'_id': collection_name, 'pending.at': {'$lt': cutoff}},
+        {'$pull': {'pending': {'at': {'$lt': cutoff}}}}
+    )
+
+def get_revision(db, collection_name):
+    """
+    Current revision state of a collection.
+
+    Returns:
+        dict: {'rev': latest revision, 'reset_rev': revision of the last reset,
+            'safe_rev': highest revision with no write still in flight at or
+            below it; what "changes since" clients should resume from}
+    """
+    doc = db['revisions'].find_one({'_id': collection_name}) or {}
+    rev = doc.get('rev', 0)
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=PENDING_REVISION_SECONDS)
+    # A lease not yet stamped with its revision is bounded by its floor
+    in_flight = [
+        entry.get('rev', entry['floor'] + 1) for entry in doc.get('pending', [])
+        if entry['at'].replace(tzinfo=entry['at'].tzinfo or timezone.utc) > cutoff
+    ]
+    safe_rev = min(in_flight) - 1 if in_flight else rev
+    return {'rev': rev, 'reset_rev': doc.get('reset_rev', 0), 'safe_rev': safe_rev}
+
+def reset_revision(db, collection_name):
+    """
+    Record that a collection was emptied or had documents deleted, so
+    clients holding an older revision fetch a full snapshot instead of a
+    delta (a delta cannot show a document that is gone).
+    """
+    doc = db['revisions'].find_one_and_update(
+        {'_id': collection_name},
+        [
+            {'$set': {'rev': {'$add': [{'$ifNull': ['$rev', 0]}, 1]}}},
+            {'$set': {'reset_rev': '$rev'}}
+        ],
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return doc['rev']
+
 class MongoDBManager:
     def __init__(self, connection_string=None, database_name="spotilike", collection_name="tracks"):
         """
@@ -202,6 +291,7 @@ class MongoDBManager:
         try:
             result = self.collection.delete_one(filter_query)
             if result.deleted_count > 0:
+                reset_revision(self.db, self.collection_name)
                 print(f"✅ Deleted {result.deleted_count} document(s)")
             else:
                 print("ℹ️ No documents matched the filter")
@@ -222,6 +312,8 @@ class MongoDBManager:
         """
         try:
             result = self.collection.delete_many(filter_query)
+            if result.deleted_count > 0:
+                reset_revision(self.db, self.collection_name)
             print(f"✅ Deleted {result.deleted_count} document(s)")
             return True
         except Exception as e:
@@ -250,117 +342,134 @@ class MongoDBManager:
         """Drop the entire collection"""
         try:
             self.collection.drop()
+            reset_revision(self.db, self.collection_name)
             print("🗑️ Collection dropped successfully")
             return True
         except Exception as e:
             print(f"❌ Error dropping collection: {e}")
             return False
 
-    def update_track_score(self, track_id, score_change, emotion):
+    def ensure_track_indexes(self):
+        """Create the indexes used for track lookups and change queries"""
+        try:
+            self.collection.create_index('track_id', unique=True)
+        except DuplicateKeyError:
+            # Older databases may hold duplicate track documents
+            print("⚠️ Duplicate track_id documents found, creating a non-unique index")
+            self.collection.create_index('track_id')
+        self.collection.create_index('rev')
+        self.collection.create_index('updated_at')
+        self.collection.create_index('decay_rank')
+
+    def backfill_decay_rank(self, now=None):
+        """
+        Give tracks scored before time decay existed a decayed score: their
+        total_score as of their last update. Tracks that already have a
+        decay_rank are left alone, so this is a no-op after the first run.
+
+        Returns:
+            int: Number of tracks backfilled
+        """
+        now = now or datetime.now(timezone.utc)
+        backfilled = 0
+        try:
+            missing = self.collection.find({'decay_rank': {'$exists': False}},
+                                           {'_id': 1, 'total_score': 1, 'updated_at': 1})
+            for doc in missing:
+                score = doc.get('total_score') or 0
+                decayed_at = doc.get('updated_at') or now
+                # Skip documents a concurrent score update got to first
+                result = self.collection.update_one(
+                    {'_id': doc['_id'], 'decay_rank': {'$exists': False}},
+                    {'$set': {'decayed_score': score, 'decayed_at': decayed_at,
+                              'decay_rank': rank_key(score, decayed_at)}}
+                )
+                backfilled += result.modified_count
+        except Exception as e:
+            print(f"❌ Error backfilling decayed scores: {e}")
+        if backfilled:
+            print(f"🕰️ Backfilled decayed scores for {backfilled} track(s)")
+        return backfilled
+
+    def top_tracks_by_decayed_score(self, limit=10, now=None):
+        """
+        Tracks ranked by time-decayed score as of `now` (see scoring.py),
+        read from the decay_rank index without rewriting any document.
+
+        Returns:
+            list: Track documents, each with its current `score_now`
+        """
+        return top_by_decayed_score(self.collection, limit=limit, now=now)
+
+    def next_revision(self):
+        """Allocate the next revision number for this collection"""
+        return next_revision(self.db, self.collection_name)
+
+    def release_revision(self, rev):
+        """Mark the write stamped with `rev` as landed"""
+        release_revision(self.db, self.collection_name, rev)
+
+    def get_revision(self):
+        """Current revision state ({'rev', 'reset_rev', 'safe_rev'}) of this collection"""
+        return get_revision(self.db, self.collection_name)
+
+    def update_track_score(self, track_id, score_change, emotion, timestamp=None):
         """
         Updates the score for a track with emotion tracking.
         Each emotion (happy, sad, angry, surprise, fear, disgust, neutral, skipped) 
-        is tracked separately with its own count.
+        is tracked separately with its own count. Alongside the lifetime
+        total_score, the time-decayed score (decayed_score/decayed_at/decay_rank)
+        is updated in the same write.
+
+        The write is a single upsert: a new track is created with every
+        emotion counter initialised, and documents missing counters (older
+        structure) get them filled in as they are updated.
 
         Args:
             track_id (str): The ID of the track.
-            score_change (int): +1 for positive emotion, -1 for negative emotion.
+            score_change (float): Score to add; fractional scores come from
+                scoring.score_from_emotions(), legacy callers pass +1/-1.
             emotion (str): The emotion to track (happy, sad, angry, surprise, fear, disgust, neutral, skipped).
+            timestamp (datetime): When the reaction happened (defaults to now, UTC); the
+                decayed score is aged from this time, not from when the write runs
         """
-        if score_change not in [1, -1]:
-            print("❌ Invalid score_change value. Must be 1 or -1.")
+        if isinstance(score_change, bool) or not isinstance(score_change, (int, float)) or not math.isfinite(score_change):
+            print("❌ Invalid score_change value. Must be a finite number.")
             return False
             
+        rev = None
         try:
-            query = {'track_id': track_id}
-            
-            # Check if document already exists
-            existing_doc = self.collection.find_one(query)
-            
-            if existing_doc:
-                print(f"📄 Found existing document for track {track_id}")
-                print(f"📄 Existing document structure: {list(existing_doc.keys())}")
-                
-                # Check if the document has the new emotion structure
-                emotion_field = f'emotion_{emotion}'
-                has_emotion_field = emotion_field in existing_doc
-                
-                if has_emotion_field:
-                    # Document exists and has the new structure - just increment
-                    update = {
-                        '$inc': {
-                            'total_score': score_change,
-                            emotion_field: 1
-                        }
-                    }
-                    
-                    result = self.collection.update_one(query, update)
-                    
-                    if result.modified_count > 0:
-                        print(f"✅ Updated track '{track_id}' - added {emotion} (+{score_change})")
-                    else:
-                        print(f"ℹ️ No change for track '{track_id}'.")
-                else:
-                    # Document exists but has old structure - migrate it
-                    print(f"🔄 Migrating old document structure for track {track_id}")
-                    
-                    # Initialize all emotion fields
-                    all_emotions = ['happy', 'sad', 'angry', 'surprise', 'fear', 'disgust', 'neutral', 'skipped']
-                    emotion_updates = {}
-                    for emo in all_emotions:
-                        emotion_updates[f'emotion_{emo}'] = 0
-                    
-                    # Set current emotion to 1
-                    emotion_updates[emotion_field] = 1
-                    
-                    # Update with new structure
-                    update = {
-                        '$set': emotion_updates,
-                        '$inc': {
-                            'total_score': score_change
-                        }
-                    }
-                    
-                    result = self.collection.update_one(query, update)
-                    
-                    if result.modified_count > 0:
-                        print(f"✅ Migrated and updated track '{track_id}' - added {emotion} (+{score_change})")
-                    else:
-                        print(f"❌ Failed to migrate track '{track_id}'")
-            else:
-                # Document doesn't exist - create new document with all emotions initialized
-                print(f"🆕 Creating new document for track {track_id}")
-                all_emotions = ['happy', 'sad', 'angry', 'surprise', 'fear', 'disgust', 'neutral', 'skipped']
-                
-                # Initialize all emotion counts to 0
-                emotion_init = {}
-                for emo in all_emotions:
-                    emotion_init[f'emotion_{emo}'] = 0
-                
-                # Set the current emotion to 1
-                emotion_field = f'emotion_{emotion}'
-                emotion_init[emotion_field] = 1
-                
-                # Create new document
-                new_doc = {
-                    'track_id': track_id,
-                    'total_score': score_change,
-                    **emotion_init
-                }
-                
-                result = self.collection.insert_one(new_doc)
-                
-                if result.inserted_id:
-                    print(f"✅ Created new track '{track_id}' with {emotion}: {score_change} and initialized all emotions")
-                else:
-                    print(f"❌ Failed to create new track '{track_id}'")
+            now = datetime.now(timezone.utc)
+            rev = self.next_revision()
+            counters = {}
+            for emo in dict.fromkeys(all_emotions + [emotion]):
+                field = f'emotion_{emo}'
+                counters[field] = {'$add': [{'$ifNull': [f'${field}', 0]}, 1 if emo == emotion else 0]}
+            update = [
+                {'$set': {
+                    'total_score': {'$add': [{'$ifNull': ['$total_score', 0]}, score_change]},
+                    **counters,
+                    'rev': rev,
+                    'updated_at': now
+                }},
+                # updated_at stays the write time; the tracks watcher polls on it
+                *decay_update_stages(score_change, timestamp or now)
+            ]
+            result = self.collection.update_one({'track_id': track_id}, update, upsert=True)
 
+            if result.upserted_id is not None:
+                print(f"🆕 Created track '{track_id}' with {emotion} ({score_change:+g})")
+            else:
+                print(f"✅ Updated track '{track_id}' - added {emotion} ({score_change:+g})")
             return True
         except Exception as e:
             print(f"❌ Error updating track score: {e}")
             import traceback
             traceback.print_exc()
             return False
+        finally:
+            if rev is not None:
+                self.release_revision(rev)
 
 def main():
     """Example usage of the track score update functionality with multi-emotion tracking"""
@@ -1,21 +1,20 @@
-from google import genai
 import os
 from dotenv import load_dotenv
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 import json
-from main import auth
-import re
+from services import GeminiService, get_spotify
+from search_cache import cached_search
+from queueing import queue_tracks
+from playlists import playlist_manager
+from response_parser import extract_json_from_response
 
 load_dotenv()
 
-gem_api_key = os.getenv("GEM_API_KEY")
+# Built on first use with the google.genai client
+gemini = GeminiService(model_name="gemini-2.5-flash", sdk='genai')
 
-client = genai.Client(api_key=gem_api_key)
-
-sp = auth()
-
-def analyze_text_sentiment_and_keyword(text):
+def analyze_text_sentiment_and_keyword(text, gemini_service=None):
     prompt = (
         "Given the following situation, extract: "
         "1. The overall sentiment (happy, sad, angry, etc.) "
@@ -23,20 +22,17 @@ def analyze_text_sentiment_and_keyword(text):
         "Return your answer as a JSON object with 'sentiment' and 'keyword'. "
         f"Situation: {text}"
     )
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt,
-    )
+    response_text = (gemini_service or gemini).generate(prompt)
 
-    print(response.text)
-    return response.text
+    print(response_text)
+    return response_text
     
 
 def play_song_for_feeling_and_keyword(sp, feeling, keyword):
     print("Searching for a track...")
     try:
         query = f"{feeling} {keyword}"
-        results = sp.search(q=query, type='track', limit=1)
+        results = cached_search(sp, query, 'track', 1)
         tracks = results.get('tracks', {}).get('items', [])
         if not tracks:
             print(f"No tracks found for mood '{feeling}' and keyword '{keyword}'.")
@@ -49,14 +45,9 @@ def play_song_for_feeling_and_keyword(sp, feeling, keyword):
     except Exception as e:
         print(f"Error during Spotify search/playback: {e}")
 
-def extract_json_from_response(response_text):
-    # Remove code block markers and whitespace
-    cleaned = re.sub(r"^```(?:json)?|```$", "", response_text.strip(), flags=re.MULTILINE).strip()
-    return json.loads(cleaned)
-
 def play_multiple_songs_for_feeling_and_keyword(sp, feeling, keyword, num_songs=5):
     query = f"{feeling} {keyword}"
-    results = sp.search(q=query, type='track', limit=num_songs)
+    results = cached_search(sp, query, 'track', num_songs)
     tracks = results.get('tracks', {}).get('items', [])
     
     if not tracks:
@@ -80,38 +71,28 @@ def play_multiple_songs_for_feeling_and_keyword(sp, feeling, keyword, num_songs=
         return None
 
 def create_and_play_playlist_for_feeling_and_keyword(sp, feeling, keyword, num_songs=10):
+    """
+    Fill the managed playlist for this feeling with search results and play it.
+    The playlist is reused across calls and only the differences are written.
+    """
     query = f"{feeling} {keyword}"
-    results = sp.search(q=query, type='track', limit=num_songs)
+    results = cached_search(sp, query, 'track', num_songs)
     tracks = results.get('tracks', {}).get('items', [])
     
     if not tracks:
         print(f"No tracks found for mood '{feeling}' and keyword '{keyword}'.")
         return None
     
-    # Create a temporary playlist
-    playlist_name = f"{feeling.title()} {keyword.title()} Mix"
-    user_id = sp.current_user()['id']
-    
     try:
-        playlist = sp.user_playlist_create(
-            user=user_id,
-            name=playlist_name,
-            public=False,
-            description=f"Auto-generated playlist for {feeling} {keyword} mood"
-        )
-        
-        # Add tracks to playlist
         track_uris = [track['uri'] for track in tracks]
-        sp.playlist_add_items(playlist['id'], track_uris)
+        synced = playlist_manager.play(sp, feeling, track_uris)
+        playlist = {'id': synced['playlist_id'], 'uri': synced['uri']}
         
-        print(f"Created playlist: {playlist_name}")
-        print(f"Added {len(tracks)} songs:")
+        print(f"Updated playlist for '{feeling}': +{synced['added']} -{synced['removed']} "
+              f"in {synced['calls']} calls")
         for i, track in enumerate(tracks, 1):
             print(f"{i}. {track['name']} by {track['artists'][0]['name']}")
-        
-        # Start playing the playlist
-        sp.start_playback(context_uri=playlist['uri'])
-        print(f"Now playing: {playlist_name}")
+        print(f"Now playing: {feeling.title()} playlist")
         
         return playlist, tracks
         
@@ -119,9 +100,17 @@ def create_and_play_playlist_for_feeling_and_keyword(sp, feeling, keyword, num_s
         print(f"Error creating/playing playlist: {e}")
         return None
 
-def queue_songs_for_feeling_and_keyword(sp, feeling, keyword, num_songs=5):
+def queue_songs_for_feeling_and_keyword(sp, feeling, keyword, num_songs=5, strategy='queue'):
+    """
+    Queue search results for a mood/keyword in order.
+
+    strategy is passed to queueing.queue_tracks(); 'playlist' or 'auto' trade
+    one queue call per track for a playlist that replaces current playback.
+    Returns the queued tracks (tracks after a failure are not queued, to keep
+    the order), or None.
+    """
     query = f"{feeling} {keyword}"
-    results = sp.search(q=query, type='track', limit=num_songs)
+    results = cached_search(sp, query, 'track', num_songs)
     tracks = results.get('tracks', {}).get('items', [])
     
     if not tracks:
@@ -130,17 +119,19 @@ def queue_songs_for_feeling_and_keyword(sp, feeling, keyword, num_songs=5):
     
     print(f"Queueing {len(tracks)} songs for '{feeling} {keyword}':")
     
-    try:
-        for i, track in enumerate(tracks):
-            sp.add_to_queue(track['uri'])
-            print(f"{i+1}. {track['name']} by {track['artists'][0]['name']}")
-        
+    outcome = queue_tracks(sp, [track['uri'] for track in tracks], strategy=strategy,
+                           playlist_key=f"{feeling} queue")
+    queued = set(outcome['queued'])
+    queued_tracks = [track for track in tracks if track['uri'] in queued]
+    for i, track in enumerate(queued_tracks):
+        print(f"{i+1}. {track['name']} by {track['artists'][0]['name']}")
+    
+    if outcome['failed']:
+        print(f"Error queueing songs: {len(outcome['failed'])} failed, {len(outcome['skipped'])} skipped "
+              f"({outcome['failed'][0]['error']})")
+    else:
         print("Songs added to queue!")
-        return tracks
-        
-    except Exception as e:
-        print(f"Error queueing songs: {e}")
-        return None
+    return queued_tracks or None
 
 # Example usage:
 if __name__ == "__main__":
@@ -151,4 +142,5 @@ if __name__ == "__main__":
     keyword = parsed['keyword']
     print("========", feeling, keyword)
 
+    sp = get_spotify()
     play_song_for_feeling_and_keyword(sp, feeling, keyword)
\ No newline at end of file
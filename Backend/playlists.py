@@ -0,0 +1,184 @@
+"""
+One reusable Spotify playlist per sentiment.
+
+Instead of creating a new playlist on every request, PlaylistManager keeps a
+managed playlist per sentiment ("Sad Mood Mix") and brings it to the wanted
+tracks with as few calls as possible: when the tracks already there are in
+the wanted order, missing ones are appended and extra ones removed, 100 per
+call; otherwise, or when that takes fewer calls, the contents are replaced
+outright. The user ID, playlist IDs and playlist contents are cached. The
+cached contents are trusted for CONTENTS_TTL_SECONDS after they were last
+confirmed; after that Spotify's snapshot_id tells whether the playlist was
+changed elsewhere and must be refetched. A failed write drops the cache.
+"""
+
+import math
+import threading
+import time
+import weakref
+from analysis_cache import normalize_text
+from queueing import call_with_retry
+
+CHUNK_SIZE = 100
+# How long cached playlist contents are used without checking the snapshot_id
+CONTENTS_TTL_SECONDS = 300
+NAME_FORMAT = "{title} Mood Mix"
+DESCRIPTION_FORMAT = "Managed by Spotilike for {sentiment} moods"
+
+
+def chunks(items, size=CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class PlaylistManager:
+    def __init__(self, rate_limiter=None):
+        """
+        Args:
+            rate_limiter (RateLimiter): Gate for Spotify calls (defaults to queueing's)
+        """
+        self.rate_limiter = rate_limiter
+        # Per Spotify client: {'user_id', 'playlists': {key: id},
+        #                      'contents': {id: (snapshot_id, [uris], confirmed_at)}}
+        self._clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _call(self, call, rate_limiter=None):
+        return call_with_retry(call, rate_limiter or self.rate_limiter)
+
+    def _state(self, sp):
+        with self._lock:
+            state = self._clients.get(sp)
+            if state is None:
+                state = self._clients[sp] = {'user_id': None, 'playlists': {}, 'contents': {}}
+            return state
+
+    def user_id(self, sp, rate_limiter=None):
+        """current_user()['id'], fetched once per client"""
+        state = self._state(sp)
+        if state['user_id'] is None:
+            state['user_id'] = self._call(lambda: sp.current_user(), rate_limiter)['id']
+        return state['user_id']
+
+    def playlist_id(self, sp, sentiment, rate_limiter=None):
+        """ID of the managed playlist for a sentiment, found or created on first use"""
+        key = normalize_text(sentiment)
+        state = self._state(sp)
+        if key in state['playlists']:
+            return state['playlists'][key]
+
+        user_id = self.user_id(sp, rate_limiter)
+        name = NAME_FORMAT.format(title=key.title())
+        found = None
+        page = self._call(lambda: sp.current_user_playlists(limit=50), rate_limiter)
+        while page and found is None:
+            for playlist in page.get('items', []):
+                if playlist and playlist.get('name') == name and playlist.get('owner', {}).get('id') == user_id:
+                    found = playlist
+                    break
+            if found is None and page.get('next'):
+                page = self._call(lambda: sp.next(page), rate_limiter)
+            else:
+                break
+
+        if found is None:
+            found = self._call(lambda: sp.user_playlist_create(
+                user=user_id, name=name, public=False,
+                description=DESCRIPTION_FORMAT.format(sentiment=key)
+            ), rate_limiter)
+            state['contents'][found['id']] = (found.get('snapshot_id'), [], time.monotonic())
+            print(f"🎵 Created managed playlist '{name}'")
+        state['playlists'][key] = found['id']
+        return found['id']
+
+    def _contents(self, sp, playlist_id, rate_limiter=None):
+        """
+        Track URIs in the playlist: from cache while it was confirmed within
+        CONTENTS_TTL_SECONDS, refetched when the snapshot changed since.
+        """
+        state = self._state(sp)
+        cached = state['contents'].get(playlist_id)
+        if cached and time.monotonic() - cached[2] < CONTENTS_TTL_SECONDS:
+            return cached[0], list(cached[1])
+
+        snapshot_id = self._call(lambda: sp.playlist(playlist_id, fields='snapshot_id'), rate_limiter)['snapshot_id']
+        if cached and cached[0] == snapshot_id:
+            state['contents'][playlist_id] = (snapshot_id, cached[1], time.monotonic())
+            return snapshot_id, list(cached[1])
+
+        uris = []
+        page = self._call(lambda: sp.playlist_items(playlist_id, fields='items(track(uri)),next', limit=CHUNK_SIZE),
+                          rate_limiter)
+        while page:
+            uris.extend(item['track']['uri'] for item in page.get('items', []) if item.get('track'))
+            page = self._call(lambda: sp.next(page), rate_limiter) if page.get('next') else None
+        state['contents'][playlist_id] = (snapshot_id, uris, time.monotonic())
+        return snapshot_id, list(uris)
+
+    def sync(self, sp, sentiment, uris, rate_limiter=None):
+        """
+        Make the sentiment's playlist hold exactly `uris`, in that order.
+
+        When the kept tracks are already in `uris` order, extra ones are
+        removed and new ones appended; otherwise (or when it takes fewer
+        calls) the whole list is replaced.
+
+        Returns:
+            dict: {'playlist_id', 'added', 'removed', 'calls'} (calls = write calls made)
+        """
+        uris = list(dict.fromkeys(uris))
+        playlist_id = self.playlist_id(sp, sentiment, rate_limiter)
+        snapshot_id, current = self._contents(sp, playlist_id, rate_limiter)
+
+        wanted = set(uris)
+        present = set(current)
+        to_add = [uri for uri in uris if uri not in present]
+        to_remove = [uri for uri in dict.fromkeys(current) if uri not in wanted]
+        diff_contents = [uri for uri in current if uri in wanted] + to_add
+        diff_calls = math.ceil(len(to_add) / CHUNK_SIZE) + math.ceil(len(to_remove) / CHUNK_SIZE)
+        replace_calls = max(1, math.ceil(len(uris) / CHUNK_SIZE))
+
+        calls = 0
+        try:
+            if diff_contents != uris or diff_calls > replace_calls:
+                first, rest = uris[:CHUNK_SIZE], uris[CHUNK_SIZE:]
+                snapshot_id = self._call(lambda: sp.playlist_replace_items(playlist_id, first),
+                                         rate_limiter).get('snapshot_id')
+                calls += 1
+                for chunk in chunks(rest):
+                    snapshot_id = self._call(lambda: sp.playlist_add_items(playlist_id, chunk),
+                                             rate_limiter).get('snapshot_id')
+                    calls += 1
+            else:
+                for chunk in chunks(to_remove):
+                    snapshot_id = self._call(
+                        lambda: sp.playlist_remove_all_occurrences_of_items(playlist_id, chunk), rate_limiter
+                    ).get('snapshot_id')
+                    calls += 1
+                for chunk in chunks(to_add):
+                    snapshot_id = self._call(lambda: sp.playlist_add_items(playlist_id, chunk),
+                                             rate_limiter).get('snapshot_id')
+                    calls += 1
+        except Exception:
+            # The playlist may be half written; read it back next time
+            self._state(sp)['contents'].pop(playlist_id, None)
+            raise
+
+        self._state(sp)['contents'][playlist_id] = (snapshot_id, uris, time.monotonic())
+        return {'playlist_id': playlist_id, 'added': len(to_add), 'removed': len(to_remove), 'calls': calls}
+
+    def play(self, sp, sentiment, uris, device_id=None, rate_limiter=None):
+        """
+        Sync the sentiment's playlist to `uris` and start playing it.
+
+        Returns:
+            dict: sync() result plus the playlist 'uri'
+        """
+        result = self.sync(sp, sentiment, uris, rate_limiter)
+        result['uri'] = f"spotify:playlist:{result['playlist_id']}"
+        self._call(lambda: sp.start_playback(device_id=device_id, context_uri=result['uri']), rate_limiter)
+        return result
+
+
+# Shared so the user/playlist caches outlive a single request
+playlist_manager = PlaylistManager()
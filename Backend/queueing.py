@@ -0,0 +1,196 @@
+"""
+Adding many tracks to the Spotify playback queue.
+
+Spotify's queue endpoint takes one track per call and queues in arrival
+order, so an ordered queue means each call must be acknowledged before the
+next one goes out: ordered mode issues calls back to back without other
+work in between (calls in flight together could land in any order),
+retries failures that cannot have queued anything (rate limits, refused
+connections) in place, and stops at the first track that can't be queued,
+so the queue never ends up with gaps or out-of-order tracks. When order
+doesn't matter the calls run concurrently. Every call passes through a
+shared rate limiter.
+
+Queueing through a playlist replaces N queue calls with an update of a
+reused playlist (one call per 100 tracks), but playback then starts from
+that playlist, replacing what is playing instead of adding after it, so
+it is only used when the caller asks for it ('playlist', or 'auto' above
+PLAYLIST_THRESHOLD tracks). Callers give the queue path its own playlist
+key, so it never rewrites a playlist that create-and-play is using.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.exceptions import ConnectionError as RequestsConnectionError, ConnectTimeout
+from spotipy.exceptions import SpotifyException
+from urllib3.exceptions import NewConnectionError
+from metrics import metrics
+from ratelimit import RateLimiter
+from services import spotify_without_retries
+
+# Above this many tracks, the opt-in 'auto' strategy switches to the playlist
+PLAYLIST_THRESHOLD = 15
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 0.5
+MAX_RETRY_DELAY = 10.0
+
+# Shared by everything that issues Spotify write calls in bulk
+spotify_rate_limiter = RateLimiter(float(os.getenv("SPOTIFY_RPS", "10")), per=1.0)
+
+
+def is_retryable(error):
+    """
+    Only failures where Spotify cannot have acted on the call are retried:
+    rate limits and connections that were never established. A timeout,
+    dropped connection or 5xx may come after the track was queued, and
+    queueing is not idempotent, so those are reported instead.
+    """
+    if isinstance(error, SpotifyException):
+        return error.http_status == 429
+    if isinstance(error, ConnectTimeout):
+        return True
+    if isinstance(error, RequestsConnectionError):
+        reason = getattr(error.args[0], 'reason', error.args[0]) if error.args else None
+        return isinstance(reason, NewConnectionError)
+    return False
+
+
+def retry_delay(error, attempt):
+    """Seconds to wait before retry number attempt (honours Retry-After)"""
+    if isinstance(error, SpotifyException) and error.headers:
+        retry_after = error.headers.get('Retry-After') or error.headers.get('retry-after')
+        if retry_after:
+            try:
+                return min(MAX_RETRY_DELAY, float(retry_after))
+            except ValueError:
+                pass
+    return min(MAX_RETRY_DELAY, RETRY_BASE_DELAY * (2 ** attempt))
+
+
+def call_with_retry(call, rate_limiter=None, max_retries=MAX_RETRIES):
+    """
+    Run call() behind the rate limiter, retrying transient failures with backoff.
+
+    Raises:
+        Exception: The last error once retries are exhausted or it isn't retryable
+    """
+    rate_limiter = rate_limiter or spotify_rate_limiter
+    attempt = 0
+    while True:
+        rate_limiter.acquire()
+        try:
+            return call()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            metrics.increment('queueing.retry')
+            time.sleep(retry_delay(e, attempt))
+            attempt += 1
+
+
+def _result(strategy, uris):
+    return {'strategy': strategy, 'queued': [], 'failed': [], 'skipped': list(uris)}
+
+
+def queue_in_order(sp, uris, device_id=None, rate_limiter=None):
+    """
+    Append uris to the playback queue in order.
+
+    Returns:
+        dict: {'strategy', 'queued', 'failed': [{'uri', 'error'}], 'skipped'}; tracks
+            after a failed one are skipped so the queue keeps the requested order
+    """
+    sp = spotify_without_retries(sp)
+    result = _result('queue', uris)
+    for position, uri in enumerate(uris):
+        try:
+            call_with_retry(lambda: sp.add_to_queue(uri, device_id=device_id), rate_limiter)
+        except Exception as e:
+            result['failed'].append({'uri': uri, 'error': str(e)})
+            result['skipped'] = list(uris[position + 1:])
+            break
+        result['queued'].append(uri)
+    else:
+        result['skipped'] = []
+    return result
+
+
+def queue_concurrently(sp, uris, device_id=None, rate_limiter=None, max_workers=4):
+    """
+    Add uris to the queue with calls in flight at once; queue order is not guaranteed.
+
+    Returns:
+        dict: Same shape as queue_in_order(); nothing is skipped
+    """
+    sp = spotify_without_retries(sp)
+    result = _result('queue_unordered', [])
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(call_with_retry, lambda uri=uri: sp.add_to_queue(uri, device_id=device_id), rate_limiter)
+            for uri in uris
+        ]
+        for uri, future in zip(uris, futures):
+            try:
+                future.result()
+                result['queued'].append(uri)
+            except Exception as e:
+                result['failed'].append({'uri': uri, 'error': str(e)})
+    return result
+
+
+def queue_via_playlist(sp, uris, playlist_key, device_id=None, rate_limiter=None):
+    """
+    Sync uris into the managed playlist for playlist_key and start playing it
+    (see playlists.PlaylistManager).
+
+    Unlike the queue strategies this replaces what is playing now.
+
+    Returns:
+        dict: Same shape as queue_in_order(), plus 'playlist' ({'id', 'uri'})
+    """
+    from playlists import playlist_manager
+
+    result = _result('playlist', uris)
+    try:
+        synced = playlist_manager.play(sp, playlist_key, uris, device_id=device_id, rate_limiter=rate_limiter)
+    except Exception as e:
+        result['failed'] = [{'uri': uri, 'error': str(e)} for uri in uris]
+        result['skipped'] = []
+        return result
+    result['playlist'] = {'id': synced['playlist_id'], 'uri': synced['uri']}
+    result['queued'] = list(uris)
+    result['skipped'] = []
+    return result
+
+
+def queue_tracks(sp, uris, strategy='queue', playlist_key='queue', device_id=None, rate_limiter=None):
+    """
+    Queue tracks for playback.
+
+    Args:
+        sp: spotipy.Spotify client
+        uris (list): Track URIs in the order they should play
+        strategy (str): 'queue' (ordered, the default), 'unordered', 'playlist'
+            (replaces current playback), or 'auto' (playlist above
+            PLAYLIST_THRESHOLD tracks, otherwise ordered queue)
+        playlist_key (str): Managed playlist to use for the playlist strategy
+        device_id (str): Target device (None: the active one)
+        rate_limiter (RateLimiter): Defaults to spotify_rate_limiter
+
+    Returns:
+        dict: {'strategy', 'queued', 'failed', 'skipped'} (see queue_in_order)
+    """
+    if strategy == 'auto':
+        strategy = 'playlist' if len(uris) > PLAYLIST_THRESHOLD else 'queue'
+    started = time.perf_counter()
+    if strategy == 'playlist':
+        result = queue_via_playlist(sp, uris, playlist_key, device_id=device_id, rate_limiter=rate_limiter)
+    elif strategy == 'unordered':
+        result = queue_concurrently(sp, uris, device_id=device_id, rate_limiter=rate_limiter)
+    else:
+        result = queue_in_order(sp, uris, device_id=device_id, rate_limiter=rate_limiter)
+    metrics.observe(f"queueing.{result['strategy']}", (time.perf_counter() - started) * 1000)
+    if result['failed']:
+        metrics.increment('queueing.partial_failure')
+    return result
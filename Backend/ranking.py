@@ -0,0 +1,136 @@
+"""
+Personalized re-ranking of Spotify search results.
+
+Search is over-fetched and the candidates are re-ordered with what the
+tracks collection has learned: tracks that earned happy reactions and a
+high total_score move up, tracks that were skipped move down, unknown
+tracks keep roughly their Spotify position. Stored scores for all
+candidates are read with one indexed {'track_id': {'$in': [...]}} query.
+
+    python ranking.py   # ranking latency at 1,000 candidates
+"""
+
+import math
+import random
+import time
+from metrics import metrics
+
+# Spotify's search limit per request
+MAX_SEARCH_LIMIT = 50
+OVERFETCH_FACTOR = 4
+
+# How much each recorded reaction says about liking the track
+EMOTION_WEIGHTS = {
+    'happy': 1.0, 'surprise': 0.4, 'neutral': 0.0, 'sad': -0.3,
+    'fear': -0.6, 'angry': -0.8, 'disgust': -1.0, 'skipped': -1.5,
+}
+# Pseudo-count of reactions: few observations only nudge a track
+PRIOR_STRENGTH = 2.0
+# Weight of personal history against Spotify's relevance order
+PERSONAL_WEIGHT = 1.0
+
+TRACK_PROJECTION = {'_id': 0, 'track_id': 1, 'total_score': 1, **{f'emotion_{e}': 1 for e in EMOTION_WEIGHTS}}
+
+_score_lookup = None
+
+
+def overfetch_limit(count):
+    """Search limit for count results, leaving room to re-rank"""
+    return max(count, min(MAX_SEARCH_LIMIT, count * OVERFETCH_FACTOR))
+
+
+def mongo_score_lookup(collection):
+    """
+    A score lookup backed by the tracks collection (track_id is indexed).
+
+    Returns:
+        callable: track_ids -> {track_id: track document}
+    """
+    def lookup(track_ids):
+        cursor = collection.find({'track_id': {'$in': list(track_ids)}}, TRACK_PROJECTION)
+        return {doc['track_id']: doc for doc in cursor}
+    return lookup
+
+
+def set_score_lookup(lookup):
+    """Set the lookup rank_tracks() uses by default (None turns re-ranking off)"""
+    global _score_lookup
+    _score_lookup = lookup
+
+
+def affinity(doc):
+    """
+    How much the user likes a track, from its stored reactions (about -1.5 to 1).
+
+    Reaction counts are averaged with PRIOR_STRENGTH neutral pseudo-reactions,
+    and total_score adds a bounded nudge.
+    """
+    if not doc:
+        return 0.0
+    weighted = 0.0
+    reactions = 0.0
+    for emotion, weight in EMOTION_WEIGHTS.items():
+        count = doc.get(f'emotion_{emotion}') or 0
+        weighted += weight * count
+        reactions += count
+    score = weighted / (reactions + PRIOR_STRENGTH)
+    return score + 0.25 * math.tanh((doc.get('total_score') or 0) / 5)
+
+
+def rank_tracks(tracks, limit, score_lookup=None, personal_weight=PERSONAL_WEIGHT):
+    """
+    Re-order Spotify search results by relevance and personal history.
+
+    Args:
+        tracks (list): Spotify track objects in search order
+        limit (int): Number of tracks to return
+        score_lookup (callable): track_ids -> {track_id: doc}; defaults to the one
+            set with set_score_lookup(). Without one the search order is kept.
+        personal_weight (float): Weight of history against search position
+
+    Returns:
+        list: Up to limit tracks, best first
+    """
+    score_lookup = score_lookup or _score_lookup
+    if score_lookup is None or len(tracks) <= 1:
+        return tracks[:limit]
+
+    started = time.perf_counter()
+    try:
+        docs = score_lookup([track['id'] for track in tracks if track.get('id')])
+    except Exception as e:
+        print(f"⚠️ Track score lookup failed, keeping search order: {e}")
+        return tracks[:limit]
+
+    count = len(tracks)
+    scored = []
+    for position, track in enumerate(tracks):
+        relevance = 1.0 - position / count
+        scored.append((relevance + personal_weight * affinity(docs.get(track.get('id'))), -position, track))
+    scored.sort(key=lambda item: (item[0], item[1]), reverse=True)
+    metrics.observe('stage.rank', (time.perf_counter() - started) * 1000)
+    return [track for _, _, track in scored[:limit]]
+
+
+def benchmark(candidates=1000, known_fraction=0.5, runs=200):
+    """Median and p95 ranking latency (ms) with an in-memory score lookup"""
+    tracks = [{'id': f"track{i}", 'uri': f"spotify:track:track{i}"} for i in range(candidates)]
+    docs = {}
+    for track in random.sample(tracks, int(candidates * known_fraction)):
+        doc = {f'emotion_{e}': random.randint(0, 5) for e in EMOTION_WEIGHTS}
+        doc['total_score'] = random.randint(-10, 10)
+        docs[track['id']] = doc
+    lookup = lambda ids: {track_id: docs[track_id] for track_id in ids if track_id in docs}
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        rank_tracks(tracks, 20, score_lookup=lookup)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2], timings[int(len(timings) * 0.95)]
+
+
+if __name__ == "__main__":
+    median_ms, p95_ms = benchmark()
+    print(f"📊 Ranking 1,000 candidates: median {median_ms:.2f} ms, p95 {p95_ms:.2f} ms")
+    print("✅ Within 10 ms budget" if p95_ms < 10 else "❌ Over 10 ms budget")
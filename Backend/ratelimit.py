@@ -0,0 +1,58 @@
+import threading
+import time
+
+
+class RateLimiter:
+    def __init__(self, rate, per=1.0, burst=None):
+        """
+        Token bucket shared by threads calling a rate-limited API.
+
+        Args:
+            rate (float): Calls allowed per `per` seconds
+            per (float): Window in seconds
+            burst (int): Calls that may go out back to back (defaults to rate)
+        """
+        self.rate = float(rate) / per
+        self.capacity = float(burst if burst is not None else max(1, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """Take a token if one is available right now"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def acquire(self, timeout=None):
+        """
+        Block until a token is available.
+
+        Args:
+            timeout (float): Give up after this many seconds (None waits forever)
+
+        Returns:
+            bool: True if a token was taken, False on timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
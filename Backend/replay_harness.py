@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Offline replay of recorded listening sessions through the scoring and
+ranking code, to check whether a change to either actually helps.
+
+A recording is JSON lines ordered by time:
+
+    {"t": 1718000000.0, "type": "playback", "snapshot": <sp.current_playback() result>}
+    {"t": 1718000002.5, "type": "emotion", "emotion": "happy", "probabilities": {...}, "face_confidence": 0.97}
+
+Playback snapshots are the monitor loop's ticks. Each one is replayed through
+main.process_tick() with the latest emotion, writing to a local Mongo stand-in
+(mongomock, or a scratch database on --mongo-uri). The last --holdout share of
+the recording is not replayed; tracks that drew more happy than negative
+reactions in it are the held-out positives. Each positive is ranked among --negatives random catalog
+tracks by every ranker, reporting hit rate and NDCG at --k with 95% intervals
+(Wilson for hit rate, bootstrap for NDCG) and the spread over --seeds draws of
+the negatives, along with replay throughput and latency. With a few dozen
+positives the intervals are wide; compare rankers on overlapping intervals
+and several seeds, not on one point estimate.
+
+    python replay_harness.py --synthetic 20000
+    python replay_harness.py recording.jsonl --mongo-uri mongodb://localhost:27017
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import random
+import time
+from datetime import datetime, timezone
+import main as monitor
+from metrics import LatencyHistogram
+from mongoDB import MongoDBManager
+from ranking import mongo_score_lookup, rank_tracks
+from scoring import value_from_rank
+from sessions import Sessionizer
+
+TICK_SECONDS = 5
+
+
+class ReplaySpotify:
+    """Stands in for the Spotify client, returning the snapshot being replayed"""
+    def __init__(self):
+        self.snapshot = None
+
+    def current_playback(self):
+        return self.snapshot
+
+
+def load_recording(path):
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    records.sort(key=lambda record: record['t'])
+    return records
+
+
+def synthetic_recording(ticks=20000, catalog_size=300, seed=7, start=1_700_000_000.0):
+    """
+    A listening history with a hidden taste per track: liked tracks mostly draw
+    happy reactions and play on, disliked ones draw negative reactions and are
+    often skipped within the skip threshold.
+    """
+    rng = random.Random(seed)
+    taste = {f"track{i:04d}": rng.random() for i in range(catalog_size)}
+    catalog = list(taste)
+    records = []
+    t = start
+    tick = 0
+    while tick < ticks:
+        track_id = rng.choice(catalog)
+        liked = rng.random() < taste[track_id]
+        plays_for = rng.randint(1, 2) if not liked and rng.random() < 0.7 else rng.randint(6, 40)
+        for position in range(plays_for):
+            snapshot = {'item': {'id': track_id}, 'progress_ms': position * TICK_SECONDS * 1000, 'is_playing': True}
+            records.append({'t': t, 'type': 'playback', 'snapshot': snapshot})
+            if rng.random() < 0.5:
+                if liked:
+                    emotion = rng.choices(['happy', 'neutral', 'surprise', 'sad'], [0.6, 0.3, 0.05, 0.05])[0]
+                else:
+                    emotion = rng.choices(['sad', 'angry', 'neutral', 'disgust', 'happy'], [0.3, 0.2, 0.3, 0.1, 0.1])[0]
+                records.append({'t': t + 1, 'type': 'emotion', 'emotion': emotion,
+                                'probabilities': {emotion: round(rng.uniform(0.4, 0.99), 2)}})
+            t += TICK_SECONDS
+            tick += 1
+            if tick >= ticks:
+                break
+    return records
+
+
+def make_store(mongo_uri=None, database_name="spotilike_replay"):
+    """A MongoDBManager on a throwaway database (mongomock unless mongo_uri is given)"""
+    if mongo_uri:
+        manager = MongoDBManager(mongo_uri, database_name, "tracks")
+        if not manager.connect():
+            raise SystemExit(f"Could not connect to {mongo_uri}")
+        manager.client.drop_database(database_name)
+    else:
+        try:
+            import mongomock
+        except ImportError:
+            raise SystemExit("Install mongomock for an in-process Mongo stand-in, or pass --mongo-uri")
+        manager = MongoDBManager("mongodb://replay", database_name, "tracks")
+        manager.client = mongomock.MongoClient()
+        manager.db = manager.client[database_name]
+        manager.collection = manager.db["tracks"]
+    manager.ensure_track_indexes()
+    return manager
+
+
+def replay(records, store):
+    """
+    Replay ticks through main.process_tick() against store.
+
+    Returns:
+        dict: ticks, seconds, ticks_per_second, sessions and the tick latency histogram
+    """
+    sp = ReplaySpotify()
+    monitor.mongo_manager = store
+    monitor.event_log = None
+    monitor.rollup_materializer = None
+    monitor.sessionizer = Sessionizer(store.db)
+    monitor.previous_track_id = None
+    monitor.previous_timestamp = None
+
+    latency = LatencyHistogram(buckets_ms=[0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100])
+    emotion = None
+    ticks = 0
+    started = time.perf_counter()
+    # The scoring code narrates every write; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        for record in records:
+            if record['type'] == 'emotion':
+                emotion = record
+                continue
+            if record['type'] != 'playback':
+                continue
+            sp.snapshot = record['snapshot']
+            tick_started = time.perf_counter()
+            monitor.process_tick(sp, emotion and emotion['emotion'], emotion and emotion.get('probabilities'),
+                                 now=datetime.fromtimestamp(record['t'], timezone.utc),
+                                 face_confidence=emotion and emotion.get('face_confidence'))
+            latency.observe((time.perf_counter() - tick_started) * 1000)
+            emotion = None
+            ticks += 1
+        monitor.sessionizer.close()
+    elapsed = time.perf_counter() - started
+    return {
+        'ticks': ticks,
+        'seconds': round(elapsed, 2),
+        'ticks_per_second': round(ticks / elapsed) if elapsed > 0 else None,
+        'sessions': monitor.sessionizer.collection.count_documents({}),
+        'tick_latency': latency.snapshot(),
+    }
+
+
+def held_out_positives(records):
+    """Tracks that drew more happy than negative reactions while playing, in replay order"""
+    balance = {}
+    playing = None
+    for record in records:
+        if record['type'] == 'playback':
+            item = (record.get('snapshot') or {}).get('item')
+            playing = item and item.get('id')
+        elif record['type'] == 'emotion' and playing:
+            if record.get('emotion') in monitor.positive_emotions:
+                balance[playing] = balance.get(playing, 0) + 1
+            elif record.get('emotion') in monitor.negative_emotions:
+                balance[playing] = balance.get(playing, 0) - 1
+    return [track_id for track_id, score in balance.items() if score > 0]
+
+
+def catalog_of(records):
+    tracks = []
+    seen = set()
+    for record in records:
+        item = (record.get('snapshot') or {}).get('item') if record['type'] == 'playback' else None
+        if item and item.get('id') not in seen:
+            seen.add(item['id'])
+            tracks.append(item['id'])
+    return tracks
+
+
+def rankers(store):
+    """name -> function(candidate tracks, k) returning the top k"""
+    lookup = mongo_score_lookup(store.collection)
+
+    def by_decayed_score(tracks, k):
+        docs = {doc['track_id']: doc for doc in store.collection.find(
+            {'track_id': {'$in': [track['id'] for track in tracks]}}, {'track_id': 1, 'decay_rank': 1})}
+        return sorted(tracks, key=lambda track: value_from_rank(docs.get(track['id'], {}).get('decay_rank')),
+                      reverse=True)[:k]
+
+    return {
+        'search_order': lambda tracks, k: tracks[:k],
+        'rank_tracks': lambda tracks, k: rank_tracks(tracks, k, score_lookup=lookup),
+        'decayed_score': by_decayed_score,
+    }
+
+
+def wilson_interval(hits, count, z=1.96):
+    """95% Wilson score interval for a hit rate of hits/count"""
+    if not count:
+        return 0.0, 0.0
+    rate = hits / count
+    centre = (rate + z * z / (2 * count)) / (1 + z * z / count)
+    margin = z * math.sqrt(rate * (1 - rate) / count + z * z / (4 * count * count)) / (1 + z * z / count)
+    return round(max(0.0, centre - margin), 4), round(min(1.0, centre + margin), 4)
+
+
+def bootstrap_interval(values, resamples=1000, seed=0):
+    """95% percentile bootstrap interval for the mean of values"""
+    if not values:
+        return 0.0, 0.0
+    rng = random.Random(seed)
+    means = sorted(sum(rng.choices(values, k=len(values))) / len(values) for _ in range(resamples))
+    return round(means[int(0.025 * resamples)], 4), round(means[int(0.975 * resamples) - 1], 4)
+
+
+def evaluate(store, positives, catalog, k=10, negatives=99, seed=11):
+    """
+    Leave-one-out ranking metrics: each positive is shuffled in among
+    `negatives` other catalog tracks and every ranker picks its top k.
+
+    Returns:
+        dict: ranker -> {'positives', 'hits', 'hit_rate', 'hit_rate_ci', 'ndcg', 'ndcg_ci',
+            'p50_ms', 'p95_ms'}
+    """
+    rng = random.Random(seed)
+    results = {}
+    slates = []
+    positive_set = set(positives)
+    pool = [track_id for track_id in catalog if track_id not in positive_set]
+    for positive in positives:
+        slate = rng.sample(pool, min(negatives, len(pool))) + [positive]
+        rng.shuffle(slate)
+        slates.append((positive, [{'id': track_id, 'uri': f"spotify:track:{track_id}"} for track_id in slate]))
+
+    for name, ranker in rankers(store).items():
+        hits = 0
+        gains = []
+        latency = LatencyHistogram(buckets_ms=[0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100])
+        for positive, slate in slates:
+            started = time.perf_counter()
+            top = [track['id'] for track in ranker(slate, k)]
+            latency.observe((time.perf_counter() - started) * 1000)
+            if positive in top:
+                hits += 1
+                gains.append(1 / math.log2(top.index(positive) + 2))
+            else:
+                gains.append(0.0)
+        count = len(slates) or 1
+        snapshot = latency.snapshot()
+        results[name] = {
+            'positives': len(slates),
+            'hits': hits,
+            'hit_rate': round(hits / count, 4),
+            'hit_rate_ci': wilson_interval(hits, len(slates)),
+            'ndcg': round(sum(gains) / count, 4),
+            'ndcg_ci': bootstrap_interval(gains, seed=seed),
+            'p50_ms': snapshot['p50_ms'],
+            'p95_ms': snapshot['p95_ms'],
+        }
+    return results
+
+
+def run(records, holdout=0.2, k=10, negatives=99, mongo_uri=None, seeds=5):
+    """
+    Replay, then evaluate with `seeds` different draws of negatives.
+
+    Returns:
+        dict: {'replay', 'held_out_positives', 'ranking' (first seed),
+            'seed_spread': ranker -> {'hit_rate': (min, max), 'ndcg': (min, max)}}
+    """
+    split = int(len(records) * (1 - holdout))
+    train, test = records[:split], records[split:]
+    store = make_store(mongo_uri)
+    replay_stats = replay(train, store)
+    positives = held_out_positives(test)
+    catalog = catalog_of(records)
+    runs = [evaluate(store, positives, catalog, k=k, negatives=negatives, seed=11 + i) for i in range(max(1, seeds))]
+    spread = {
+        name: {metric: (min(result[name][metric] for result in runs), max(result[name][metric] for result in runs))
+               for metric in ('hit_rate', 'ndcg')}
+        for name in runs[0]
+    }
+    return {'replay': replay_stats, 'held_out_positives': len(positives), 'ranking': runs[0], 'seed_spread': spread}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded listening through scoring and ranking")
+    parser.add_argument('recording', nargs='?', help="JSON lines recording (see module docstring)")
+    parser.add_argument('--synthetic', type=int, metavar='TICKS', help="Replay a synthetic recording instead")
+    parser.add_argument('--holdout', type=float, default=0.2, help="Share of the recording held out")
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--negatives', type=int, default=99, help="Catalog tracks ranked against each positive")
+    parser.add_argument('--mongo-uri', help="Use a scratch database here instead of mongomock")
+    parser.add_argument('--seeds', type=int, default=5, help="Draws of negatives to report the spread over")
+    args = parser.parse_args()
+
+    if args.recording:
+        records = load_recording(args.recording)
+    else:
+        records = synthetic_recording(args.synthetic or 20000)
+
+    report = run(records, holdout=args.holdout, k=args.k, negatives=args.negatives, mongo_uri=args.mongo_uri,
+                 seeds=args.seeds)
+    replay_stats = report['replay']
+    print(f"📼 Replayed {replay_stats['ticks']} ticks in {replay_stats['seconds']} s "
+          f"({replay_stats['ticks_per_second']} ticks/s, p50 {replay_stats['tick_latency']['p50_ms']} ms, "
+          f"p95 {replay_stats['tick_latency']['p95_ms']} ms per tick, {replay_stats['sessions']} sessions)")
+    print(f"🎯 {report['held_out_positives']} held-out happy tracks, each ranked among {args.negatives} others")
+    for name, result in report['ranking'].items():
+        spread = report['seed_spread'][name]
+        print(f"   {name:<14} HR@{args.k} {result['hit_rate']:.3f} ({result['hits']}/{result['positives']}, "
+              f"95% CI {result['hit_rate_ci'][0]:.3f}-{result['hit_rate_ci'][1]:.3f}, "
+              f"{args.seeds} seeds {spread['hit_rate'][0]:.3f}-{spread['hit_rate'][1]:.3f})  "
+              f"NDCG@{args.k} {result['ndcg']:.3f} (95% CI {result['ndcg_ci'][0]:.3f}-{result['ndcg_ci'][1]:.3f}, "
+              f"{args.seeds} seeds {spread['ndcg'][0]:.3f}-{spread['ndcg'][1]:.3f})  "
+              f"p50 {result['p50_ms']} ms  p95 {result['p95_ms']} ms")
+    print("   Rankers whose intervals overlap are not measurably different")
+
+
+if __name__ == "__main__":
+    main()
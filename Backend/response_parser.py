@@ -0,0 +1,199 @@
+"""
+Tolerant parsing of Gemini's structured answers.
+
+Models wrap JSON in code fences, prepend prose, use single quotes, leave
+trailing commas or stop mid-object. Re-asking costs a whole LLM call, so
+these are repaired locally: find_json_value() locates the first balanced
+JSON value in one linear scan (closing it if the response was cut off) and
+parse_analysis() validates it and maps the sentiment onto SENTIMENTS.
+"""
+
+import json
+import re
+
+# Sentiments the rest of the app (search queries, playlists, leaderboards) understands
+SENTIMENTS = ['happy', 'sad', 'angry', 'anxious', 'calm', 'energetic', 'romantic', 'nostalgic', 'neutral']
+
+SENTIMENT_SYNONYMS = {
+    'joy': 'happy', 'joyful': 'happy', 'excited': 'energetic', 'excitement': 'energetic',
+    'elated': 'happy', 'ecstatic': 'happy', 'proud': 'happy', 'grateful': 'happy',
+    'hopeful': 'happy', 'positive': 'happy', 'content': 'calm', 'cheerful': 'happy',
+    'upset': 'sad', 'heartbroken': 'sad', 'depressed': 'sad', 'down': 'sad', 'lonely': 'sad',
+    'grief': 'sad', 'melancholy': 'sad', 'disappointed': 'sad', 'negative': 'sad', 'tired': 'sad',
+    'frustrated': 'angry', 'annoyed': 'angry', 'furious': 'angry', 'mad': 'angry', 'irritated': 'angry',
+    'stressed': 'anxious', 'nervous': 'anxious', 'worried': 'anxious', 'scared': 'anxious',
+    'afraid': 'anxious', 'fear': 'anxious', 'fearful': 'anxious', 'overwhelmed': 'anxious',
+    'relaxed': 'calm', 'peaceful': 'calm', 'chill': 'calm', 'focused': 'calm', 'serene': 'calm',
+    'energized': 'energetic', 'pumped': 'energetic', 'hyped': 'energetic', 'motivated': 'energetic',
+    'love': 'romantic', 'loving': 'romantic', 'in love': 'romantic',
+    'reflective': 'nostalgic', 'wistful': 'nostalgic', 'sentimental': 'nostalgic',
+    'mixed': 'neutral', 'bittersweet': 'nostalgic', 'indifferent': 'neutral',
+}
+
+# Alternative field names models use for the two answers
+SENTIMENT_FIELDS = ('sentiment', 'mood', 'emotion', 'feeling')
+KEYWORD_FIELDS = ('keyword', 'topic', 'theme', 'keywords', 'topics')
+
+_CLOSERS = {'{': '}', '[': ']'}
+
+
+class ResponseParseError(ValueError):
+    """The model response holds no usable answer"""
+
+
+def find_json_value(text, openers='{['):
+    """
+    Return the first balanced JSON object/array in text, in one pass.
+
+    Strings and escapes are tracked so braces inside values don't count.
+    If the text ends before the value is closed (a truncated response), the
+    open string and brackets are closed so the caller can still parse it.
+
+    Args:
+        text (str): Raw model response
+        openers (str): Which values to look for: '{', '[' or both
+
+    Returns:
+        str: The JSON text, or None when no value starts in text
+    """
+    start = None
+    stack = []
+    in_string = False
+    escaped = False
+    quote = '"'
+    for i, ch in enumerate(text):
+        if start is None:
+            if ch in openers:
+                start = i
+                stack.append(_CLOSERS[ch])
+            continue
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == quote:
+                in_string = False
+            continue
+        if ch in ('"', "'"):
+            in_string = True
+            quote = ch
+        elif ch in _CLOSERS:
+            stack.append(_CLOSERS[ch])
+        elif ch in '}]':
+            if stack and stack[-1] == ch:
+                stack.pop()
+            if not stack:
+                return text[start:i + 1]
+    if start is None:
+        return None
+    tail = quote if in_string else ''
+    return text[start:].rstrip().rstrip(',') + tail + ''.join(reversed(stack))
+
+
+def _repair(candidate):
+    """Fix the usual near-JSON: single quotes, trailing commas, bare Python literals"""
+    repaired = re.sub(r",\s*([}\]])", r"\1", candidate)
+    repaired = re.sub(r"'([^'\\]*(?:\\.[^'\\]*)*)'", lambda m: json.dumps(m.group(1)), repaired)
+    repaired = re.sub(r"\bTrue\b", "true", re.sub(r"\bFalse\b", "false", re.sub(r"\bNone\b", "null", repaired)))
+    # Unquoted keys: {sentiment: "sad"}
+    return re.sub(r'([{,]\s*)([A-Za-z_]\w*)(\s*:)', r'\1"\2"\3', repaired)
+
+
+def load_json_value(text, openers='{['):
+    """
+    Parse the first JSON value in a model response, repairing it if needed.
+
+    Raises:
+        ResponseParseError: No JSON value could be recovered
+    """
+    candidate = find_json_value(text or '', openers)
+    if candidate is None:
+        raise ResponseParseError(f"No JSON found in model response: {text!r:.200}")
+    try:
+        return json.loads(candidate)
+    except ValueError:
+        pass
+    try:
+        return json.loads(_repair(candidate))
+    except ValueError as e:
+        raise ResponseParseError(f"Unparseable JSON in model response: {candidate!r:.200}") from e
+
+
+def normalize_sentiment(value):
+    """Map a free-form sentiment onto SENTIMENTS ('neutral' when nothing matches)"""
+    if isinstance(value, (list, tuple)):
+        value = value[0] if value else ''
+    text = str(value or '').strip().lower()
+    if text in SENTIMENTS:
+        return text
+    if text in SENTIMENT_SYNONYMS:
+        return SENTIMENT_SYNONYMS[text]
+    # "very sad", "sad/angry", "happy and excited": first word we recognise
+    for word in re.findall(r"[a-z]+", text):
+        if word in SENTIMENTS:
+            return word
+        if word in SENTIMENT_SYNONYMS:
+            return SENTIMENT_SYNONYMS[word]
+    return 'neutral'
+
+
+def normalize_keyword(value):
+    """A short lower-case topic; lists collapse to their first entry"""
+    if isinstance(value, (list, tuple)):
+        value = value[0] if value else ''
+    keyword = re.sub(r"\s+", ' ', str(value or '')).strip().strip('.').lower()
+    return ' '.join(keyword.split()[:3])
+
+
+def _first_field(obj, names):
+    lowered = {str(key).strip().lower(): value for key, value in obj.items()}
+    for name in names:
+        if lowered.get(name) not in (None, '', []):
+            return lowered[name]
+    return None
+
+
+def validate_analysis(obj):
+    """
+    Check a parsed object against the {sentiment, keyword} schema.
+
+    Returns:
+        dict: {'sentiment': one of SENTIMENTS, 'keyword': str}
+
+    Raises:
+        ResponseParseError: The object has no keyword or is not an object
+    """
+    if isinstance(obj, list) and len(obj) == 1:
+        obj = obj[0]
+    if not isinstance(obj, dict):
+        raise ResponseParseError(f"Expected a JSON object, got {type(obj).__name__}")
+    keyword = normalize_keyword(_first_field(obj, KEYWORD_FIELDS))
+    if not keyword:
+        raise ResponseParseError(f"Model response has no keyword: {obj!r:.200}")
+    return {'sentiment': normalize_sentiment(_first_field(obj, SENTIMENT_FIELDS)), 'keyword': keyword}
+
+
+def parse_analysis(text):
+    """
+    Parse a Gemini sentiment/keyword answer into {'sentiment', 'keyword'}.
+
+    Well-formed JSON takes the fast path (one scan plus json.loads); anything
+    else is repaired locally.
+
+    Raises:
+        ResponseParseError: Nothing usable in the response
+    """
+    try:
+        return validate_analysis(load_json_value(text, '{['))
+    except ResponseParseError:
+        # Last resort: "Sentiment: sad, Keyword: love" style prose
+        fields = dict(re.findall(r'(?i)\b(sentiment|mood|emotion|keyword|topic)\b["\']?\s*[:=]\s*["\']?([\w\- ]+)', text or ''))
+        if not fields:
+            raise
+        return validate_analysis(fields)
+
+
+def extract_json_from_response(response_text):
+    """The validated {'sentiment', 'keyword'} answer in a Gemini response"""
+    return parse_analysis(response_text)
@@ -0,0 +1,509 @@
+#!/usr/bin/env python3
+"""
+Materializes per-track aggregates in `tracks` from the `emotion_events` log.
+
+Run `python rollup.py --rebuild` to recompute every track from the event log,
+or `python rollup.py --synthetic 10000000` to benchmark a rebuild against a
+synthetic dataset in separate collections.
+"""
+
+import argparse
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from mongoDB import MongoDBManager, next_revision, release_revision
+from scoring import DEFAULT_HALF_LIFE_DAYS, decay_update_stages, half_life_ms, rank_factor
+
+load_dotenv()
+
+all_emotions = ['happy', 'sad', 'angry', 'surprise', 'fear', 'disgust', 'neutral', 'skipped']
+# A window claimed by a process that has not committed it within this long is taken over
+WINDOW_LEASE_SECONDS = 60
+
+
+def _as_utc(moment):
+    return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment
+
+
+def hour_key(hour):
+    """Field name used for the per-hour-of-day breakdown (hourly.h00 .. hourly.h23)"""
+    return f"h{hour:02d}"
+
+
+def ingested_between(lower, upper):
+    """
+    Query for events ingested in [lower, upper) (lower None: everything
+    before upper); events logged before ingested_at existed fall back to
+    their timestamp.
+    """
+    window = {'$lt': upper} if lower is None else {'$gte': lower, '$lt': upper}
+    return {'$or': [{'ingested_at': window},
+                    {'ingested_at': {'$exists': False}, 'timestamp': window}]}
+
+
+class RollupMaterializer:
+    def __init__(self, db, tracks_collection="tracks", events_collection="emotion_events",
+                 checkpoint_collection="rollup_checkpoints", half_life_days=DEFAULT_HALF_LIFE_DAYS,
+                 settle_seconds=10.0, interval=5.0, max_window=timedelta(hours=1), on_update=None,
+                 on_rebuild=None):
+        """
+        Incrementally folds new emotion events into per-track aggregates.
+
+        Events are consumed in windows of ingest time (`ingested_at`, stamped
+        by the event log when a batch is written) up to a high-water mark that
+        trails the clock by `settle_seconds`, so an insert still in flight is
+        not skipped. Because the windows follow ingest order rather than event
+        time, a batch written late (e.g. retried after a failed flush) is still
+        folded. The high-water mark is checkpointed after every window, so a
+        restart resumes where the last run stopped.
+
+        Every monitor process runs a materializer over the same collections,
+        so a window is claimed on the checkpoint (compare-and-set on the
+        high-water mark) before it is folded, and only the claimant folds it.
+        Each track records the upper bound of the last window folded into it
+        (`rollup_upper`) and a fold at or below that bound leaves the track
+        alone, so a window re-folded after a crash between the fold and the
+        checkpoint (its claim is taken over after WINDOW_LEASE_SECONDS) is not
+        counted twice.
+
+        Args:
+            db: pymongo Database holding the collections
+            tracks_collection (str): Collection holding the per-track aggregates
+            events_collection (str): Emotion event log collection
+            checkpoint_collection (str): Collection storing the high-water mark
+            half_life_days (float): Half-life used for `decayed_score`
+            settle_seconds (float): How far behind the clock the high-water mark trails
+                (covers clock skew and insert latency, not flush delays)
+            interval (float): Seconds between incremental runs in the background thread
+            max_window (timedelta): Largest time window folded in one batch
+            on_update (callable): Called with the list of updated track IDs after each batch
+            on_rebuild (callable): Called with the rebuild stats after rebuild(), which can
+                lower counts (e.g. to reseed leaderboards)
+        """
+        self.db = db
+        self.tracks_collection = tracks_collection
+        self.tracks = db[tracks_collection]
+        self.events = db[events_collection]
+        self.checkpoints = db[checkpoint_collection]
+        self.checkpoint_id = f"{tracks_collection}:{events_collection}"
+        self.half_life_ms = half_life_ms(half_life_days)
+        self.settle_seconds = settle_seconds
+        self.interval = interval
+        self.max_window = max_window
+        self.on_update = on_update
+        self.on_rebuild = on_rebuild
+
+        self._stopped = threading.Event()
+        self._thread = None
+
+    # --- Checkpointing ---
+
+    def get_checkpoint(self):
+        """Return the high-water mark (datetime) or None if never run"""
+        doc = self.checkpoints.find_one({'_id': self.checkpoint_id})
+        if not doc:
+            return None
+        return _as_utc(doc['high_water'])
+
+    def set_checkpoint(self, high_water):
+        """Move the high-water mark unconditionally (dropping any claimed window)"""
+        self.checkpoints.update_one(
+            {'_id': self.checkpoint_id},
+            {'$set': {'high_water': high_water, 'updated_at': datetime.now(timezone.utc)},
+             '$unset': {'pending': ''}},
+            upsert=True
+        )
+
+    def _init_checkpoint(self, high_water):
+        """Create the checkpoint unless another process just did; returns the stored mark"""
+        try:
+            self.checkpoints.update_one(
+                {'_id': self.checkpoint_id},
+                {'$setOnInsert': {'high_water': high_water, 'updated_at': datetime.now(timezone.utc)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            pass
+        return self.get_checkpoint()
+
+    def _claim_window(self, watermark):
+        """
+        Claim the next window after the stored high-water mark, up to
+        `watermark` and at most max_window long.
+
+        A claim left by a process that stopped before committing it is taken
+        over after WINDOW_LEASE_SECONDS, keeping its upper bound so the
+        tracks it already reached recognise the window.
+
+        Returns:
+            tuple: (lower, upper, token) of the claimed window, or None when
+                there is nothing to fold or another process holds the window
+        """
+        doc = self.checkpoints.find_one({'_id': self.checkpoint_id})
+        if not doc:
+            return None
+        high_water = _as_utc(doc['high_water'])
+        upper = min(high_water + self.max_window, watermark)
+        now = datetime.now(timezone.utc)
+        pending = doc.get('pending')
+        condition = {'_id': self.checkpoint_id, 'high_water': doc['high_water']}
+        if pending:
+            if now - _as_utc(pending['claimed_at']) < timedelta(seconds=WINDOW_LEASE_SECONDS):
+                return None
+            upper = _as_utc(pending['upper'])
+            condition['pending.token'] = pending['token']
+            print(f"⚠️ Taking over an uncommitted rollup window up to {upper.isoformat()}")
+        elif high_water >= upper:
+            return None
+        else:
+            condition['pending'] = None
+        token = uuid.uuid4().hex
+        result = self.checkpoints.update_one(
+            condition, {'$set': {'pending': {'upper': upper, 'token': token, 'claimed_at': now}}}
+        )
+        if not result.modified_count:
+            return None
+        return high_water, upper, token
+
+    def _abandon_window(self, token):
+        """Let the next run take over a window whose fold failed, with the same upper bound"""
+        self.checkpoints.update_one(
+            {'_id': self.checkpoint_id, 'pending.token': token},
+            {'$set': {'pending.claimed_at': datetime.fromtimestamp(0, timezone.utc)}}
+        )
+
+    def _commit_window(self, upper, token):
+        """Move the high-water mark to a folded window's upper bound"""
+        self.checkpoints.update_one(
+            {'_id': self.checkpoint_id, 'pending.token': token},
+            {'$set': {'high_water': upper, 'updated_at': datetime.now(timezone.utc)},
+             '$unset': {'pending': ''}}
+        )
+
+    # --- Incremental path ---
+
+    def _fold(self, events, upper, rev):
+        """
+        Collapse a batch of events into one pipeline update per track,
+        stamped with revision `rev`. The update leaves a track untouched when
+        its `rollup_upper` shows this window was already folded into it.
+
+        Returns:
+            tuple: (updated track IDs, list of UpdateOne operations)
+        """
+        deltas = {}
+        for event in events:
+            track_id = (event.get('meta') or {}).get('track_id')
+            if not track_id:
+                continue
+            delta = deltas.setdefault(track_id, {'score': 0, 'decayed': 0.0, 'emotions': {}, 'hours': {}})
+            score = event.get('score', 0) or 0
+            timestamp = event['timestamp']
+            if timestamp.tzinfo is None:
+                timestamp = timestamp.replace(tzinfo=timezone.utc)
+            age_ms = (upper - timestamp).total_seconds() * 1000
+            delta['score'] += score
+            delta['decayed'] += score * 0.5 ** (age_ms / self.half_life_ms)
+            emotion = event.get('emotion', 'neutral')
+            delta['emotions'][emotion] = delta['emotions'].get(emotion, 0) + 1
+            hour = hour_key(timestamp.hour)
+            delta['hours'][hour] = delta['hours'].get(hour, 0) + 1
+
+        applied = {'$gte': ['$rollup_upper', upper]}
+
+        def unless_applied(stage):
+            return {'$set': {field: {'$cond': [applied, f'${field}', value]}
+                             for field, value in stage['$set'].items()}}
+
+        now = datetime.now(timezone.utc)
+        operations = []
+        for track_id, delta in deltas.items():
+            fields = {
+                'total_score': {'$add': [{'$ifNull': ['$total_score', 0]}, delta['score']]},
+                'updated_at': {'$literal': now},
+                'rev': {'$literal': rev},
+            }
+            # Keep every emotion_* counter present, as update_track_score does
+            for emotion in all_emotions:
+                count = delta['emotions'].get(emotion, 0)
+                fields[f'emotion_{emotion}'] = {'$add': [{'$ifNull': [f'$emotion_{emotion}', 0]}, count]}
+            for hour, count in delta['hours'].items():
+                fields[f'hourly.{hour}'] = {'$add': [{'$ifNull': [f'$hourly.{hour}', 0]}, count]}
+            # Events are pre-decayed to `upper`, so the batch folds in as one event at `upper`
+            stages = [{'$set': fields}] + decay_update_stages(delta['decayed'], upper, self.half_life_ms)
+            pipeline = [unless_applied(stage) for stage in stages] + [
+                # Last, so every stage above still sees the previous value
+                {'$set': {'track_id': track_id,
+                          'rollup_upper': {'$cond': [applied, '$rollup_upper', {'$literal': upper}]}}}
+            ]
+            operations.append(UpdateOne({'track_id': track_id}, pipeline, upsert=True))
+        return list(deltas), operations
+
+    def run_once(self, settle_seconds=None):
+        """
+        Fold every settled event past the checkpoint into `tracks`.
+
+        Args:
+            settle_seconds (float): Override the settle window, e.g. 0 at
+                shutdown once the event log has been flushed
+
+        Returns:
+            int: Number of events processed
+        """
+        settle_seconds = self.settle_seconds if settle_seconds is None else settle_seconds
+        # Stored times have millisecond precision; reach past the current
+        # millisecond so a batch written in it is inside the window, and cut
+        # to whole milliseconds so the stored high-water mark can equal it
+        watermark = datetime.now(timezone.utc) - timedelta(seconds=settle_seconds, milliseconds=-1)
+        watermark = watermark.replace(microsecond=watermark.microsecond // 1000 * 1000)
+        high_water = self.get_checkpoint()
+        if high_water is None:
+            # Counters written before the materializer existed were maintained
+            # inline, so only events from now on are folded. Use --rebuild to
+            # derive everything from the event log instead.
+            high_water = self._init_checkpoint(watermark)
+            print(f"📌 Rollup checkpoint initialized at {high_water.isoformat()}")
+            return 0
+
+        processed = 0
+        while True:
+            # None: caught up, or another process is folding the next window
+            claim = self._claim_window(watermark)
+            if claim is None:
+                break
+            lower, upper, token = claim
+            events = list(self.events.find(
+                ingested_between(lower, upper),
+                {'timestamp': 1, 'meta.track_id': 1, 'emotion': 1, 'score': 1}
+            ))
+            if events:
+                # One revision for the whole batch, released once it is written
+                rev = next_revision(self.db, self.tracks_collection)
+                try:
+                    track_ids, operations = self._fold(events, upper, rev)
+                    if operations:
+                        self.tracks.bulk_write(operations, ordered=False)
+                except Exception:
+                    self._abandon_window(token)
+                    raise
+                finally:
+                    release_revision(self.db, self.tracks_collection, rev)
+                if operations and self.on_update:
+                    try:
+                        self.on_update(track_ids)
+                    except Exception as e:
+                        print(f"⚠️ Rollup update callback failed: {e}")
+                processed += len(events)
+            self._commit_window(upper, token)
+        return processed
+
+    def start(self):
+        """Run incremental rollups in a background thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join(timeout=5.0)
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            try:
+                processed = self.run_once()
+                if processed:
+                    print(f"📈 Rolled up {processed} emotion events")
+            except Exception as e:
+                print(f"❌ Error materializing rollups: {e}")
+            self._stopped.wait(self.interval)
+
+    # --- Full rebuild ---
+
+    def rebuild_pipeline(self, upper, rev):
+        """
+        Aggregation over the event log recomputing every track's aggregates
+        from the events ingested before `upper`, ending in a $merge into the
+        tracks collection. The stages before $project hold the per-track
+        totals and can be run on their own (tests compare them with run_once()).
+        """
+        settled = ingested_between(None, upper)
+        emotion_sums = {
+            f'emotion_{emotion}': {'$sum': {'$cond': [{'$eq': ['$emotion', emotion]}, 1, 0]}}
+            for emotion in all_emotions
+        }
+        age_ms = {'$subtract': [upper, '$timestamp']}
+        return [
+            {'$match': settled},
+            # First pass: one group per (track, hour of day)
+            {'$group': {
+                '_id': {'track_id': '$meta.track_id', 'hour': {'$hour': '$timestamp'}},
+                'events': {'$sum': 1},
+                'total_score': {'$sum': '$score'},
+                'decayed_score': {'$sum': {'$multiply': [
+                    '$score', {'$pow': [0.5, {'$divide': [age_ms, self.half_life_ms]}]}
+                ]}},
+                **emotion_sums
+            }},
+            # Second pass: fold the hours into one document per track
+            {'$group': {
+                '_id': '$_id.track_id',
+                'events': {'$sum': '$events'},
+                'total_score': {'$sum': '$total_score'},
+                'decayed_score': {'$sum': '$decayed_score'},
+                **{field: {'$sum': f'${field}'} for field in emotion_sums},
+                'hourly': {'$push': {
+                    'k': {'$concat': ['h', {'$cond': [
+                        {'$lt': ['$_id.hour', 10]},
+                        {'$concat': ['0', {'$toString': '$_id.hour'}]},
+                        {'$toString': '$_id.hour'}
+                    ]}]},
+                    'v': '$events'
+                }}
+            }},
+            {'$match': {'_id': {'$ne': None}}},
+            {'$project': {
+                '_id': 0,
+                'track_id': '$_id',
+                'total_score': 1,
+                'decayed_score': 1,
+                'decayed_at': {'$literal': upper},
+                'decay_rank': {'$multiply': ['$decayed_score', rank_factor(upper, self.half_life_ms)]},
+                'updated_at': '$$NOW',
+                'rev': {'$literal': rev},
+                'rollup_upper': {'$literal': upper},
+                'hourly': {'$arrayToObject': '$hourly'},
+                **{field: 1 for field in emotion_sums}
+            }},
+            {'$merge': {
+                'into': self.tracks.name,
+                'on': 'track_id',
+                'whenMatched': 'merge',
+                'whenNotMatched': 'insert'
+            }}
+        ]
+
+    def rebuild(self):
+        """
+        Recompute the aggregates of every track that has events, server-side,
+        and move the checkpoint to the rebuild point.
+
+        Counters for tracks with events are replaced by the values derived from
+        the log, so history older than the log's retention is dropped for them.
+
+        Returns:
+            dict: events, tracks and elapsed seconds / events per second
+        """
+        upper = datetime.now(timezone.utc) - timedelta(seconds=self.settle_seconds)
+        try:
+            self.tracks.create_index('track_id', unique=True)
+        except OperationFailure as e:
+            print(f"⚠️ Could not create unique track_id index ({e}); $merge requires it")
+            raise
+
+        # The same ingest-time cut the incremental path resumes from
+        settled = ingested_between(None, upper)
+        rev = next_revision(self.db, self.tracks_collection)
+        pipeline = self.rebuild_pipeline(upper, rev)
+
+        event_count = self.events.count_documents(settled)
+        started = time.perf_counter()
+        try:
+            self.events.aggregate(pipeline, allowDiskUse=True)
+        finally:
+            release_revision(self.db, self.tracks_collection, rev)
+        elapsed = time.perf_counter() - started
+        self.set_checkpoint(upper)
+
+        stats = {
+            'events': event_count,
+            'tracks': self.tracks.count_documents({'decayed_at': upper}),
+            'elapsed_seconds': round(elapsed, 2),
+            'events_per_second': round(event_count / elapsed) if elapsed > 0 else None
+        }
+        if self.on_rebuild:
+            try:
+                self.on_rebuild(stats)
+            except Exception as e:
+                print(f"⚠️ Rollup rebuild callback failed: {e}")
+        return stats
+
+
+def seed_synthetic_events(collection, count, track_count=50_000, chunk_size=100_000, days=365):
+    """Insert `count` random emotion events spread over the last `days` days"""
+    now = datetime.now(timezone.utc)
+    scores = {'happy': 1, 'sad': -1, 'angry': -1, 'fear': -1, 'disgust': -1, 'skipped': -1}
+    track_ids = [f"synthetic{i:07d}" for i in range(track_count)]
+    inserted = 0
+    started = time.perf_counter()
+    while inserted < count:
+        batch = []
+        for _ in range(min(chunk_size, count - inserted)):
+            emotion = random.choice(all_emotions)
+            batch.append({
+                'timestamp': now - timedelta(seconds=random.random() * days * 86400),
+                'meta': {'user_id': 'synthetic', 'track_id': random.choice(track_ids)},
+                'emotion': emotion,
+                'score': scores.get(emotion, 0),
+                'probabilities': {},
+                'progress_ms': random.randint(0, 240_000)
+            })
+        collection.insert_many(batch, ordered=False)
+        inserted += len(batch)
+        print(f"🧪 Seeded {inserted}/{count} events")
+    elapsed = time.perf_counter() - started
+    print(f"🧪 Seeded {count} events in {elapsed:.1f}s ({count / elapsed:,.0f} events/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Materialize per-track aggregates from the emotion event log")
+    parser.add_argument('--rebuild', action='store_true', help="Recompute all tracks from the event log")
+    parser.add_argument('--synthetic', type=int, metavar='N',
+                        help="Benchmark a rebuild on N synthetic events (uses *_synthetic collections)")
+    args = parser.parse_args()
+
+    connection_string = os.getenv('MONGODB_URI')
+    if not connection_string:
+        print("❌ MONGODB_URI environment variable not set. Please set it in a .env file.")
+        return
+
+    mongo_manager = MongoDBManager(connection_string, "spotilike", "tracks")
+    if not mongo_manager.connect():
+        return
+
+    try:
+        if args.synthetic:
+            db = mongo_manager.db
+            for name in ('emotion_events_synthetic', 'tracks_synthetic'):
+                db.drop_collection(name)
+            db.create_collection('emotion_events_synthetic',
+                                 timeseries={'timeField': 'timestamp', 'metaField': 'meta', 'granularity': 'seconds'})
+            seed_synthetic_events(db['emotion_events_synthetic'], args.synthetic)
+            materializer = RollupMaterializer(db, tracks_collection='tracks_synthetic',
+                                              events_collection='emotion_events_synthetic', settle_seconds=0)
+            stats = materializer.rebuild()
+            print(f"⏱️ Rebuilt {stats['tracks']} tracks from {stats['events']:,} events "
+                  f"in {stats['elapsed_seconds']}s ({stats['events_per_second']:,} events/s)")
+        elif args.rebuild:
+            materializer = RollupMaterializer(mongo_manager.db)
+            stats = materializer.rebuild()
+            print(f"⏱️ Rebuilt {stats['tracks']} tracks from {stats['events']:,} events "
+                  f"in {stats['elapsed_seconds']}s ({stats['events_per_second']:,} events/s)")
+        else:
+            materializer = RollupMaterializer(mongo_manager.db)
+            processed = materializer.run_once()
+            print(f"📈 Rolled up {processed} emotion events")
+    finally:
+        mongo_manager.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Track scores: what one emotion observation is worth, and time decay.
+
+Each track stores `decayed_score` (its value at `decayed_at`) and decays
+exponentially with a fixed half-life. An event only touches its own track:
+the stored value is decayed to the event time and the event's score added,
+an O(1) update. Reading the score at any later time applies the remaining
+decay lazily.
+
+Ranking doesn't need the current values: the score scaled to a fixed epoch,
+    decay_rank = decayed_score * 2 ** ((decayed_at - RANK_EPOCH) / half_life)
+differs from the value "now" by the same positive factor for every track, so
+sorting an index on `decay_rank` gives the ranking at any read time without
+rewriting documents.
+"""
+
+from datetime import datetime, timezone
+
+DEFAULT_HALF_LIFE_DAYS = 30
+# Reference time for decay_rank. The scale factor doubles every half-life
+# (about 12 doublings a year at 30 days), so floats hold it for ~80 years.
+RANK_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def half_life_ms(half_life_days=DEFAULT_HALF_LIFE_DAYS):
+    return half_life_days * 24 * 3600 * 1000
+
+
+def _as_utc(moment):
+    return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment
+
+
+def _elapsed_ms(start, end):
+    return (_as_utc(end) - _as_utc(start)).total_seconds() * 1000
+
+
+def decay_factor(start, end, half_life=half_life_ms()):
+    """Multiplier taking a score at `start` to its value at `end`"""
+    return 0.5 ** (_elapsed_ms(start, end) / half_life)
+
+
+def decayed_value(score, decayed_at, now=None, half_life=half_life_ms()):
+    """A stored decayed score as of `now`"""
+    if not score or decayed_at is None:
+        return score or 0.0
+    return score * decay_factor(decayed_at, now or datetime.now(timezone.utc), half_life)
+
+
+def apply_event(score, decayed_at, delta, event_time, half_life=half_life_ms()):
+    """
+    Fold one scored event into a stored decayed score.
+
+    Returns:
+        tuple: (new decayed_score, new decayed_at)
+    """
+    if decayed_at is None:
+        return float(delta), event_time
+    if _as_utc(event_time) >= _as_utc(decayed_at):
+        return decayed_value(score, decayed_at, event_time, half_life) + delta, event_time
+    # Late event: decay it to the stored time instead of moving time backwards
+    return score + delta * decay_factor(event_time, decayed_at, half_life), decayed_at
+
+
+def rank_factor(decayed_at, half_life=half_life_ms()):
+    """Scale from a score at `decayed_at` to RANK_EPOCH units"""
+    return 2 ** (_elapsed_ms(RANK_EPOCH, decayed_at) / half_life)
+
+
+def rank_key(score, decayed_at, half_life=half_life_ms()):
+    """decay_rank for a stored decayed score"""
+    return (score or 0.0) * rank_factor(decayed_at, half_life)
+
+
+def value_from_rank(decay_rank, now=None, half_life=half_life_ms()):
+    """Current decayed score from a decay_rank"""
+    return (decay_rank or 0.0) / rank_factor(now or datetime.now(timezone.utc), half_life)
+
+
+# How much each detected emotion says about liking the track
+EMOTION_VALENCE = {
+    'happy': 1.0,
+    'surprise': 0.0,
+    'neutral': 0.0,
+    'sad': -1.0,
+    'angry': -1.0,
+    'fear': -1.0,
+    'disgust': -1.0,
+}
+# Observations scoring closer to zero than this aren't worth a write
+MIN_OBSERVATION_SCORE = 0.05
+
+
+def score_from_emotions(probabilities=None, face_confidence=None, emotion=None):
+    """
+    Score for one emotion observation: the probability-weighted valence of
+    the detector's emotion distribution, scaled by how sure the face detector
+    was that it saw a face. A confident, clear reaction scores near ±1; an
+    ambiguous mix or a doubtful detection scores near 0.
+
+    Args:
+        probabilities (dict): Emotion -> probability (0-1; percentages are rescaled)
+        face_confidence (float): Face detection confidence (0-1), None if unknown
+        emotion (str): Dominant emotion, used when probabilities are missing
+
+    Returns:
+        float: Score in [-1, 1], or 0.0 below MIN_OBSERVATION_SCORE
+    """
+    weights = {name: float(value) for name, value in (probabilities or {}).items()
+               if name in EMOTION_VALENCE and value}
+    total = sum(weights.values())
+    if total > 0:
+        # Mass missing from a partial distribution counts as neutral
+        valence = sum(EMOTION_VALENCE[name] * value for name, value in weights.items()) / max(total, 1.0)
+    else:
+        valence = EMOTION_VALENCE.get(emotion, 0.0)
+
+    confidence = 1.0 if face_confidence is None else min(max(float(face_confidence), 0.0), 1.0)
+    score = valence * confidence
+    if abs(score) < MIN_OBSERVATION_SCORE:
+        return 0.0
+    return round(score, 4)
+
+
+# --- MongoDB update expressions ---
+
+def decay_factor_expr(at, half_life=half_life_ms()):
+    """0.5 ** ((at - $decayed_at) / half_life) as an aggregation expression"""
+    return {'$pow': [0.5, {'$divide': [
+        {'$subtract': [at, {'$ifNull': ['$decayed_at', at]}]},
+        half_life
+    ]}]}
+
+
+def decay_update_stages(delta, at, half_life=half_life_ms()):
+    """
+    Pipeline-update stages folding a score `delta` at time `at` into a track.
+
+    Meant for `at` no earlier than the stored decayed_at (writers stamp the
+    time of the event); an earlier `at` moves the stored time back with it.
+
+    Returns:
+        list: $set stages for decayed_score, decayed_at and decay_rank
+    """
+    return [
+        {'$set': {
+            'decayed_score': {'$add': [
+                {'$multiply': [{'$ifNull': ['$decayed_score', 0]}, decay_factor_expr(at, half_life)]},
+                delta
+            ]},
+            'decayed_at': at,
+        }},
+        {'$set': {'decay_rank': {'$multiply': ['$decayed_score', rank_factor(at, half_life)]}}},
+    ]
+
+
+def top_by_decayed_score(collection, limit=10, now=None, filter_query=None, half_life=half_life_ms()):
+    """
+    Tracks with the highest decayed score as of `now`, read from the
+    decay_rank index; each document gets its current `score_now`.
+    """
+    now = now or datetime.now(timezone.utc)
+    docs = list(collection.find(filter_query or {}).sort('decay_rank', -1).limit(limit))
+    for doc in docs:
+        doc['score_now'] = value_from_rank(doc.get('decay_rank'), now, half_life)
+    return docs
@@ -0,0 +1,41 @@
+"""
+Shared cache of Spotify search results.
+
+Mood/keyword queries such as "sad love" repeat across users, so results are
+kept per normalized (query, type, limit). Fresh entries skip the Spotify
+round trip; for a while after expiry the old results are still served while
+one background search refreshes them.
+"""
+
+import os
+from analysis_cache import normalize_text
+from cache import TTLCache
+
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", str(3600)))
+SEARCH_CACHE_STALE_TTL = float(os.getenv("SEARCH_CACHE_STALE_SECONDS", str(24 * 3600)))
+
+search_cache = TTLCache('search_cache', max_entries=2048, ttl=SEARCH_CACHE_TTL, stale_ttl=SEARCH_CACHE_STALE_TTL)
+
+
+def search_key(query, search_type='track', limit=10):
+    """Cache key: normalized query text, search type and result limit"""
+    return (normalize_text(query), search_type, int(limit))
+
+
+def cached_search(sp, query, search_type='track', limit=10):
+    """
+    sp.search() through the shared search cache.
+
+    Args:
+        sp: spotipy.Spotify client used on a miss or refresh
+        query (str): Search query
+        search_type (str): Spotify search type
+        limit (int): Number of results
+
+    Returns:
+        dict: The Spotify search response
+    """
+    return search_cache.get_or_compute(
+        search_key(query, search_type, limit),
+        lambda: sp.search(q=query, type=search_type, limit=limit)
+    )
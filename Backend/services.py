@@ -0,0 +1,247 @@
+"""
+Service objects that load heavy dependencies on first use.
+
+Importing OpenCV, DeepFace/TensorFlow or the Gemini SDK takes seconds, and
+building a Spotify client can start an interactive OAuth flow, so none of it
+happens at import time. Modules ask for the shared instances through
+get_spotify()/get_gemini(); tests and workers can inject fakes with
+set_spotify()/set_gemini() and tear everything down with close_services().
+"""
+
+import copy
+import importlib
+import os
+import threading
+
+
+class VisionService:
+    def __init__(self):
+        """OpenCV and DeepFace, imported the first time they are used"""
+        self._cv2 = None
+        self._deepface = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._deepface is not None
+
+    @property
+    def cv2(self):
+        if self._cv2 is None:
+            with self._lock:
+                if self._cv2 is None:
+                    self._cv2 = importlib.import_module('cv2')
+        return self._cv2
+
+    @property
+    def DeepFace(self):
+        if self._deepface is None:
+            with self._lock:
+                if self._deepface is None:
+                    print("⏳ Loading DeepFace (first use)...")
+                    self._deepface = importlib.import_module('deepface').DeepFace
+        return self._deepface
+
+    def open_camera(self, index=0):
+        """Open a cv2.VideoCapture for the given camera index"""
+        return self.cv2.VideoCapture(index)
+
+    def analyze_emotion(self, frame):
+        """Run DeepFace emotion analysis on a frame"""
+        return self.DeepFace.analyze(frame, actions=['emotion'], enforce_detection=False)
+
+    def extract_faces(self, frame, detector_backend='opencv'):
+        """Detect faces in a frame"""
+        return self.DeepFace.extract_faces(frame, detector_backend=detector_backend)
+
+
+class GeminiService:
+    def __init__(self, api_key=None, model_name='gemini-1.5-flash', sdk='generativeai'):
+        """
+        Gemini text generation, configured the first time it is used.
+
+        Args:
+            api_key (str): Gemini API key (defaults to GEM_API_KEY)
+            model_name (str): Gemini model to call
+            sdk (str): 'generativeai' (google.generativeai) or 'genai' (google.genai client)
+        """
+        self.api_key = api_key
+        self.model_name = model_name
+        self.sdk = sdk
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def _get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    api_key = self.api_key or os.getenv("GEM_API_KEY")
+                    if self.sdk == 'genai':
+                        genai = importlib.import_module('google.genai')
+                        self._model = genai.Client(api_key=api_key)
+                    else:
+                        genai = importlib.import_module('google.generativeai')
+                        genai.configure(api_key=api_key)
+                        self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    def generate(self, prompt, timeout=None):
+        """
+        Send a prompt to Gemini and return the response text.
+
+        Args:
+            prompt (str): Prompt text
+            timeout (float): Seconds before the HTTP request is abandoned (None: SDK default)
+        """
+        model = self._get_model()
+        if self.sdk == 'genai':
+            config = {'http_options': {'timeout': int(timeout * 1000)}} if timeout else None
+            response = model.models.generate_content(model=self.model_name, contents=prompt, config=config)
+        else:
+            request_options = {'timeout': timeout} if timeout else None
+            response = model.generate_content(prompt, request_options=request_options)
+        return response.text
+
+    def close(self):
+        self._model = None
+
+
+class SpotifyService:
+    def __init__(self, factory=None):
+        """
+        A Spotify client built on first use.
+
+        Args:
+            factory (callable): Returns a spotipy.Spotify (defaults to main.auth)
+        """
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._client is not None
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    factory = self._factory
+                    if factory is None:
+                        from main import auth
+                        factory = auth
+                    self._client = factory()
+                    if self._client is None:
+                        raise RuntimeError("Spotify client could not be created; check CLIENT_ID and CLIENT_SECRET")
+        return self._client
+
+    def close(self):
+        self._client = None
+
+
+# --- Shared instances ---
+
+_spotify = None
+_gemini = None
+_services_lock = threading.Lock()
+
+
+def get_spotify():
+    """The shared Spotify client, built on first call"""
+    global _spotify
+    with _services_lock:
+        if _spotify is None:
+            _spotify = SpotifyService()
+        service = _spotify
+    return service.client if isinstance(service, SpotifyService) else service
+
+
+def set_spotify(client):
+    """Replace the shared Spotify client (a spotipy.Spotify, a SpotifyService or a fake)"""
+    global _spotify
+    with _services_lock:
+        _spotify = client
+
+
+# Per client class, a subclass whose instances use a session without owning it
+_borrower_classes = {}
+
+
+def _borrow_client(sp):
+    """
+    A shallow copy of a spotipy client that shares its session and auth.
+    spotipy's __del__ closes _session, so the copy's class drops __del__:
+    collecting the copy must not close the shared client's connection pool.
+    """
+    cls = type(sp)
+    with _services_lock:
+        borrower = _borrower_classes.get(cls)
+        if borrower is None:
+            borrower = _borrower_classes[cls] = type(f"Borrowed{cls.__name__}", (cls,), {'__del__': lambda self: None})
+    client = object.__new__(borrower)
+    client.__dict__.update(sp.__dict__)
+    return client
+
+
+def spotify_with_timeout(sp, timeout):
+    """
+    A client whose HTTP calls give up after `timeout` seconds, for a call that
+    may be abandoned at a deadline. spotipy reads requests_timeout on every
+    call, so this is a copy borrowing the shared client's session (keep-alive
+    connections included) and auth; the shared client keeps its own timeout.
+    Clients without requests_timeout (fakes) are returned as they are.
+    """
+    if timeout is None or not hasattr(sp, 'requests_timeout'):
+        return sp
+    client = _borrow_client(sp)
+    client.requests_timeout = max(timeout, 0.1)
+    return client
+
+
+def spotify_without_retries(sp):
+    """
+    A client whose HTTP calls are sent once, for calls that are not safe to
+    repeat (adding to the queue). spotipy's session retries 429s and 5xx
+    responses, POSTs included, underneath any retries of our own; this copy
+    gets a plain session instead, sharing the auth. Fakes are returned as
+    they are.
+    """
+    if not hasattr(sp, '_session'):
+        return sp
+    import requests
+
+    client = copy.copy(sp)
+    client._session = requests.Session()
+    return client
+
+
+def get_gemini():
+    """The shared Gemini service (anything with a generate(prompt, timeout=None) method)"""
+    global _gemini
+    with _services_lock:
+        if _gemini is None:
+            _gemini = GeminiService()
+        return _gemini
+
+
+def set_gemini(service):
+    """Replace the shared Gemini service, e.g. with a fake in tests"""
+    global _gemini
+    with _services_lock:
+        _gemini = service
+
+
+def close_services():
+    """Drop the shared clients; they are rebuilt on next use"""
+    global _spotify, _gemini
+    with _services_lock:
+        for service in (_spotify, _gemini):
+            if hasattr(service, 'close'):
+                service.close()
+        _spotify = None
+        _gemini = None
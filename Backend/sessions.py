@@ -0,0 +1,248 @@
+"""
+Listening sessions.
+
+The monitor sees playback as a stream of ticks. Sessionizer groups those
+ticks, and the emotions observed during them, into sessions: a session
+starts when something plays and ends after SESSION_GAP_SECONDS without
+playback or when playback moves to another device. Each session's
+aggregates (tracks, listening time, mood counts, score, skips) are kept up
+to date in memory and checkpointed as one small document, so "how did this
+session feel" is a single read instead of a scan over emotion events.
+"""
+
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from pymongo import DESCENDING
+
+SESSION_GAP_SECONDS = 30 * 60
+# Longest stretch between two ticks still counted as listening time
+MAX_TICK_SECONDS = 60
+CHECKPOINT_INTERVAL_SECONDS = 60
+
+
+def _as_utc(moment):
+    return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment
+
+
+class Sessionizer:
+    def __init__(self, db, collection_name="listening_sessions", user_id=None,
+                 gap_seconds=SESSION_GAP_SECONDS, checkpoint_interval=CHECKPOINT_INTERVAL_SECONDS):
+        """
+        Args:
+            db: pymongo Database the session documents live in
+            collection_name (str): Collection with one document per session
+            user_id (str): Spotify user ID stamped on new sessions
+            gap_seconds (float): Idle time that ends a session
+            checkpoint_interval (float): Write an open session at least this often (seconds)
+        """
+        self.collection = db[collection_name]
+        self.user_id = user_id
+        self.gap = timedelta(seconds=gap_seconds)
+        self.checkpoint_interval = timedelta(seconds=checkpoint_interval)
+
+        self._session = None
+        self._track_positions = {}
+        # Track that played before current_track, the one a skip refers to
+        self._previous_track = None
+        self._last_playing_at = None
+        self._was_playing = False
+        self._last_checkpoint = None
+        self._lock = threading.Lock()
+
+    def ensure_indexes(self):
+        self.collection.create_index([('user_id', 1), ('started_at', DESCENDING)])
+        self.collection.create_index([('open', 1), ('last_seen_at', 1)])
+
+    def close_stale(self, now=None):
+        """
+        Mark sessions left open by a previous run as ended at their last
+        checkpoint. Called at startup, before this process opens a session.
+
+        Other monitors may share the collection, so only sessions nobody can
+        still be extending are closed: this user's (nothing resumes an
+        earlier run's session, however recent) and anyone's idle for longer
+        than the session gap.
+
+        Returns:
+            int: Number of sessions closed
+        """
+        now = _as_utc(now or datetime.now(timezone.utc))
+        query = {'open': True, 'last_seen_at': {'$lt': now - self.gap}}
+        if self.user_id:
+            query = {'open': True, '$or': [{'user_id': self.user_id},
+                                           {'last_seen_at': {'$lt': now - self.gap}}]}
+        result = self.collection.update_many(
+            query,
+            [{'$set': {'open': False, 'ended_at': '$last_seen_at'}}]
+        )
+        return result.modified_count
+
+    # --- Feeding ---
+
+    def observe_playback(self, snapshot, at=None):
+        """
+        Fold one playback snapshot (sp.current_playback()) into the sessions.
+
+        Returns:
+            dict: The current session summary, or None outside a session
+        """
+        at = _as_utc(at or datetime.now(timezone.utc))
+        item = (snapshot or {}).get('item')
+        playing = bool(item and snapshot.get('is_playing', True))
+        device = (snapshot or {}).get('device') or {}
+
+        with self._lock:
+            session = self._session
+            if session is not None:
+                idle_since = self._last_playing_at or session['started_at']
+                moved = playing and device.get('id') and session['device'].get('id') \
+                    and device.get('id') != session['device'].get('id')
+                if at - idle_since > self.gap or moved:
+                    self._close_locked(idle_since)
+                    session = None
+
+            if not playing:
+                if session is not None:
+                    session['last_seen_at'] = at
+                self._was_playing = False
+                self._maybe_checkpoint_locked(at)
+                return self._summary_locked()
+
+            if session is None:
+                session = self._open_locked(at, device)
+
+            seconds = 0.0
+            if self._was_playing:
+                seconds = min((at - self._last_playing_at).total_seconds(), MAX_TICK_SECONDS)
+            track = self._track_locked(item['id'])
+            track['seconds'] = round(track['seconds'] + seconds, 1)
+            session['listened_seconds'] = round(session['listened_seconds'] + seconds, 1)
+            if session['current_track'] != item['id']:
+                self._previous_track = session['current_track']
+            session['current_track'] = item['id']
+            session['last_seen_at'] = at
+            self._last_playing_at = at
+            self._was_playing = True
+            self._maybe_checkpoint_locked(at)
+            return self._summary_locked()
+
+    def observe_emotion(self, emotion, score=0, at=None):
+        """
+        Count one emotion observation against the track playing in the
+        current session. A 'skipped' event is reported once the next track
+        plays, so it counts against the track before it. Ignored outside a
+        session.
+        """
+        at = _as_utc(at or datetime.now(timezone.utc))
+        with self._lock:
+            session = self._session
+            if session is None or not session['current_track']:
+                return
+            if emotion == 'skipped':
+                session['skips'] += 1
+                # No previous track: the skipped one played before this session
+                track = self._track_locked(self._previous_track) if self._previous_track else None
+                if track is not None:
+                    track['skipped'] = True
+            else:
+                track = self._track_locked(session['current_track'])
+                session['moods'][emotion] = session['moods'].get(emotion, 0) + 1
+                session['observations'] += 1
+                session['dominant_mood'] = max(session['moods'], key=session['moods'].get)
+            if score:
+                session['score'] = round(session['score'] + score, 4)
+                if track is not None:
+                    track['score'] = round(track['score'] + score, 4)
+            session['last_seen_at'] = at
+
+    def close(self, at=None):
+        """End the current session (e.g. when monitoring stops)"""
+        with self._lock:
+            if self._session is not None:
+                self._close_locked(_as_utc(at or self._session['last_seen_at']))
+
+    # --- Reading ---
+
+    def current(self):
+        """Summary of the open session, or None"""
+        with self._lock:
+            return self._summary_locked()
+
+    def get(self, session_id):
+        return self.collection.find_one({'_id': session_id})
+
+    def recent(self, limit=10, user_id=None):
+        """Most recently started sessions, newest first"""
+        query = {'user_id': user_id} if user_id else {}
+        return list(self.collection.find(query).sort('started_at', DESCENDING).limit(limit))
+
+    # --- Internals (called with the lock held) ---
+
+    def _open_locked(self, at, device):
+        self._session = {
+            '_id': uuid.uuid4().hex,
+            'user_id': self.user_id,
+            'open': True,
+            'started_at': at,
+            'last_seen_at': at,
+            'ended_at': None,
+            'device': {key: device.get(key) for key in ('id', 'name', 'type')},
+            'tracks': [],
+            'current_track': None,
+            'listened_seconds': 0.0,
+            'moods': {},
+            'observations': 0,
+            'dominant_mood': None,
+            'score': 0.0,
+            'skips': 0,
+        }
+        self._track_positions = {}
+        self._previous_track = None
+        self._last_playing_at = None
+        self._was_playing = False
+        self._last_checkpoint = None
+        return self._session
+
+    def _track_locked(self, track_id):
+        position = self._track_positions.get(track_id)
+        if position is None:
+            position = self._track_positions[track_id] = len(self._session['tracks'])
+            self._session['tracks'].append({'track_id': track_id, 'seconds': 0.0, 'score': 0.0, 'skipped': False})
+        return self._session['tracks'][position]
+
+    def _summary_locked(self):
+        if self._session is None:
+            return None
+        summary = dict(self._session)
+        summary['tracks'] = [dict(track) for track in self._session['tracks']]
+        summary['moods'] = dict(self._session['moods'])
+        return summary
+
+    def _maybe_checkpoint_locked(self, at):
+        if self._session is None:
+            return
+        if self._last_checkpoint is None or at - self._last_checkpoint >= self.checkpoint_interval:
+            self._write_locked()
+            self._last_checkpoint = at
+
+    def _write_locked(self):
+        document = self._summary_locked()
+        document.pop('current_track', None)
+        try:
+            self.collection.replace_one({'_id': document['_id']}, document, upsert=True)
+        except Exception as e:
+            print(f"❌ Error saving listening session {document['_id']}: {e}")
+
+    def _close_locked(self, ended_at):
+        session = self._session
+        session['open'] = False
+        session['ended_at'] = ended_at
+        self._write_locked()
+        print(f"🎧 Session {session['_id'][:8]} ended: {len(session['tracks'])} tracks, "
+              f"{round(session['listened_seconds'] / 60)} min, mood {session['dominant_mood'] or 'unknown'}")
+        self._session = None
+        self._track_positions = {}
+        self._previous_track = None
+        self._last_playing_at = None
+        self._was_playing = False
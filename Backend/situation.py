@@ -1,43 +1,44 @@
-import google.generativeai as genai
 import os
 from dotenv import load_dotenv
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 import json
-from main import auth
-import re
+from services import get_gemini, get_spotify, spotify_with_timeout
+from analysis_cache import AnalysisCache
+from deadline import DeadlineExceeded, run_stage
+from local_classifier import classify_or_escalate, classify_situation
+from search_cache import cached_search
+from queueing import queue_tracks
+from playlists import playlist_manager
+from ranking import overfetch_limit, rank_tracks
+from response_parser import SENTIMENTS, extract_json_from_response
 
 load_dotenv()
 
-gem_api_key = os.getenv("GEM_API_KEY")
+# Parsed Gemini analyses keyed on normalized situation text
+analysis_cache = AnalysisCache()
 
-# Configure the Gemini API
-genai.configure(api_key=gem_api_key)
-
-sp = auth()
-
-def analyze_text_sentiment_and_keyword(text):
+def analyze_text_sentiment_and_keyword(text, gemini=None, timeout=None):
     prompt = (
         "Given the following situation, extract: "
-        "1. The overall sentiment (happy, sad, angry, etc.) "
+        f"1. The overall sentiment, one of: {', '.join(SENTIMENTS)} "
         "2. The main keyword/topic (e.g., love, jobs, family, etc.). "
         "Return your answer as a JSON object with 'sentiment' and 'keyword'. "
         f"Situation: {text}"
     )
     
-    # Use the correct Gemini API
-    model = genai.GenerativeModel('gemini-1.5-flash')
-    response = model.generate_content(prompt)
+    # The Gemini SDK is imported and configured on the first analysis
+    response_text = (gemini or get_gemini()).generate(prompt, timeout=timeout)
     
-    print(response.text)
-    return response.text
+    print(response_text)
+    return response_text
     
 
 def play_song_for_feeling_and_keyword(sp, feeling, keyword):
     print("Searching for a track...")
     try:
         query = f"{feeling} {keyword}"
-        results = sp.search(q=query, type='track', limit=1)
+        results = cached_search(sp, query, 'track', 1)
         tracks = results.get('tracks', {}).get('items', [])
         if not tracks:
             print(f"No tracks found for mood '{feeling}' and keyword '{keyword}'.")
@@ -50,15 +51,62 @@ def play_song_for_feeling_and_keyword(sp, feeling, keyword):
     except Exception as e:
         print(f"Error during Spotify search/playback: {e}")
 
-def extract_json_from_response(response_text):
-    # Remove code block markers and whitespace
-    cleaned = re.sub(r"^```(?:json)?|```$", "", response_text.strip(), flags=re.MULTILINE).strip()
-    return json.loads(cleaned)
+def degraded_analysis(text):
+    """
+    Best answer available without Gemini: a cached analysis, else the local
+    classifier with no confidence threshold. None when neither has one.
+    """
+    cached = analysis_cache.lookup(text)
+    if cached is not None:
+        return dict(cached, source='cache')
+    guess = classify_situation(text, threshold=0.0)
+    if guess is not None:
+        return {'sentiment': guess['sentiment'], 'keyword': guess['keyword'], 'source': 'local'}
+    return None
 
-def play_multiple_songs_for_feeling_and_keyword(sp, feeling, keyword, num_songs=5):
-    query = f"{feeling} {keyword}"
-    results = sp.search(q=query, type='track', limit=num_songs)
-    tracks = results.get('tracks', {}).get('items', [])
+def analyze_situation_cached(text, deadline=None):
+    """
+    Sentiment and keyword for a situation. Obvious text is answered by the
+    local classifier; the rest comes from the analysis cache when the same
+    (normalized) text was seen before, or from Gemini. Concurrent identical
+    submissions share one Gemini call.
+
+    Args:
+        text (str): Situation text
+        deadline (Deadline): Request deadline; when Gemini overruns its 'analyze'
+            budget the degraded_analysis() answer is returned instead
+
+    Returns:
+        dict: {'sentiment', 'keyword', 'source'} with source 'local', 'cache' or 'llm'
+
+    Raises:
+        DeadlineExceeded: Gemini timed out and there is no degraded answer
+    """
+    def escalate():
+        try:
+            return run_stage(deadline, 'analyze', lambda timeout: analysis_cache.get_or_analyze(
+                text, lambda: extract_json_from_response(analyze_text_sentiment_and_keyword(text, timeout=timeout))
+            ))
+        except DeadlineExceeded:
+            fallback = degraded_analysis(text)
+            if fallback is None:
+                raise
+            print(f"⏱️ Gemini over budget, using {fallback['source']} answer for situation")
+            return fallback
+
+    return classify_or_escalate(text, escalate)
+
+def play_multiple_songs_for_feeling_and_keyword(sp, feeling, keyword, num_songs=5, deadline=None, tracks=None):
+    # Tracks from a prewarmed candidate pool skip the search
+    if tracks is None:
+        query = f"{feeling} {keyword}"
+        limit = overfetch_limit(num_songs)
+        results = run_stage(deadline, 'search', lambda timeout: cached_search(
+            spotify_with_timeout(sp, timeout), query, 'track', limit
+        ))
+        tracks = results.get('tracks', {}).get('items', [])
+    # Over-fetched candidates, re-ordered by the stored emotion history
+    tracks = rank_tracks(tracks, num_songs)
     
     if not tracks:
         print(f"No tracks found for mood '{feeling}' and keyword '{keyword}'.")
@@ -73,46 +121,38 @@ def play_multiple_songs_for_feeling_and_keyword(sp, feeling, keyword, num_songs=
     
     # Start playback with the first track, queue the rest
     try:
-        sp.start_playback(uris=track_uris)
+        run_stage(deadline, 'playback', lambda timeout: spotify_with_timeout(sp, timeout).start_playback(uris=track_uris))
         print(f"Playing {len(tracks)} songs for '{feeling} {keyword}'")
         return tracks
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         print(f"Error during Spotify playback: {e}")
         return None
 
 def create_and_play_playlist_for_feeling_and_keyword(sp, feeling, keyword, num_songs=10):
+    """
+    Fill the managed playlist for this feeling with search results and play it.
+    The playlist is reused across calls and only the differences are written.
+    """
     query = f"{feeling} {keyword}"
-    results = sp.search(q=query, type='track', limit=num_songs)
+    results = cached_search(sp, query, 'track', num_songs)
     tracks = results.get('tracks', {}).get('items', [])
     
     if not tracks:
         print(f"No tracks found for mood '{feeling}' and keyword '{keyword}'.")
         return None
     
-    # Create a temporary playlist
-    playlist_name = f"{feeling.title()} {keyword.title()} Mix"
-    user_id = sp.current_user()['id']
-    
     try:
-        playlist = sp.user_playlist_create(
-            user=user_id,
-            name=playlist_name,
-            public=False,
-            description=f"Auto-generated playlist for {feeling} {keyword} mood"
-        )
-        
-        # Add tracks to playlist
         track_uris = [track['uri'] for track in tracks]
-        sp.playlist_add_items(playlist['id'], track_uris)
+        synced = playlist_manager.play(sp, feeling, track_uris)
+        playlist = {'id': synced['playlist_id'], 'uri': synced['uri']}
         
-        print(f"Created playlist: {playlist_name}")
-        print(f"Added {len(tracks)} songs:")
+        print(f"Updated playlist for '{feeling}': +{synced['added']} -{synced['removed']} "
+              f"in {synced['calls']} calls")
         for i, track in enumerate(tracks, 1):
             print(f"{i}. {track['name']} by {track['artists'][0]['name']}")
-        
-        # Start playing the playlist
-        sp.start_playback(context_uri=playlist['uri'])
-        print(f"Now playing: {playlist_name}")
+        print(f"Now playing: {feeling.title()} playlist")
         
         return playlist, tracks
         
@@ -120,9 +160,17 @@ def create_and_play_playlist_for_feeling_and_keyword(sp, feeling, keyword, num_s
         print(f"Error creating/playing playlist: {e}")
         return None
 
-def queue_songs_for_feeling_and_keyword(sp, feeling, keyword, num_songs=5):
+def queue_songs_for_feeling_and_keyword(sp, feeling, keyword, num_songs=5, strategy='queue'):
+    """
+    Queue search results for a mood/keyword in order.
+
+    strategy is passed to queueing.queue_tracks(); 'playlist' or 'auto' trade
+    one queue call per track for a playlist that replaces current playback.
+    Returns the queued tracks (tracks after a failure are not queued, to keep
+    the order), or None.
+    """
     query = f"{feeling} {keyword}"
-    results = sp.search(q=query, type='track', limit=num_songs)
+    results = cached_search(sp, query, 'track', num_songs)
     tracks = results.get('tracks', {}).get('items', [])
     
     if not tracks:
@@ -131,17 +179,19 @@ def queue_songs_for_feeling_and_keyword(sp, feeling, keyword, num_songs=5):
     
     print(f"Queueing {len(tracks)} songs for '{feeling} {keyword}':")
     
-    try:
-        for i, track in enumerate(tracks):
-            sp.add_to_queue(track['uri'])
-            print(f"{i+1}. {track['name']} by {track['artists'][0]['name']}")
-        
+    outcome = queue_tracks(sp, [track['uri'] for track in tracks], strategy=strategy,
+                           playlist_key=f"{feeling} queue")
+    queued = set(outcome['queued'])
+    queued_tracks = [track for track in tracks if track['uri'] in queued]
+    for i, track in enumerate(queued_tracks):
+        print(f"{i+1}. {track['name']} by {track['artists'][0]['name']}")
+    
+    if outcome['failed']:
+        print(f"Error queueing songs: {len(outcome['failed'])} failed, {len(outcome['skipped'])} skipped "
+              f"({outcome['failed'][0]['error']})")
+    else:
         print("Songs added to queue!")
-        return tracks
-        
-    except Exception as e:
-        print(f"Error queueing songs: {e}")
-        return None
+    return queued_tracks or None
 
 # Example usage:
 if __name__ == "__main__":
@@ -152,4 +202,5 @@ if __name__ == "__main__":
     keyword = parsed['keyword']
     print("========", feeling, keyword)
 
+    sp = get_spotify()
     play_song_for_feeling_and_keyword(sp, feeling, keyword)
\ No newline at end of file
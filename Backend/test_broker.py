@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Test script for EventBroker replay, overflow and coalescing (broker.py)
+"""
+
+from broker import EventBroker
+
+
+def drain(subscription):
+    events = []
+    while True:
+        event = subscription.get(timeout=0)
+        if event is None:
+            return events
+        events.append(event)
+
+
+def test_replays_events_after_last_event_id():
+    """A reconnecting client gets exactly the events it missed"""
+    broker = EventBroker(history_size=10)
+    for i in range(5):
+        broker.publish('track_update', {'i': i})
+    events = drain(broker.subscribe(last_event_id=3))
+    print(f"✅ Replayed {[event[0] for event in events]}")
+    assert [(event[0], event[2]['i']) for event in events] == [(4, 3), (5, 4)]
+
+
+def test_resync_when_history_is_gone():
+    """A client older than the history, or from before a restart, is told to resync"""
+    broker = EventBroker(history_size=3)
+    for i in range(10):
+        broker.publish('track_update', {'i': i})
+
+    behind = drain(broker.subscribe(last_event_id=2))
+    print(f"✅ Too far behind: {behind}")
+    assert [event[1:] for event in behind] == [('resync', {'reason': 'too_far_behind'})]
+
+    # History holds 8..10, so a client at 7 can still be replayed
+    assert [event[0] for event in drain(broker.subscribe(last_event_id=7))] == [8, 9, 10]
+
+    restarted = drain(broker.subscribe(last_event_id=50))
+    print(f"✅ Unknown ID: {restarted}")
+    assert [event[1:] for event in restarted] == [('resync', {'reason': 'restarted'})]
+
+
+def test_slow_subscriber_gets_one_resync():
+    """Overflowing a subscriber's queue drops its backlog for a single resync"""
+    broker = EventBroker(queue_size=3)
+    subscription = broker.subscribe()
+    for i in range(5):
+        broker.publish('track_update', {'i': i})
+    events = drain(subscription)
+    print(f"✅ After overflow: {events}")
+    assert [event[1:] for event in events][0] == ('resync', {'reason': 'overflow'})
+    # Only what arrived after the overflow follows the resync
+    assert [event[2]['i'] for event in events[1:]] == [4]
+
+    broker.publish('track_update', {'i': 5})
+    assert [event[2]['i'] for event in drain(subscription)] == [5]
+
+
+def test_coalesced_burst_delivers_latest():
+    """Events sharing a coalesce_key within the window arrive once, with the latest data"""
+    broker = EventBroker(coalesce_window=0.05)
+    subscription = broker.subscribe()
+    for i in range(20):
+        broker.publish('db_update', {'i': i}, coalesce_key='db_update')
+    event = subscription.get(timeout=1.0)
+    print(f"✅ Coalesced burst: {event}")
+    assert event is not None and event[2] == {'i': 19}
+    assert subscription.get(timeout=0.2) is None
+
+
+if __name__ == "__main__":
+    test_replays_events_after_last_event_id()
+    test_resync_when_history_is_gone()
+    test_slow_subscriber_gets_one_resync()
+    test_coalesced_burst_delivers_latest()
+    print("\n🧪 Broker tests passed!")
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Test script for TTLCache request coalescing and stale-while-revalidate (cache.py)
+"""
+
+import threading
+import time
+from cache import TTLCache
+
+
+def test_concurrent_misses_share_one_compute():
+    """Callers missing the same key at once wait on a single compute()"""
+    cache = TTLCache('test_coalesce', ttl=60)
+    calls = []
+    started = threading.Event()
+
+    def compute():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return 'value'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('key', compute)))
+               for _ in range(8)]
+    threads[0].start()
+    started.wait(1.0)
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f"✅ {len(results)} callers, {len(calls)} compute() call(s)")
+    assert len(calls) == 1
+    assert results == ['value'] * 8
+
+
+def test_failed_compute_reaches_every_waiter():
+    """An error in the shared compute() is raised to the waiters too, and nothing is cached"""
+    cache = TTLCache('test_coalesce_error', ttl=60)
+    started = threading.Event()
+
+    def compute():
+        started.set()
+        time.sleep(0.2)
+        raise RuntimeError('backend down')
+
+    errors = []
+
+    def call():
+        try:
+            cache.get_or_compute('key', compute)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    threads[0].start()
+    started.wait(1.0)
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f"✅ {len(errors)} callers saw the error")
+    assert errors == ['backend down'] * 4
+    assert cache.get('key') is None
+
+
+def test_stale_value_served_while_refreshing():
+    """An expired entry is returned at once and refreshed in the background"""
+    cache = TTLCache('test_stale', ttl=0.05, stale_ttl=5)
+    cache.set('key', 'old')
+    time.sleep(0.1)
+    assert cache.get('key') is None, "get() only returns fresh values"
+
+    refreshed = threading.Event()
+
+    def compute():
+        refreshed.set()
+        return 'new'
+
+    assert cache.get_or_compute('key', compute) == 'old'
+    assert refreshed.wait(1.0), "the refresh never ran"
+    for _ in range(50):
+        if cache.get('key') == 'new':
+            break
+        time.sleep(0.01)
+    print(f"✅ Stale value served, refreshed to {cache.get('key')!r}")
+    assert cache.get_or_compute('key', lambda: 'unused') == 'new'
+
+
+def test_past_stale_window_recomputes():
+    """Past ttl + stale_ttl the entry is gone and compute() runs inline"""
+    cache = TTLCache('test_expired', ttl=0.02, stale_ttl=0.02)
+    cache.set('key', 'old')
+    time.sleep(0.1)
+    value = cache.get_or_compute('key', lambda: 'new')
+    print(f"✅ Expired entry recomputed to {value!r}")
+    assert value == 'new'
+
+
+if __name__ == "__main__":
+    test_concurrent_misses_share_one_compute()
+    test_failed_compute_reaches_every_waiter()
+    test_stale_value_served_while_refreshing()
+    test_past_stale_window_recomputes()
+    print("\n🧪 Cache tests passed!")
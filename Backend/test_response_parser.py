@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Test script for the tolerant parsing of Gemini answers (response_parser.py)
+"""
+
+from response_parser import ResponseParseError, find_json_value, parse_analysis
+
+
+def test_repairs_malformed_answers():
+    """Fenced, single-quoted, trailing-comma and truncated answers still parse"""
+    cases = [
+        ('```json\n{"sentiment": "Joyful", "keyword": "Promotion"}\n```',
+         {'sentiment': 'happy', 'keyword': 'promotion'}),
+        ("Sure! {'mood': 'stressed', 'topic': ['work deadlines', 'exams'],}",
+         {'sentiment': 'anxious', 'keyword': 'work deadlines'}),
+        ('{"sentiment": "sad", "keyword": "break up',
+         {'sentiment': 'sad', 'keyword': 'break up'}),
+        ('{"note": "a } inside", "sentiment": "calm", "keyword": "beach"}',
+         {'sentiment': 'calm', 'keyword': 'beach'}),
+        ('[{"sentiment": "happy", "keyword": "dog"}]',
+         {'sentiment': 'happy', 'keyword': 'dog'}),
+        ('Sentiment: sad, Keyword: love',
+         {'sentiment': 'sad', 'keyword': 'love'}),
+    ]
+    for text, expected in cases:
+        result = parse_analysis(text)
+        print(f"✅ {text[:40]!r} -> {result}")
+        assert result == expected, f"{text!r}: expected {expected}, got {result}"
+
+
+def test_rejects_unusable_answers():
+    """Answers without JSON or without a keyword raise ResponseParseError"""
+    for text in ['no json here', '{"sentiment": "happy"}', '']:
+        try:
+            parse_analysis(text)
+        except ResponseParseError as e:
+            print(f"✅ {text!r} rejected: {e}")
+        else:
+            raise AssertionError(f"{text!r} should not parse")
+
+
+def test_find_json_value_skips_braces_in_strings():
+    """Braces inside string values don't end the value early"""
+    value = find_json_value('x {"a": [1, {"b": "}"}]} y')
+    print(f"✅ Found {value}")
+    assert value == '{"a": [1, {"b": "}"}]}'
+
+
+if __name__ == "__main__":
+    test_repairs_malformed_answers()
+    test_rejects_unusable_answers()
+    test_find_json_value_skips_braces_in_strings()
+    print("\n🧪 Response parser tests passed!")
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Test script for listening sessions (sessions.py): skip attribution and
+closing sessions left open at startup, on an in-process Mongo stand-in
+(mongomock)
+"""
+
+import contextlib
+import io
+from datetime import datetime, timedelta, timezone
+import main as monitor
+from sessions import Sessionizer
+
+START = datetime(2025, 1, 1, 20, 0, tzinfo=timezone.utc)
+
+
+class FakeSpotify:
+    """Returns whatever playback snapshot the test last set"""
+    def __init__(self):
+        self.playback = None
+
+    def play(self, track_id, progress_ms=0):
+        self.playback = {'item': {'id': track_id}, 'progress_ms': progress_ms,
+                         'is_playing': True, 'device': {'id': 'desk'}}
+
+    def current_playback(self):
+        return self.playback
+
+
+def make_db():
+    try:
+        import mongomock
+    except ImportError:
+        print("⚠️ mongomock is not installed, skipping session tests")
+        return None
+    return mongomock.MongoClient().db
+
+
+def test_skip_counts_against_previous_track():
+    """A skip reported once the next track plays marks the track before it"""
+    db = make_db()
+    if db is None:
+        return
+    sessionizer = Sessionizer(db)
+    sp = FakeSpotify()
+    sp.play('trackA')
+    sessionizer.observe_playback(sp.playback, START)
+    sessionizer.observe_emotion('happy', 1, START)
+    sp.play('trackB')
+    sessionizer.observe_playback(sp.playback, START + timedelta(seconds=5))
+    sessionizer.observe_emotion('skipped', -1, START + timedelta(seconds=5))
+
+    tracks = {track['track_id']: track for track in sessionizer.current()['tracks']}
+    print(f"✅ Session tracks: {tracks}")
+    assert tracks['trackA']['skipped'] and tracks['trackA']['score'] == 0
+    assert not tracks['trackB']['skipped'] and tracks['trackB']['score'] == 0
+    assert sessionizer.current()['skips'] == 1
+
+
+def test_process_tick_charges_skip_to_skipped_track():
+    """The monitor records the skip against the track that was skipped, not its successor"""
+    if make_db() is None:
+        return
+    from replay_harness import make_store
+    store = make_store()
+    monitor.mongo_manager = store
+    monitor.event_log = None
+    monitor.rollup_materializer = None
+    monitor.sessionizer = Sessionizer(store.db)
+    monitor.previous_track_id = None
+    monitor.previous_timestamp = None
+
+    sp = FakeSpotify()
+    # The monitor narrates every tick; keep the output readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        sp.play('trackA', progress_ms=4000)
+        monitor.process_tick(sp, now=START)
+        sp.play('trackB')
+        monitor.process_tick(sp, now=START + timedelta(seconds=5))
+
+    skipped = store.find_one({'track_id': 'trackA'})
+    print(f"✅ trackA skipped {skipped and skipped.get('emotion_skipped')} time(s)")
+    assert skipped is not None and skipped['emotion_skipped'] == 1
+    assert store.find_one({'track_id': 'trackB'}) is None
+    tracks = {track['track_id']: track for track in monitor.sessionizer.current()['tracks']}
+    assert tracks['trackA']['skipped'] and not tracks['trackB']['skipped']
+
+
+def test_close_stale_leaves_live_sessions_alone():
+    """Startup closes this user's leftovers and idle sessions, not another monitor's live one"""
+    db = make_db()
+    if db is None:
+        return
+    sessions = db['listening_sessions']
+    sessions.insert_many([
+        {'_id': 'mine', 'open': True, 'user_id': 'me', 'last_seen_at': START - timedelta(minutes=1)},
+        {'_id': 'live', 'open': True, 'user_id': 'other', 'last_seen_at': START - timedelta(minutes=1)},
+        {'_id': 'idle', 'open': True, 'user_id': 'other', 'last_seen_at': START - timedelta(hours=2)},
+    ])
+    closed = Sessionizer(db, user_id='me').close_stale(now=START)
+    still_open = [doc['_id'] for doc in sessions.find({'open': True})]
+    print(f"✅ Closed {closed}, still open: {still_open}")
+    assert closed == 2 and still_open == ['live']
+    assert sessions.find_one({'_id': 'idle'})['ended_at'] == (START - timedelta(hours=2)).replace(tzinfo=None)
+
+
+if __name__ == "__main__":
+    test_skip_counts_against_previous_track()
+    test_process_tick_charges_skip_to_skipped_track()
+    test_close_stale_leaves_live_sessions_alone()
+    print("\n🧪 Session tests passed!")
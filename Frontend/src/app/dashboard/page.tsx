@@ -1,6 +1,6 @@
 "use client";
 
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useRouter } from 'next/navigation';
 import Header from '@/components/Header';
 import Player from '@/components/Player';
@@ -40,6 +40,10 @@ export default function Dashboard() {
   const [selectedMood, setSelectedMood] = useState<string>('overall');
   const [rankedSongs, setRankedSongs] = useState<EnjoyedSong[]>([]);
   const [allSongs, setAllSongs] = useState<EnjoyedSong[]>([]);
+  // Latest enjoyedSongs for the SSE handler, which is created only once
+  const enjoyedSongsRef = useRef<EnjoyedSong[]>([]);
+  // Revision of the enjoyed-songs feed we last synced to (null = never)
+  const songsRevisionRef = useRef<number | null>(null);
   
   // Only keep these moods
   const searchCategories = [
@@ -53,6 +57,10 @@ export default function Dashboard() {
     { name: 'Neutral', color: 'from-gray-400 to-gray-600', key: 'neutral' },
   ];
 
+  useEffect(() => {
+    enjoyedSongsRef.current = enjoyedSongs;
+  }, [enjoyedSongs]);
+
   // Check authentication status on component mount
   useEffect(() => {
     checkAuthStatus();
@@ -74,7 +82,25 @@ export default function Dashboard() {
     eventSource.onmessage = (event) => {
       try {
         const data = JSON.parse(event.data);
-        if (data.type === 'db_update') {
+        if (data.type === 'track_update' && data.track) {
+          // Patch the changed row in place; only unknown tracks need the
+          // full (Spotify-enriched) list
+          const known = enjoyedSongsRef.current.some((song) => song.track_id === data.track.track_id);
+          if (known) {
+            setEnjoyedSongs((songs) => songs.map((song) =>
+              song.track_id === data.track.track_id
+                ? {
+                    ...song,
+                    score: data.track.score,
+                    emotion: data.track.emotion,
+                    emotion_breakdown: data.track.emotion_breakdown,
+                  }
+                : song
+            ));
+          } else {
+            fetchEnjoyedSongs();
+          }
+        } else if (data.type === 'db_update' || data.type === 'resync') {
           console.log('Database updated, refreshing enjoyed songs...');
           fetchEnjoyedSongs();
         }
@@ -83,9 +109,10 @@ export default function Dashboard() {
       }
     };
 
+    // The browser reconnects on its own and sends Last-Event-ID, so the
+    // server can replay anything missed while disconnected
     eventSource.onerror = (error) => {
       console.error('SSE connection error:', error);
-      eventSource.close();
     };
 
     // Cleanup on unmount
@@ -149,15 +176,36 @@ export default function Dashboard() {
 
   const fetchEnjoyedSongs = async () => {
     try {
-      setIsLoadingSongs(true);
-      const response = await fetch('http://localhost:5001/api/enjoyed-songs');
+      // After the first load, only ask for tracks changed since our revision
+      const since = songsRevisionRef.current;
+      if (since === null) {
+        setIsLoadingSongs(true);
+      }
+      const url = since === null
+        ? 'http://localhost:5001/api/enjoyed-songs'
+        : `http://localhost:5001/api/enjoyed-songs?since=${since}`;
+      const response = await fetch(url);
       const data = await response.json();
       
       console.log('Fetched enjoyed songs data:', data); // Debug log
       
       if (data.songs) {
-        console.log('Setting enjoyed songs:', data.songs); // Debug log
-        setEnjoyedSongs(data.songs);
+        if (data.mode === 'delta') {
+          // Merge changed tracks into the current list
+          const changed = new Map<string, EnjoyedSong>(data.songs.map((song: EnjoyedSong) => [song.track_id, song]));
+          setEnjoyedSongs((songs) => {
+            const merged = songs.map((song) => changed.get(song.track_id) ?? song);
+            const known = new Set(songs.map((song) => song.track_id));
+            const added = data.songs.filter((song: EnjoyedSong) => !known.has(song.track_id));
+            return [...merged, ...added];
+          });
+        } else {
+          console.log('Setting enjoyed songs:', data.songs); // Debug log
+          setEnjoyedSongs(data.songs);
+        }
+      }
+      if (typeof data.revision === 'number') {
+        songsRevisionRef.current = data.revision;
       }
     } catch (error) {
       console.error('Error fetching enjoyed songs:', error);